@@ -0,0 +1,312 @@
+"""
+A local stand-in for the parts of the Slack Web API the bot uses: channels.list, channels.info,
+users.list, users.info, users.getPresence and chat.postMessage. Responses can be delayed by a fixed
+latency plus random jitter, methods can be rate limited (answering HTTP 429 with a Retry-After
+header), and every request is counted. Point the bot at it with the slack_api_url option, e.g.
+
+    python -m benchmarks.fake_slack_server --port 8900 --users 1000 --latency 0.05 \\
+        --rate-limit users.getPresence=50
+
+and slack_api_url: http://localhost:8900/api/ in the bot's configuration. The request counts are
+served as JSON from /stats.
+"""
+import argparse
+import collections
+import json
+import math
+import random
+import threading
+import time
+
+from future.moves.http.server import BaseHTTPRequestHandler, HTTPServer
+from future.moves.socketserver import ThreadingMixIn
+from future.moves.urllib.parse import parse_qsl, urlparse
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class FakeSlack(object):
+    """
+    The state of the fake workspace: a channel whose members follow member_script, the presence of
+    each user, and the request counts. member_script is a list of member id lists; each
+    channels.info request moves on to the next list, and the last list is kept once reached.
+    """
+    def __init__(self, member_script, channel_name="general", channel_id="C0000001",
+            num_channels=1, active_fraction=0.5, latency=0.0, jitter=0.0, rate_limits=None,
+            rate_limit_window=1.0, seed=0):
+        self.lock = threading.Lock()
+        self.member_script = [list(members) for members in member_script]
+        self.script_position = 0
+        self.channel_name = channel_name
+        self.channel_id = channel_id
+        # The other channels of the workspace only show up in channels.list
+        self.channels = [{'id': channel_id, 'name': channel_name}] + [
+            {'id': 'C{:07d}'.format(i + 1000000), 'name': 'channel-{}'.format(i)}
+            for i in range(num_channels - 1)]
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = dict(rate_limits or {})
+        self.rate_limit_window = rate_limit_window
+        self.windows = {}
+        self.random = random.Random(seed)
+        self.presence = {}
+        for members in self.member_script:
+            for user_id in members:
+                if user_id not in self.presence:
+                    self.presence[user_id] = self.random.random() < active_fraction
+        self.counts = collections.Counter()
+        self.throttled = collections.Counter()
+        self.messages = []
+        self.handlers = {
+            'channels.list': self.channels_list,
+            'channels.info': self.channels_info,
+            'users.list': self.users_list,
+            'users.info': self.users_info,
+            'users.getPresence': self.users_get_presence,
+            'chat.postMessage': self.chat_post_message
+        }
+
+    def set_members(self, members):
+        with self.lock:
+            self.member_script = [list(members)]
+            self.script_position = 0
+            for user_id in members:
+                self.presence.setdefault(user_id, False)
+
+    def set_presence(self, user_id, active):
+        with self.lock:
+            self.presence[user_id] = active
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': dict(self.counts),
+                'throttled': dict(self.throttled),
+                'messages': len(self.messages)
+            }
+
+    def delay(self):
+        with self.lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter > 0 else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def retry_after(self, method):
+        """
+        Counts a request for the given method against its rate limit. Returns the number of seconds
+        the caller should wait if the method is over its limit, otherwise None.
+        """
+        limit = self.rate_limits.get(method)
+        if limit is None:
+            return None
+        now = time.time()
+        with self.lock:
+            window_start, count = self.windows.get(method, (now, 0))
+            if now - window_start >= self.rate_limit_window:
+                window_start, count = now, 0
+            if count >= limit:
+                self.throttled[method] += 1
+                return max(1, int(math.ceil(window_start + self.rate_limit_window - now)))
+            self.windows[method] = (window_start, count + 1)
+            return None
+
+    def handle(self, method, params):
+        """
+        Returns the HTTP status, headers and JSON body of the response to an API request.
+        """
+        with self.lock:
+            self.counts[method] += 1
+        self.delay()
+        retry_after = self.retry_after(method)
+        if retry_after is not None:
+            return 429, {'Retry-After': str(retry_after)}, {'ok': False, 'error': 'ratelimited'}
+        handler = self.handlers.get(method)
+        if handler is None:
+            return 200, {}, {'ok': False, 'error': 'unknown_method'}
+        return 200, {}, handler(params)
+
+    def current_members(self, advance=False):
+        with self.lock:
+            members = self.member_script[self.script_position]
+            if advance and self.script_position < len(self.member_script) - 1:
+                self.script_position += 1
+            return list(members)
+
+    def user_json(self, user_id):
+        return {
+            'id': user_id,
+            'name': 'user{}'.format(user_id.lower()),
+            'profile': {
+                'first_name': 'User',
+                'last_name': user_id
+            }
+        }
+
+    def channels_list(self, params):
+        limit = int(params.get('limit') or 100)
+        start = int(params.get('cursor') or 0)
+        next_start = start + limit
+        return {
+            'ok': True,
+            'channels': [dict(channel) for channel in self.channels[start:next_start]],
+            'response_metadata': {
+                'next_cursor': str(next_start) if next_start < len(self.channels) else ''
+            }
+        }
+
+    def channels_info(self, params):
+        if params.get('channel') != self.channel_id:
+            return {'ok': False, 'error': 'channel_not_found'}
+        return {
+            'ok': True,
+            'channel': {
+                'id': self.channel_id,
+                'name': self.channel_name,
+                'members': self.current_members(advance=True)
+            }
+        }
+
+    def users_list(self, params):
+        with self.lock:
+            user_ids = sorted(self.presence.keys())
+        limit = int(params.get('limit') or 200)
+        start = int(params.get('cursor') or 0)
+        next_start = start + limit
+        return {
+            'ok': True,
+            'members': [self.user_json(user_id) for user_id in user_ids[start:next_start]],
+            'response_metadata': {
+                'next_cursor': str(next_start) if next_start < len(user_ids) else ''
+            }
+        }
+
+    def users_info(self, params):
+        user_id = params.get('user')
+        with self.lock:
+            known = user_id in self.presence
+        if not known:
+            return {'ok': False, 'error': 'user_not_found'}
+        return {'ok': True, 'user': self.user_json(user_id)}
+
+    def users_get_presence(self, params):
+        with self.lock:
+            active = self.presence.get(params.get('user'))
+        if active is None:
+            return {'ok': False, 'error': 'user_not_found'}
+        return {'ok': True, 'presence': 'active' if active else 'away'}
+
+    def chat_post_message(self, params):
+        with self.lock:
+            self.messages.append(params.get('text'))
+        return {'ok': True, 'channel': params.get('channel'), 'ts': str(time.time())}
+
+class FakeSlackRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, headers, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def dispatch(self, params):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self.respond(200, {}, self.server.slack.stats())
+        elif path.startswith('/api/'):
+            self.respond(*self.server.slack.handle(path[len('/api/'):], params))
+        else:
+            self.respond(404, {}, {'ok': False, 'error': 'not_found'})
+
+    def do_GET(self):
+        self.dispatch(dict(parse_qsl(urlparse(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        params = dict(parse_qsl(urlparse(self.path).query))
+        params.update(parse_qsl(body))
+        self.dispatch(params)
+
+class FakeSlackServer(object):
+    """
+    Serves a FakeSlack over HTTP on a background thread. A port of 0 picks a free port.
+    """
+    def __init__(self, slack, host="127.0.0.1", port=0):
+        self.slack = slack
+        self.httpd = ThreadingHTTPServer((host, port), FakeSlackRequestHandler)
+        self.httpd.slack = slack
+        self.thread = None
+
+    @property
+    def api_url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}/api/".format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+def synthetic_members(num_users):
+    return ['U{:07d}'.format(i) for i in range(num_users)]
+
+def parse_rate_limit(value):
+    method, limit = value.split('=')
+    return method, int(limit)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake of the Slack Web API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--users", type=int, default=100,
+            help="Number of synthetic channel members")
+    parser.add_argument("--script",
+            help="JSON file holding a list of member id lists, served in turn by channels.info")
+    parser.add_argument("--channel-name", default="general")
+    parser.add_argument("--channels", type=int, default=1,
+            help="Number of channels in the workspace")
+    parser.add_argument("--active-fraction", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.0,
+            help="Seconds to delay each response by")
+    parser.add_argument("--jitter", type=float, default=0.0,
+            help="Maximum extra seconds added at random to each delay")
+    parser.add_argument("--rate-limit", type=parse_rate_limit, action="append", default=[],
+            metavar="METHOD=LIMIT", help="Requests allowed per method per rate limit window")
+    parser.add_argument("--rate-limit-window", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.script:
+        with open(args.script) as f:
+            member_script = json.load(f)
+    else:
+        member_script = [synthetic_members(args.users)]
+    slack = FakeSlack(member_script, channel_name=args.channel_name, num_channels=args.channels,
+            active_fraction=args.active_fraction, latency=args.latency, jitter=args.jitter,
+            rate_limits=dict(args.rate_limit), rate_limit_window=args.rate_limit_window,
+            seed=args.seed)
+    server = FakeSlackServer(slack, args.host, args.port)
+    print("Serving the fake Slack API at {}".format(server.api_url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(slack.stats()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import collections
+import random
+import threading
+import time
+
+class CallCounter(object):
+    """
+    Counts calls by name, safely across threads.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def record(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts = collections.Counter()
+
+class FakeApiClient(object):
+    """
+    Stands in for FlexbotApiClient with a synthetic channel of num_users members, of which about
+    active_fraction are active. Each call sleeps for latency seconds, plus up to jitter seconds, to
+    imitate a round trip to Slack.
+    """
+    def __init__(self, configuration, num_users, active_fraction=0.5, latency=0.0, jitter=0.0,
+            seed=0):
+        self.configuration = configuration
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = CallCounter()
+        self.messages = []
+        rng = random.Random(seed)
+        self.members = ['U{:07d}'.format(i) for i in range(num_users)]
+        self.presence = dict((user_id, rng.random() < active_fraction)
+                for user_id in self.members)
+        self.jitter_random = random.Random(seed)
+        self.jitter_lock = threading.Lock()
+
+    def call(self, name):
+        self.calls.record(name)
+        delay = self.latency
+        if self.jitter > 0:
+            with self.jitter_lock:
+                delay += self.jitter_random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def user_json(self, user_id):
+        return {
+            'id': user_id,
+            'name': 'user{}'.format(user_id.lower()),
+            'profile': {
+                'first_name': 'User',
+                'last_name': user_id
+            }
+        }
+
+    def channel_id(self):
+        return 'C0000001'
+
+    def bot_name(self):
+        return self.configuration.bot_name()
+
+    def post_flex_message(self, message):
+        self.call('chat.postMessage')
+        self.messages.append(message)
+
+    def get_members(self):
+        self.call('channels.info')
+        return list(self.members)
+
+    def get_users(self, page_size=200):
+        users = []
+        for start in range(0, len(self.members), page_size):
+            self.call('users.list')
+            users.extend(self.user_json(user_id)
+                    for user_id in self.members[start:start + page_size])
+        return users
+
+    def get_user_info(self, user_id):
+        self.call('users.info')
+        return self.user_json(user_id)
+
+    def is_active(self, user_id):
+        self.call('users.getPresence')
+        return self.presence[user_id]
+
+class CountingLogger(object):
+    """
+    Wraps a workout logger, counting the calls made to each of its methods.
+    """
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self.calls = CallCounter()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.wrapped, name)
+        if not callable(attribute):
+            return attribute
+        def counted(*args, **kwargs):
+            self.calls.record(name)
+            return attribute(*args, **kwargs)
+        return counted
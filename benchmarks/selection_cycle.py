@@ -0,0 +1,220 @@
+"""
+Measures how the selection cycle scales with the size of the channel.
+
+For every combination of channel size and logger, builds a synthetic channel behind a fake Slack
+API client and times UserManager setup, Bot.select_exercise_and_start_time, Bot.assign_exercise and
+a whole ChannelRunner cycle. Prints the latency percentiles of each phase along with the number of API and
+logger calls, and optionally saves everything as JSON so that runs can be compared, e.g.
+
+    python -m benchmarks.selection_cycle --users 100 1000 10000 --output before.json
+
+SqliteDatabaseLogger stands in for PostgresDatabaseLogger, so that no database server is needed.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from flexbot import loggers
+from flexbot.bot import Bot
+from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot.exercise import Exercise
+from flexbot.manager import UserManager
+from flexbot.runner import ChannelRunner
+from flexbot.scheduler import TimerScheduler
+from flexbot.util import NoEligibleUsersException
+
+from .fakes import CountingLogger, FakeApiClient
+
+LOGGERS = ['InMemoryLogger', 'CsvLogger', 'SqliteDatabaseLogger']
+PERCENTILES = [50, 90, 99]
+
+exercises = [
+    Exercise('pushups', 15, 20, 'reps', ''),
+    Exercise('planks', 40, 60, 'seconds', ''),
+    Exercise('wall_sit', 40, 60, 'seconds', '')
+]
+
+def percentile(sorted_samples, p):
+    """
+    Returns the p-th percentile of the samples, using the nearest-rank method.
+    """
+    if len(sorted_samples) == 0:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(sorted_samples))))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+def summarize(samples):
+    ordered = sorted(samples)
+    summary = {
+        'samples': len(ordered),
+        'mean': sum(ordered) / len(ordered) if ordered else None,
+        'max': ordered[-1] if ordered else None
+    }
+    for p in PERCENTILES:
+        summary['p{}'.format(p)] = percentile(ordered, p)
+    return summary
+
+def get_configuration(args):
+    return InMemoryConfigurationProvider({
+        'channel_name': 'benchmark',
+        'bot_name': 'flexbot',
+        'office_hours': {
+            'on': False,
+            'begin': 9,
+            'end': 17
+        },
+        'callouts': {
+            'time_between': {
+                'min_time': 17,
+                'max_time': 23
+            },
+            'num_people': args.num_people,
+            'group_callout_chance': 0
+        },
+        'user_exercise_limit': args.exercise_limit,
+        'enable_acknowledgment': False,
+        'presence': {
+            'max_workers': args.max_workers
+        },
+        'selection_engine': args.engine,
+        'random_seed': args.seed
+    }, exercises)
+
+def make_logger(name, directory):
+    if name == 'InMemoryLogger':
+        return loggers.InMemoryLogger()
+    elif name == 'CsvLogger':
+        # CsvLogger writes to the working directory
+        os.chdir(directory)
+        return loggers.CsvLogger()
+    elif name == 'SqliteDatabaseLogger':
+        return loggers.SqliteDatabaseLogger(os.path.join(directory, 'flexecution.db'))
+    raise Exception("Unsupported logger type {}".format(name))
+
+class Timer(object):
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, phase, func, *args):
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.samples.setdefault(phase, []).append(time.time() - start)
+
+def run_cycle(runner):
+    """
+    Runs an announcement and, unless there was no one to announce it to, its assignment, without
+    waiting for the timers in between.
+    """
+    runner.run_guarded(runner.step)
+    callback_and_args = runner.timer.args
+    if callback_and_args[0] == runner.assign:
+        runner.run_guarded(*callback_and_args)
+
+def run(args, num_users, logger_name):
+    configuration = get_configuration(args)
+    api = FakeApiClient(configuration, num_users, active_fraction=args.active_fraction,
+            latency=args.latency, jitter=args.jitter, seed=args.seed)
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    timer = Timer()
+    exhausted = 0
+    try:
+        workout_logger = CountingLogger(make_logger(logger_name, directory))
+        user_manager = timer.time('setup', UserManager, api, configuration, workout_logger)
+        bot = Bot(api, configuration, user_manager)
+        # The scheduler is never started: the cycles are run by hand and their timers dropped
+        runner = ChannelRunner('benchmark', configuration, api, user_manager, bot,
+                TimerScheduler(max_workers=1))
+        # Time the cycles of a day in progress, rather than the start of the day
+        runner.was_office_hours = True
+        for _ in range(args.iterations):
+            try:
+                exercise, reps, _, active_users = timer.time('select_exercise_and_start_time',
+                        bot.select_exercise_and_start_time)
+                timer.time('assign_exercise', bot.assign_exercise, exercise, reps, active_users)
+            except NoEligibleUsersException:
+                exhausted += 1
+        for _ in range(args.iterations):
+            # The runner handles NoEligibleUsersException itself
+            timer.time('runner_cycle', run_cycle, runner)
+        workout_logger.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    return {
+        'users': num_users,
+        'logger': logger_name,
+        'phases': dict((phase, summarize(samples)) for phase, samples in timer.samples.items()),
+        'api_calls': api.calls.snapshot(),
+        'logger_calls': workout_logger.calls.snapshot(),
+        'exhausted': exhausted
+    }
+
+def format_seconds(seconds):
+    return "-" if seconds is None else "{:.2f}ms".format(seconds * 1000)
+
+def print_result(result):
+    print("{} users, {}".format(result['users'], result['logger']))
+    for phase in sorted(result['phases']):
+        summary = result['phases'][phase]
+        print("  {:<32} {}".format(phase, "  ".join("p{}={}".format(p,
+            format_seconds(summary['p{}'.format(p)])) for p in PERCENTILES)))
+    print("  api calls:    {}".format(result['api_calls']))
+    print("  logger calls: {}".format(result['logger_calls']))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the selection cycle")
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 10000],
+            help="Channel sizes to benchmark")
+    parser.add_argument("--loggers", nargs="+", default=LOGGERS, choices=LOGGERS,
+            help="Workout loggers to benchmark")
+    parser.add_argument("--iterations", type=int, default=20,
+            help="Number of selection cycles to time per phase")
+    parser.add_argument("--latency", type=float, default=0.0,
+            help="Seconds each fake Slack API call takes")
+    parser.add_argument("--jitter", type=float, default=0.0,
+            help="Maximum extra seconds added at random to each fake Slack API call")
+    parser.add_argument("--active-fraction", type=float, default=0.5,
+            help="Fraction of the channel members which are active")
+    parser.add_argument("--num-people", type=int, default=3, help="Winners per callout")
+    parser.add_argument("--exercise-limit", type=int, default=3,
+            help="Exercises per user per day")
+    parser.add_argument("--max-workers", type=int, default=10,
+            help="Presence lookups in flight at once")
+    parser.add_argument("--engine", default="python", help="Selection engine (python or numpy)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("-o", "--output", help="Path to save the results to as JSON")
+    args = parser.parse_args(argv)
+
+    # Per-user log lines would dominate the timings
+    logging.disable(logging.CRITICAL)
+    try:
+        results = []
+        for num_users in args.users:
+            for logger_name in args.loggers:
+                result = run(args, num_users, logger_name)
+                print_result(result)
+                results.append(result)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'started': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'arguments': vars(args),
+                'results': results
+            }, f, indent=2, sort_keys=True)
+    return results
+
+if __name__ == "__main__":
+    main()
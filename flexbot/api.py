@@ -2,24 +2,28 @@ import logging
 
 from slacker import Slacker
 
+from .channels import ChannelDirectory
+from .transport import SlackSession
+
 class FlexbotApiClient(Slacker):
-    def __init__(self, configuration, **kwargs):
+    def __init__(self, configuration, channel_directory=None, **kwargs):
+        # Share one pooled session between all of the API methods
+        kwargs.setdefault('session', SlackSession())
+        # The session already retries rate limited requests, so slacker mustn't retry them again
+        kwargs['rate_limit_retries'] = 0
         super(FlexbotApiClient, self).__init__(**kwargs)
         self.logger = logging.getLogger(__name__)
         self.configuration = configuration
-        self.current_channel_name = None
-        self.current_channel_id = self.channel_id()
+        self.session = kwargs.get('session')
+        if channel_directory is None:
+            channel_directory = ChannelDirectory(self, ttl=configuration.channel_directory_ttl(),
+                    page_size=configuration.channel_directory_page_size())
+        self.channel_directory = channel_directory
+        # Load the directory up front rather than on the first message
+        self.channel_id()
 
     def channel_id(self):
-        if self.configuration.channel_name() == self.current_channel_name:
-            return self.current_channel_id
-        else:
-            self.current_channel_name = self.configuration.channel_name()
-            channels = self.channels.list()
-            for channel in channels.body['channels']:
-                if channel['name'] == self.configuration.channel_name():
-                    return channel['id']
-            return None
+        return self.channel_directory.channel_id(self.configuration.channel_name())
 
     def bot_name(self):
         return self.configuration.bot_name()
@@ -33,9 +37,38 @@ class FlexbotApiClient(Slacker):
         response = self.channels.info(self.channel_id()).body
         return response['channel']['members']
 
+    def get_users(self, page_size=200):
+        """
+        Returns every user in the workspace, following the pagination of users.list.
+        """
+        users = []
+        cursor = None
+        while True:
+            response = self.users.get('users.list', params={'limit': page_size, 'cursor': cursor}).body
+            users.extend(response['members'])
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return users
+
     def get_user_info(self, user_id):
         return self.users.info(user_id).body['user']
 
+    def throttle_stats(self):
+        """
+        Returns the rate limiting metrics of the session, per API method.
+        """
+        if self.session is None or not hasattr(self.session, 'throttle_stats'):
+            return {}
+        return self.session.throttle_stats()
+
+    def latency_stats(self):
+        """
+        Returns the latency histogram of the requests of each API method.
+        """
+        if self.session is None or not hasattr(self.session, 'latency_stats'):
+            return {}
+        return self.session.latency_stats()
+
     def is_active(self, user_id):
         response =  self.users.get_presence(user_id).body
         return response["presence"] == "active"
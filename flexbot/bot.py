@@ -2,6 +2,7 @@ import datetime
 import logging
 import random
 
+from .sampling import WeightedSampler
 from .util import NoEligibleUsersException
 
 # Configuration values to be set in setConfiguration
@@ -11,22 +12,31 @@ class Bot(object):
         self.config = config
         self.user_manager = user_manager
         self.logger = logging.getLogger(__name__)
+        # Seeding the generator makes the exercises and winners reproducible
+        self.random = random.Random(self.config.random_seed())
+        # The user manager keeps the engine's users in step with the channel
+        self.engine = user_manager.engine
 
 
     def select_exercise_and_start_time(self):
         """
-        Selects and announces to the channel an exercise and start time.
+        Selects and announces to the channel an exercise and start time. Returns the exercise, the
+        reps, the minutes until the exercise and the active users, to be passed to assign_exercise.
         """
-        eligible_users = self.user_manager.get_eligible_users()
-        return self._select_exercise_and_start_time(eligible_users)
+        snapshot = self.user_manager.get_day_snapshot()
+        active_users = self.user_manager.fetch_active_users()
+        eligible_users = self.user_manager.get_eligible_users(snapshot, active_users)
+        exercise, exercise_reps, minute_interval = \
+                self._select_exercise_and_start_time(eligible_users, snapshot)
+        return exercise, exercise_reps, minute_interval, active_users
 
 
-    def _select_exercise_and_start_time(self, eligible_users):
-        minute_interval = self.select_next_time_interval(eligible_users)
+    def _select_exercise_and_start_time(self, eligible_users, snapshot=None):
+        minute_interval = self.select_next_time_interval(eligible_users, snapshot)
         self.logger.debug("Selected minute interval: %d", minute_interval)
         exercise = self.select_exercise()
         self.logger.debug("Selected exercise: %s", exercise.name)
-        exercise_reps = random.randrange(exercise.min_reps, exercise.max_reps+1)
+        exercise_reps = self.random.randrange(exercise.min_reps, exercise.max_reps+1)
         self.logger.debug("Selected exercise reps: %s", exercise_reps)
 
         # Announcement String of next lottery time
@@ -43,29 +53,36 @@ class Bot(object):
         Selects the next exercise
         """
         exercises = self.config.exercises()
-        idx = random.randrange(0, len(exercises))
+        idx = self.random.randrange(0, len(exercises))
         return exercises[idx]
 
 
-    def select_next_time_interval(self, eligible_users):
+    def select_next_time_interval(self, eligible_users, snapshot=None):
         """
         Selects the next time interval
         """
         if self.config.office_hours_on():
-            return self.select_next_time_interval_office_hours(eligible_users)
+            return self.select_next_time_interval_office_hours(eligible_users, snapshot)
         else:
-            return random.randint(self.config.min_time_between_callouts(),
+            return self.random.randint(self.config.min_time_between_callouts(),
                 self.config.max_time_between_callouts())
 
 
-    def select_next_time_interval_office_hours(self, eligible_users):
+    def select_next_time_interval_office_hours(self, eligible_users, snapshot=None):
+        if snapshot is None:
+            snapshot = self.user_manager.get_day_snapshot()
+
         # How much time is there left in the day
         time_left = datetime.datetime.now().replace(hour=self.config.office_hours_end(), minute=0,
                 second=0, microsecond=0) - datetime.datetime.now()
         self.logger.debug("time_left (min): %d", time_left.seconds / 60)
 
         # How many exercises remain to be done
-        exercise_count = sum([self.user_manager.total_exercises_for_user(u) for u in eligible_users])
+        if self.engine is not None:
+            exercise_count = self.engine.total_exercises(eligible_users, snapshot)
+        else:
+            exercise_count = sum([self.user_manager.total_exercises_for_user(u, snapshot)
+                for u in eligible_users])
         self.logger.debug("exercise_count: %d", exercise_count)
 
         max_exercises = self.config.user_exercise_limit() * len(eligible_users)
@@ -95,33 +112,31 @@ class Bot(object):
                        int(avg_minutes_per_exercise)))
 
 
-    def assign_exercise(self, exercise, exercise_reps):
+    def assign_exercise(self, exercise, exercise_reps, active_users=None):
         """
         Selects a set of users or the channel to do the already-selected exercise, and returns the
-        list of winners.
+        list of winners. The winners are drawn from active_users, the users who were active when the
+        exercise was announced, or from the users active now if it is not given.
         """
         winner_announcement = "{} {} {} RIGHT NOW".format(exercise_reps, exercise.units, exercise.name)
 
-        eligible_users = self.user_manager.get_eligible_users()
+        snapshot = self.user_manager.get_day_snapshot()
+        eligible_users = self.user_manager.get_eligible_users(snapshot, active_users)
         winners = []
 
         # EVERYBODY
-        if random.random() < self.config.group_callout_chance():
+        if self.random.random() < self.config.group_callout_chance():
             winners = eligible_users
             winner_announcement += "<!channel>!"
 
         else:
             people_in_callout = self.num_people_in_current_callout(eligible_users)
-            for i in range(people_in_callout):
-                try:
-                    winners.append(self.select_user(eligible_users, exercise))
-                except:
-                    break
+            winners = self.select_users(eligible_users, exercise, people_in_callout, snapshot)
 
             if len(winners) == 0:
                 raise NoEligibleUsersException()
 
-            for user in winners:
+            for i, user in enumerate(winners):
                 winner_announcement += str(self.user_manager.get_mention(user))
                 if i == len(winners) - 2:
                     winner_announcement += ", and "
@@ -130,8 +145,7 @@ class Bot(object):
                 else:
                     winner_announcement += ", "
 
-        for user in winners:
-            self.user_manager.mark_winner(user, exercise, exercise_reps)
+        self.user_manager.mark_winners(winners, exercise, exercise_reps)
 
         # Announce the user
         self.api.post_flex_message(winner_announcement)
@@ -139,48 +153,71 @@ class Bot(object):
         return winners
 
 
-    def select_user(self, eligible_users, exercise):
+    def select_user(self, eligible_users, exercise, snapshot=None):
         """
         Selects an active user from the list of online users to complete the provided exercise
         """
-        prime_users = [u for u in eligible_users if not self.user_manager.user_has_done_exercise(u, exercise)]
-        # If there are users which haven't done the current exercise, assign the exercise to one of
-        # them. Otherwise, assign it to any user.
-        if len(prime_users) > 0:
-            return self._select_user(exercise, prime_users)
-        else:
-            return self._select_user(exercise, eligible_users)
+        winners = self.select_users(eligible_users, exercise, 1, snapshot)
+        if len(winners) == 0:
+            raise NoEligibleUsersException()
+        return winners[0]
 
 
-    def _select_user(self, exercise, user_list):
+    def select_users(self, eligible_users, exercise, count, snapshot=None):
         """
-        Chooses a user from the current list of eligible users.
+        Selects up to count distinct users from the list of online users to complete the provided
+        exercise. Each user's chance of being selected is proportional to the number of exercises
+        they have left today.
         """
-        lottery_list = self.get_lottery_list(user_list)
-        return lottery_list[random.randint(0, len(lottery_list) - 1)]
+        if snapshot is None:
+            snapshot = self.user_manager.get_day_snapshot()
+        # The users come from iterating dicts keyed by user id, whose order varies between runs
+        # under hash randomization; sort them so that a given random_seed picks the same winners
+        eligible_users = sorted(eligible_users)
+        if self.engine is not None:
+            return self.engine.select_users(eligible_users, exercise, count, snapshot, self.random)
+        weights = self.get_lottery_weights(eligible_users, snapshot)
+        prime_users = []
+        other_users = []
+        for user in eligible_users:
+            if self.user_manager.user_has_done_exercise(user, exercise, snapshot):
+                other_users.append(user)
+            else:
+                prime_users.append(user)
+        # Assign the exercise to users which haven't done it yet first, and only then to any user
+        winners = WeightedSampler(prime_users, [weights[u] for u in prime_users]) \
+                .sample(self.random, count)
+        if len(winners) < count:
+            winners.extend(WeightedSampler(other_users, [weights[u] for u in other_users])
+                    .sample(self.random, count - len(winners)))
+        return winners
 
 
-    def get_lottery_list(self, user_list):
-        lottery_list = []
+    def get_lottery_weights(self, user_list, snapshot=None):
+        """
+        Returns a hash from user id to the number of exercises the user has left today.
+        """
+        if snapshot is None:
+            snapshot = self.user_manager.get_day_snapshot()
+        weights = {}
         for user in user_list:
-            exercises_done = self.user_manager.total_exercises_for_user(user)
-            exercises_remaining = self.config.user_exercise_limit() - exercises_done
-            lottery_list.extend([user] * exercises_remaining)
-        return lottery_list
+            exercises_done = self.user_manager.total_exercises_for_user(user, snapshot)
+            weights[user] = self.config.user_exercise_limit() - exercises_done
+        return weights
 
 
     def num_people_in_current_callout(self, active_users):
         return min(self.config.num_people_per_callout(), len(active_users))
 
 
-    def is_office_hours(self):
+    def is_office_hours(self, now=None):
         """
         Does the current time frame fall with the configured office hours?
         """
         if not self.config.office_hours_on():
             self.logger.debug("office hours disabled")
             return True
-        now = datetime.datetime.now()
+        now = now or datetime.datetime.now()
         now_time = now.time()
         is_weekday = now.weekday() < 5 # Monday - 0, ..., Sunday - 6
         office_hours_start = datetime.time(self.config.office_hours_begin())
@@ -191,3 +228,17 @@ class Bot(object):
         else:
             self.logger.debug("out office hours")
             return False
+
+    def seconds_until_office_hours(self, now=None):
+        """
+        Returns the number of seconds until office hours next begin, or 0 during office hours.
+        """
+        now = now or datetime.datetime.now()
+        if self.is_office_hours(now):
+            return 0
+        office_hours_start = datetime.time(self.config.office_hours_begin())
+        for days in range(8):
+            start = datetime.datetime.combine(now.date() + datetime.timedelta(days=days),
+                    office_hours_start)
+            if start > now and start.weekday() < 5:
+                return (start - now).total_seconds()
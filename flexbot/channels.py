@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+class ChannelDirectory(object):
+    """
+    The workspace's channels, indexed by name and by id. The directory is read by paging through
+    channels.list, page_size channels at a time, and is read again once it is older than ttl
+    seconds: in the background if start() has been called, otherwise on the next lookup. A lookup
+    of an unknown name reads the directory again, at most once every miss_refresh_interval
+    seconds, in case the channel was created since.
+    """
+    def __init__(self, api, ttl=3600, page_size=1000, miss_refresh_interval=60):
+        self.logger = logging.getLogger(__name__)
+        self.api = api
+        self.ttl = ttl
+        self.page_size = page_size
+        self.miss_refresh_interval = miss_refresh_interval
+        self.by_name = {}
+        self.by_id = {}
+        self.loaded_at = None
+        self.refresh_lock = threading.Lock()
+        self.refresher = None
+        self.stopped = threading.Event()
+
+    def fetch_channels(self):
+        channels = []
+        cursor = None
+        while True:
+            response = self.api.channels.get('channels.list', params={
+                'limit': self.page_size,
+                'cursor': cursor,
+                'exclude_archived': 'true',
+                'exclude_members': 'true'
+            }).body
+            channels.extend(response['channels'])
+            cursor = response.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return channels
+
+    def refresh(self):
+        """
+        Reads the whole directory from Slack and swaps it in for the cached one.
+        """
+        with self.refresh_lock:
+            channels = self.fetch_channels()
+            by_name = {}
+            by_id = {}
+            for channel in channels:
+                by_name[channel['name']] = channel['id']
+                by_id[channel['id']] = channel['name']
+            # Readers see either the old indexes or the new ones, never a mix
+            self.by_name, self.by_id = by_name, by_id
+            self.loaded_at = time.time()
+            self.logger.debug("Loaded %d channels", len(channels))
+
+    def age(self):
+        if self.loaded_at is None:
+            return None
+        return time.time() - self.loaded_at
+
+    def ensure_loaded(self):
+        age = self.age()
+        if age is None or (age >= self.ttl and self.refresher is None):
+            self.refresh()
+
+    def channel_id(self, name):
+        """
+        Returns the id of the channel with the given name, or None if there is no such channel.
+        """
+        self.ensure_loaded()
+        channel_id = self.by_name.get(name)
+        if channel_id is None and self.age() >= self.miss_refresh_interval:
+            self.refresh()
+            channel_id = self.by_name.get(name)
+        return channel_id
+
+    def channel_name(self, channel_id):
+        """
+        Returns the name of the channel with the given id, or None if there is no such channel.
+        """
+        self.ensure_loaded()
+        return self.by_id.get(channel_id)
+
+    def refresh_loop(self):
+        while not self.stopped.wait(self.ttl):
+            try:
+                self.refresh()
+            except Exception:
+                self.logger.exception("Failed to refresh the channel directory")
+
+    def start(self):
+        """
+        Refreshes the directory every ttl seconds on a background thread.
+        """
+        if self.refresher is not None:
+            return
+        self.refresher = threading.Thread(target=self.refresh_loop)
+        self.refresher.daemon = True
+        self.refresher.start()
+
+    def stop(self):
+        self.stopped.set()
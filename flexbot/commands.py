@@ -0,0 +1,61 @@
+import re
+
+def no_arguments(user_id, words):
+    return ()
+
+def user_argument(user_id, words):
+    return (user_id,)
+
+def text_argument(user_id, words):
+    return (" ".join(words),)
+
+def user_and_words_arguments(user_id, words):
+    return (user_id, words)
+
+class Command(object):
+    """
+    A chat command: the handler to call, and a parser which turns the requesting user and the words
+    after the command into the handler's arguments. If enabled is given, the command is only
+    available while enabled(configuration) is true.
+    """
+    def __init__(self, name, handler, parser=no_arguments, enabled=None):
+        self.name = name
+        self.handler = handler
+        self.parser = parser
+        self.enabled = enabled
+
+    def run(self, user_id, words):
+        return self.handler(*self.parser(user_id, words))
+
+class CommandRouter(object):
+    """
+    Matches messages to commands. Everything which depends on the configuration (the bot's name,
+    which commands are enabled) is worked out when the router is built, and the router is rebuilt
+    whenever the configuration is reloaded, so routing a message costs the same however many
+    commands there are.
+    """
+    def __init__(self, configuration, commands, chars_to_ignore=""):
+        self.version = configuration.version
+        self.prefix = re.compile(re.escape(configuration.bot_name().lower()))
+        self.ignored = dict((ord(char), None) for char in chars_to_ignore)
+        self.commands = dict((command.name, command) for command in commands
+                if command.enabled is None or command.enabled(configuration))
+
+    def normalize(self, text):
+        return text.lower().translate(self.ignored)
+
+    def is_addressed(self, text):
+        """
+        Is the (normalized) message addressed to the bot?
+        """
+        return self.prefix.match(text) is not None
+
+    def route(self, text):
+        """
+        Returns the command a normalized message addressed to the bot asks for, or None if there is
+        no such command, along with the words following the command.
+        """
+        words = text.split()[1:]
+        if len(words) == 0:
+            return None, []
+        return self.commands.get(words[0]), words[1:]
@@ -1,5 +1,6 @@
 from abc import ABCMeta, abstractmethod
 import json
+import logging
 import os
 import yaml
 
@@ -21,6 +22,18 @@ class ConfigurationProvider(with_metaclass(ABCMeta, object)):
         self.config = self.load_configuration()
         if hasattr(self, 'exercise_list'):
             del self.exercise_list
+        # Lets whatever is derived from the configuration tell when to derive it again
+        self.version = getattr(self, 'version', 0) + 1
+        for listener in getattr(self, 'listeners', []):
+            listener()
+
+    def subscribe(self, listener):
+        """
+        Calls listener() whenever the configuration is reloaded.
+        """
+        if not hasattr(self, 'listeners'):
+            self.listeners = []
+        self.listeners.append(listener)
 
     def get_config_or_default(self, default, option_path):
         sub_config = self.config
@@ -43,6 +56,27 @@ class ConfigurationProvider(with_metaclass(ABCMeta, object)):
     def slack_token(self):
         return self.config['slack_token']
 
+    def slack_timeout(self):
+        return self.get_config_or_default(10, ['slack_timeout'])
+
+    def slack_api_url(self):
+        return self.get_config_or_default(None, ['slack_api_url'])
+
+    def slack_rate_limits(self):
+        return self.get_config_or_default({}, ['slack_rate_limits'])
+
+    def slack_max_retries(self):
+        return self.get_config_or_default(3, ['slack_max_retries'])
+
+    def slack_connect_timeout(self):
+        return self.get_config_or_default(5, ['slack_connect_timeout'])
+
+    def channel_directory_ttl(self):
+        return self.get_config_or_default(3600, ['channel_directory', 'ttl'])
+
+    def channel_directory_page_size(self):
+        return self.get_config_or_default(1000, ['channel_directory', 'page_size'])
+
     def office_hours_on(self):
         return self.get_config_or_default(False, ['office_hours', 'on'])
 
@@ -91,6 +125,12 @@ class ConfigurationProvider(with_metaclass(ABCMeta, object)):
     def user_exercise_limit(self):
         return self.get_config_or_default(3, ['user_exercise_limit'])
 
+    def random_seed(self):
+        return self.get_config_or_default(None, ['random_seed'])
+
+    def selection_engine(self):
+        return self.get_config_or_default(Constants.SELECTION_ENGINE_PYTHON, ['selection_engine'])
+
     def enable_acknowledgment(self):
         return self.get_config_or_default(False, ['enable_acknowledgment'])
 
@@ -107,6 +147,54 @@ class ConfigurationProvider(with_metaclass(ABCMeta, object)):
     def aggregate_exercises(self):
         return self.get_config_or_default(False, ['aggregate_exercises'])
 
+    def presence_max_workers(self):
+        return self.get_config_or_default(10, ['presence', 'max_workers'])
+
+    def presence_ttl(self):
+        return self.get_config_or_default(0, ['presence', 'ttl'])
+
+    def user_sync_mode(self):
+        return self.get_config_or_default(Constants.USER_SYNC_INCREMENTAL, ['user_sync', 'mode'])
+
+    def user_sync_page_size(self):
+        return self.get_config_or_default(200, ['user_sync', 'page_size'])
+
+    def user_cache_path(self):
+        return self.get_config_or_default(None, ['user_cache', 'path'])
+
+    def user_cache_max_age(self):
+        return self.get_config_or_default(86400, ['user_cache', 'max_age'])
+
+    def user_cache_refresh_interval(self):
+        return self.get_config_or_default(3600, ['user_cache', 'refresh_interval'])
+
+    def write_behind_on(self):
+        return self.get_config_or_default(False, ['write_behind', 'on'])
+
+    def write_behind_batch_size(self):
+        return self.get_config_or_default(100, ['write_behind', 'batch_size'])
+
+    def write_behind_flush_interval(self):
+        return self.get_config_or_default(1, ['write_behind', 'flush_interval'])
+
+    def write_behind_close_timeout(self):
+        return self.get_config_or_default(30, ['write_behind', 'close_timeout'])
+
+    def channel_configurations(self):
+        return self.get_config_or_default([], ['channels'])
+
+    def scheduler_max_workers(self):
+        return self.get_config_or_default(4, ['scheduler', 'max_workers'])
+
+    def async_commands_on(self):
+        return self.get_config_or_default(False, ['async_commands', 'on'])
+
+    def async_commands_max_workers(self):
+        return self.get_config_or_default(4, ['async_commands', 'max_workers'])
+
+    def async_commands_queue_size(self):
+        return self.get_config_or_default(100, ['async_commands', 'queue_size'])
+
 class GenericConfigurationProvider(ConfigurationProvider):
     def __init__(self, config_name, config_type, config_source):
         assert config_type in Constants.CONFIGURATIONS, \
@@ -147,6 +235,61 @@ class GenericConfigurationProvider(ConfigurationProvider):
     def load_exercise(self, filename):
         return from_dict(self.load_file(filename))
 
+def merge_configuration(base, overlay):
+    """
+    Returns a copy of base with the options in overlay replacing its own. Nested hashes are merged
+    rather than replaced.
+    """
+    merged = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_configuration(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+class ChannelConfigurationProvider(ConfigurationProvider):
+    """
+    The configuration of one of the channels hosted by a server: the options of entry index of the
+    server's channels option, on top of the server's other options. Whenever the server's
+    configuration is reloaded, every channel's configuration is merged again. A channel whose entry
+    has been removed keeps its last options until the server is restarted.
+    """
+    def __init__(self, base, index):
+        self.base = base
+        self.index = index
+        super(ChannelConfigurationProvider, self).set_configuration()
+        self.base.subscribe(self.merge)
+
+    def overlay(self):
+        channels = self.base.channel_configurations()
+        if self.index < len(channels):
+            self.last_overlay = channels[self.index]
+        return self.last_overlay
+
+    def set_configuration(self):
+        # Reloading any channel reloads the shared options, which merges every channel again
+        self.base.set_configuration()
+
+    def merge(self):
+        if self.index >= len(self.base.channel_configurations()):
+            logging.getLogger(__name__).warning("Channel %s is no longer in the channels option, "
+                    "keeping its options until restarted", self.channel_name())
+        super(ChannelConfigurationProvider, self).set_configuration()
+
+    def load_configuration(self):
+        merged = merge_configuration(self.base.config, self.overlay())
+        merged.pop('channels', None)
+        return merged
+
+    def load_exercises(self):
+        if 'exercise_directory' in self.overlay():
+            return super(ChannelConfigurationProvider, self).load_exercises()
+        return self.base.exercises()
+
+    def load_exercise(self, filename):
+        return self.base.load_exercise(filename)
+
 class InMemoryConfigurationProvider(ConfigurationProvider):
     def __init__(self, configuration, exercises=[]):
         self.configuration = configuration
@@ -154,7 +297,12 @@ class InMemoryConfigurationProvider(ConfigurationProvider):
         self.set_configuration()
 
     def update_configuration(self, updates):
+        """
+        Changes the given options and reloads the configuration, so that whatever was derived from
+        it is derived again.
+        """
         self.configuration.update(updates)
+        self.set_configuration()
 
     def load_configuration(self):
         return self.configuration
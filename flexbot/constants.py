@@ -8,13 +8,21 @@ class Constants(object):
     IN_MEMORY_LOGGER = loggers.InMemoryLogger.__name__
     CSV_LOGGER = loggers.CsvLogger.__name__
     POSTGRES_DATABASE_LOGGER = loggers.PostgresDatabaseLogger.__name__
+    SQLITE_DATABASE_LOGGER = loggers.SqliteDatabaseLogger.__name__
 
     LOGGER_CLASSES = [
         IN_MEMORY_LOGGER,
         CSV_LOGGER,
-        POSTGRES_DATABASE_LOGGER
+        POSTGRES_DATABASE_LOGGER,
+        SQLITE_DATABASE_LOGGER
     ]
 
+    USER_SYNC_INCREMENTAL = "incremental"
+    USER_SYNC_BULK = "bulk"
+
+    SELECTION_ENGINE_PYTHON = "python"
+    SELECTION_ENGINE_NUMPY = "numpy"
+
     CONFIGURATION_YAML = "yaml"
     CONFIGURATION_JSON = "json"
 
@@ -0,0 +1,176 @@
+import logging
+import threading
+
+from .constants import Constants
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def get_selection_engine(configuration):
+    """
+    Returns the engine configured by selection_engine, or None if the users should be selected in
+    pure Python.
+    """
+    engine = configuration.selection_engine()
+    if engine == Constants.SELECTION_ENGINE_NUMPY:
+        if numpy is None:
+            logging.getLogger(__name__).warning(
+                    "numpy is not installed, falling back to the python selection engine")
+            return None
+        return NumpySelectionEngine(configuration)
+    return None
+
+class UserArrays(object):
+    """
+    The exercises logged today by the users of a channel, as arrays with a slot per user. Users
+    are added and removed as they come and go, and only the counts which a new DaySnapshot may
+    have changed are updated, rather than building the arrays again for every selection.
+    """
+    def __init__(self):
+        self.user_ids = []
+        self.positions = {}
+        self.totals = numpy.zeros(0, dtype=numpy.int64)
+        self.pending = numpy.zeros(0, dtype=numpy.int64)
+        self.snapshot = None
+
+    def add_users(self, user_ids):
+        new_user_ids = []
+        for user_id in user_ids:
+            if user_id not in self.positions:
+                self.positions[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+                new_user_ids.append(user_id)
+        if len(new_user_ids) == 0:
+            return
+        padding = numpy.zeros(len(new_user_ids), dtype=numpy.int64)
+        self.totals = numpy.concatenate((self.totals, padding))
+        self.pending = numpy.concatenate((self.pending, padding))
+        if self.snapshot is not None:
+            for user_id in new_user_ids:
+                position = self.positions[user_id]
+                self.totals[position] = self.snapshot.totals().get(user_id, 0)
+                self.pending[position] = self.snapshot.pending_counts().get(user_id, 0)
+
+    def remove_users(self, user_ids):
+        removed = set(user_id for user_id in user_ids if user_id in self.positions)
+        if len(removed) == 0:
+            return
+        keep = numpy.array([user_id not in removed for user_id in self.user_ids], dtype=bool)
+        self.user_ids = [user_id for user_id in self.user_ids if user_id not in removed]
+        self.positions = dict((user_id, i) for i, user_id in enumerate(self.user_ids))
+        self.totals = self.totals[keep]
+        self.pending = self.pending[keep]
+
+    def update(self, snapshot):
+        """
+        Brings the counts in line with the given snapshot. Only the users who had logged or been
+        assigned exercises in the previous or the new snapshot can have non-zero counts.
+        """
+        if snapshot is self.snapshot:
+            return
+        previous = self.snapshot
+        self.update_counts(self.totals, previous.totals() if previous else {}, snapshot.totals())
+        self.update_counts(self.pending, previous.pending_counts() if previous else {},
+                snapshot.pending_counts())
+        self.snapshot = snapshot
+
+    def update_counts(self, array, previous_counts, counts):
+        for user_id in previous_counts:
+            if user_id not in counts and user_id in self.positions:
+                array[self.positions[user_id]] = 0
+        for user_id, count in counts.items():
+            if user_id in self.positions:
+                array[self.positions[user_id]] = count
+
+    def indices(self, user_ids):
+        """
+        Returns the slots of the given users, adding any users who don't have one yet.
+        """
+        self.add_users(user_ids)
+        return numpy.fromiter((self.positions[user_id] for user_id in user_ids), dtype=numpy.intp,
+                count=len(user_ids))
+
+    def done(self, exercise_name):
+        """
+        Returns a mask of the users who have done the given exercise today.
+        """
+        done = numpy.zeros(len(self.user_ids), dtype=bool)
+        for user_id, count in self.snapshot.exercise_counts(exercise_name).items():
+            if count > 0 and user_id in self.positions:
+                done[self.positions[user_id]] = True
+        return done
+
+class NumpySelectionEngine(object):
+    """
+    Computes eligibility, pacing and winner draws over NumPy arrays rather than looping over the
+    users in Python, for channels with many members.
+    """
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self.arrays = UserArrays()
+        self.lock = threading.Lock()
+
+    def add_users(self, user_ids):
+        with self.lock:
+            self.arrays.add_users(user_ids)
+
+    def remove_users(self, user_ids):
+        with self.lock:
+            self.arrays.remove_users(user_ids)
+
+    def prepare(self, user_ids, snapshot):
+        self.arrays.update(snapshot)
+        return self.arrays.indices(user_ids)
+
+    def exercise_totals(self, indices):
+        totals = self.arrays.totals[indices]
+        if self.configuration.aggregate_exercises():
+            return totals + self.arrays.pending[indices]
+        return totals
+
+    def eligible_users(self, user_ids, snapshot):
+        """
+        Returns the users who have exercises left today and, unless exercises are aggregated,
+        haven't been assigned an exercise yet.
+        """
+        with self.lock:
+            indices = self.prepare(user_ids, snapshot)
+            mask = self.exercise_totals(indices) < self.configuration.user_exercise_limit()
+            if not self.configuration.aggregate_exercises():
+                mask &= self.arrays.pending[indices] == 0
+            return [user_ids[i] for i in numpy.flatnonzero(mask)]
+
+    def total_exercises(self, user_ids, snapshot):
+        """
+        Returns the number of exercises the given users have done today, in total.
+        """
+        with self.lock:
+            return int(self.exercise_totals(self.prepare(user_ids, snapshot)).sum())
+
+    def select_users(self, user_ids, exercise, count, snapshot, rng):
+        """
+        Draws up to count distinct users, with the same distribution as bot.select_users: users who
+        haven't done the exercise come first, and each draw is proportional to the exercises a
+        user has left. rng seeds the draw, so that a seeded bot stays reproducible.
+        """
+        with self.lock:
+            indices = self.prepare(user_ids, snapshot)
+            weights = self.configuration.user_exercise_limit() - self.exercise_totals(indices)
+            done = self.arrays.done(exercise.name)[indices]
+        generator = numpy.random.default_rng(rng.getrandbits(64))
+        # Taking the largest log(u) / weight keys draws without replacement in proportion to the
+        # weights (Efraimidis and Spirakis)
+        keys = numpy.full(len(user_ids), -numpy.inf)
+        positive = weights > 0
+        keys[positive] = numpy.log(generator.random(int(positive.sum()))) / weights[positive]
+        winners = []
+        for group in (~done & positive, done & positive):
+            candidates = numpy.flatnonzero(group)
+            wanted = min(count - len(winners), len(candidates))
+            if wanted <= 0:
+                continue
+            order = numpy.argsort(-keys[candidates], kind='stable')[:wanted]
+            winners.extend(user_ids[i] for i in candidates[order])
+        return winners
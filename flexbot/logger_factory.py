@@ -1,11 +1,24 @@
+import json
+import threading
+
 from .constants import Constants
 from . import loggers
+from .write_behind import WriteBehindLogger
 
 class LoggerFactory(object):
     def __init__(self, configuration):
         self.configuration = configuration
 
     def get_logger(self):
+        logger = self.get_backing_logger()
+        if self.configuration.write_behind_on():
+            return WriteBehindLogger(logger,
+                    batch_size=self.configuration.write_behind_batch_size(),
+                    flush_interval=self.configuration.write_behind_flush_interval(),
+                    close_timeout=self.configuration.write_behind_close_timeout())
+        return logger
+
+    def get_backing_logger(self):
         logger_type = self.configuration.workout_logger_type()
         if logger_type == Constants.IN_MEMORY_LOGGER:
             return self.get_in_memory_logger()
@@ -13,6 +26,8 @@ class LoggerFactory(object):
             return self.get_csv_logger()
         elif logger_type == Constants.POSTGRES_DATABASE_LOGGER:
             return self.get_postgres_database_logger()
+        elif logger_type == Constants.SQLITE_DATABASE_LOGGER:
+            return self.get_sqlite_database_logger()
         else:
             raise Exception("Unsupported logger type {}".format(logger_type))
 
@@ -20,12 +35,68 @@ class LoggerFactory(object):
         return loggers.InMemoryLogger()
 
     def get_csv_logger(self):
+        # The settings also hold the database credentials, which the csv logger has no use for
+        settings = self.configuration.workout_logger_settings() or {}
+        if 'compaction_threshold' in settings:
+            return loggers.CsvLogger(compaction_threshold=settings['compaction_threshold'])
         return loggers.CsvLogger()
 
     def get_postgres_database_logger(self):
-        dbsettings = self.configuration.workout_logger_settings()
+        dbsettings = dict(self.configuration.workout_logger_settings())
         tablename = dbsettings['tablename']
         winners_table = dbsettings['winners_table']
         del dbsettings['tablename']
         del dbsettings['winners_table']
         return loggers.PostgresDatabaseLogger(tablename, winners_table, **dbsettings)
+
+    def get_sqlite_database_logger(self):
+        dbsettings = self.configuration.workout_logger_settings()
+        # Leave out the database credentials, which SQLite has no use for
+        options = dict((name, dbsettings[name]) for name in
+                ['tablename', 'winners_table', 'busy_timeout'] if name in dbsettings)
+        return loggers.SqliteDatabaseLogger(dbsettings['path'], **options)
+
+class LoggerPool(object):
+    """
+    Hands out one logger per distinct logger configuration, so that channels which log to the same
+    place share a logger and its connections. Given a channel name, the shared logger is wrapped
+    in a ChannelLogger, which keeps the channel's exercises apart from the other channels'; pass
+    prefixed=False for the channel which keeps the plain user ids.
+    """
+    def __init__(self):
+        self.loggers = {}
+        self.lock = threading.Lock()
+
+    def key(self, configuration):
+        logger_type = configuration.workout_logger_type()
+        settings = configuration.workout_logger_settings()
+        if logger_type == Constants.CSV_LOGGER:
+            # The csv logger always writes to the same files, whatever its other settings
+            settings = {'compaction_threshold': (settings or {}).get('compaction_threshold')}
+        return json.dumps([
+            logger_type,
+            settings,
+            configuration.write_behind_on(),
+            configuration.write_behind_batch_size(),
+            configuration.write_behind_flush_interval()
+        ], sort_keys=True)
+
+    def get_logger(self, configuration, channel_name=None, prefixed=True):
+        key = self.key(configuration)
+        with self.lock:
+            if key not in self.loggers:
+                self.loggers[key] = LoggerFactory(configuration).get_logger()
+            logger = self.loggers[key]
+        if channel_name is not None:
+            return loggers.ChannelLogger(logger, channel_name, prefixed)
+        return logger
+
+    def close(self):
+        """
+        Closes every logger in the pool, returning them.
+        """
+        with self.lock:
+            loggers, self.loggers = list(self.loggers.values()), {}
+        for logger in loggers:
+            logger.close()
+        return loggers
@@ -1,19 +1,155 @@
 from abc import ABCMeta, abstractmethod
 import csv
 import datetime
+import io
 import logging
+import os
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+import sqlite3
+import threading
 import time
 from future.utils import with_metaclass
 
+from .util import replace_file
+
+class ExerciseIndex(object):
+    """
+    Counts today's logged exercises per user and exercise, and the pending assignments per user,
+    so that they can be queried without going back to the logger's backend. The exercise counts
+    start over when the day changes; pending assignments carry over.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.day = datetime.date.today()
+        self.counts = {}
+        self.totals = {}
+        self.pending = {}
+
+    def maybe_roll_over(self):
+        today = datetime.date.today()
+        if today != self.day:
+            self.day = today
+            self.counts = {}
+            self.totals = {}
+
+    def rebuild(self, todays_exercises, current_winners):
+        with self.lock:
+            self.day = datetime.date.today()
+            self.counts = {}
+            self.totals = {}
+            self.pending = {}
+            for user_id, exercises in (todays_exercises or {}).items():
+                for exercise_data in exercises:
+                    self._record_exercise(user_id, exercise_data['exercise'])
+            for user_id, assignments in (current_winners or {}).items():
+                if len(assignments) > 0:
+                    self.pending[user_id] = len(assignments)
+
+    def _record_exercise(self, user_id, exercise_name):
+        key = (user_id, exercise_name)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.totals[user_id] = self.totals.get(user_id, 0) + 1
+
+    def record_exercise(self, user_id, exercise_name):
+        with self.lock:
+            self.maybe_roll_over()
+            self._record_exercise(user_id, exercise_name)
+
+    def record_assignment(self, user_id):
+        with self.lock:
+            self.pending[user_id] = self.pending.get(user_id, 0) + 1
+
+    def record_completion(self, user_id):
+        with self.lock:
+            remaining = self.pending.get(user_id, 0) - 1
+            if remaining > 0:
+                self.pending[user_id] = remaining
+            else:
+                self.pending.pop(user_id, None)
+
+    def count_for(self, user_id, exercise_name):
+        with self.lock:
+            self.maybe_roll_over()
+            return self.counts.get((user_id, exercise_name), 0)
+
+    def total_for(self, user_id):
+        with self.lock:
+            self.maybe_roll_over()
+            return self.totals.get(user_id, 0)
+
+    def pending_for(self, user_id):
+        with self.lock:
+            return self.pending.get(user_id, 0)
+
 class BaseLogger(with_metaclass(ABCMeta, object)):
+    # The database loggers log a failed write and carry on. Loggers which queue writes and retry
+    # them set this, so that failed writes raise instead.
+    raise_write_errors = False
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.index = ExerciseIndex()
+
+    def rebuild_index(self):
+        """
+        Rebuilds the exercise counts from the backend. Loggers call this once they are set up.
+        """
+        self.index.rebuild(self.get_todays_exercises(), self.get_current_winners())
+
+    def count_for(self, user_id, exercise):
+        """
+        Returns the number of times the given user has logged the given exercise today.
+        """
+        return self.index.count_for(user_id, exercise.name)
+
+    def total_for(self, user_id):
+        """
+        Returns the number of exercises the given user has logged today.
+        """
+        return self.index.total_for(user_id)
+
+    def pending_for(self, user_id):
+        """
+        Returns the number of exercises assigned to the given user which are not yet finished.
+        """
+        return self.index.pending_for(user_id)
+
+    def get_todays_totals(self):
+        """
+        Returns a hash from user id to a hash from exercise name to the number of times the user has
+        done that exercise today and the total reps, e.g.
+        {'uid1': {'pushups': {'count': 2, 'reps': 65}}}.
+        """
+        totals = {}
+        for user_id, exercises in (self.get_todays_exercises() or {}).items():
+            user_totals = totals.setdefault(user_id, {})
+            for exercise_data in exercises:
+                exercise_totals = user_totals.setdefault(exercise_data['exercise'],
+                        {'count': 0, 'reps': 0})
+                exercise_totals['count'] += 1
+                exercise_totals['reps'] += exercise_data['reps']
+        return totals
+
+    def close(self):
+        """
+        Releases any resources held by the logger.
+        """
+        pass
 
     @abstractmethod
     def log_exercise(self, user_id, exercise, reps):
         pass
 
+    def log_exercises(self, entries):
+        """
+        Logs each (user_id, exercise, reps) entry. Loggers override this to write the entries in a
+        single operation.
+        """
+        for user_id, exercise, reps in entries:
+            self.log_exercise(user_id, exercise, reps)
+
     @abstractmethod
     def get_todays_exercises(self):
         pass
@@ -36,6 +172,14 @@ class BaseLogger(with_metaclass(ABCMeta, object)):
         """
         pass
 
+    def add_exercises(self, entries):
+        """
+        Adds each (winner_id, exercise, reps) entry. Loggers override this to write the entries in
+        a single operation.
+        """
+        for winner_id, exercise, reps in entries:
+            self.add_exercise(winner_id, exercise, reps)
+
     @abstractmethod
     def finish_exercise(self, winner_id):
         """
@@ -52,31 +196,186 @@ class InMemoryLogger(BaseLogger):
 
     def log_exercise(self, user_id, exercise, reps):
         self.exercises.append((user_id, exercise, reps, datetime.datetime.now()))
+        self.index.record_exercise(user_id, exercise.name)
 
     def get_todays_exercises(self):
-        return [log for log in self.exercises if log[3].date() == datetime.date.today()]
+        exercises = {}
+        for user_id, exercise, reps, logged_at in self.exercises:
+            if logged_at.date() == datetime.date.today():
+                exercise_data = {
+                    'exercise': exercise.name,
+                    'reps': reps
+                }
+                try:
+                    exercises[user_id].append(exercise_data)
+                except:
+                    exercises[user_id] = [exercise_data]
+        return exercises
 
     def get_current_winners(self):
         return self.winners
 
     def add_exercise(self, winner_id, exercise, reps):
         exercise_entry = {
-            'exercise': exercise,
+            'exercise': exercise.name,
             'reps': reps
         }
         try:
             self.winners[winner_id].append(exercise_entry)
         except:
             self.winners[winner_id] = [exercise_entry]
+        self.index.record_assignment(winner_id)
+
+    def finish_exercise(self, winner_id):
+        try:
+            exercise_data = self.winners[winner_id].pop(0)
+        except (KeyError, IndexError):
+            return None
+        if len(self.winners[winner_id]) == 0:
+            del self.winners[winner_id]
+        self.index.record_completion(winner_id)
+        return exercise_data
+
+class ChannelLogger(BaseLogger):
+    """
+    One channel's view of a logger shared between channels. The channel's users are stored under
+    their ids prefixed with the channel's name, so that each channel only sees, counts and
+    finishes its own exercises. A channel which isn't prefixed keeps the plain ids, and so the
+    rows written before the logger was shared, and sees only ids without a prefix. Closing the
+    shared logger is left to its owner.
+    """
+    SEPARATOR = ":"
+
+    def __init__(self, wrapped, channel_name, prefixed=True):
+        super(ChannelLogger, self).__init__()
+        self.wrapped = wrapped
+        self.prefix = channel_name + self.SEPARATOR if prefixed else ""
+
+    def key(self, user_id):
+        return self.prefix + user_id
+
+    def own(self, by_user):
+        """
+        Picks the channel's users out of a hash keyed by stored user id.
+        """
+        if self.prefix == "":
+            # Slack user ids never contain the separator
+            return dict((user_id, value) for user_id, value in (by_user or {}).items()
+                    if self.SEPARATOR not in user_id)
+        start = len(self.prefix)
+        return dict((user_id[start:], value) for user_id, value in (by_user or {}).items()
+                if user_id.startswith(self.prefix))
+
+    def count_for(self, user_id, exercise):
+        return self.wrapped.count_for(self.key(user_id), exercise)
+
+    def total_for(self, user_id):
+        return self.wrapped.total_for(self.key(user_id))
+
+    def pending_for(self, user_id):
+        return self.wrapped.pending_for(self.key(user_id))
+
+    def get_todays_totals(self):
+        return self.own(self.wrapped.get_todays_totals())
+
+    def log_exercise(self, user_id, exercise, reps):
+        self.wrapped.log_exercise(self.key(user_id), exercise, reps)
+
+    def log_exercises(self, entries):
+        self.wrapped.log_exercises([(self.key(user_id), exercise, reps)
+            for user_id, exercise, reps in entries])
+
+    def get_todays_exercises(self):
+        return self.own(self.wrapped.get_todays_exercises())
+
+    def get_current_winners(self):
+        return self.own(self.wrapped.get_current_winners())
+
+    def add_exercise(self, winner_id, exercise, reps):
+        self.wrapped.add_exercise(self.key(winner_id), exercise, reps)
+
+    def add_exercises(self, entries):
+        self.wrapped.add_exercises([(self.key(winner_id), exercise, reps)
+            for winner_id, exercise, reps in entries])
 
     def finish_exercise(self, winner_id):
-        return self.winners[winner_id].pop(0)
+        return self.wrapped.finish_exercise(self.key(winner_id))
+
+class CsvTail(object):
+    """
+    Follows a CSV file which is only appended to, parsing only the rows added since the previous
+    read into a cached structure. The file is parsed again from the start if it is replaced,
+    truncated or rewritten in place.
+    """
+    def __init__(self, filename, apply_row):
+        self.filename = filename
+        self.apply_row = apply_row
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.rows = {}
+        self.row_count = 0
+        self.offset = 0
+        self.file_id = None
+        self.mtime = None
+
+    def read(self):
+        """
+        Returns the structure built by calling apply_row on every row of the file.
+        """
+        with self.lock:
+            try:
+                stat = os.stat(self.filename)
+            except OSError:
+                self.reset()
+                return self.rows
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id != self.file_id or stat.st_size < self.offset or \
+                    (stat.st_size == self.offset and stat.st_mtime != self.mtime):
+                self.reset()
+                self.file_id = file_id
+            if stat.st_size > self.offset:
+                self.read_appended_rows()
+            self.mtime = stat.st_mtime
+            return self.rows
+
+    def read_appended_rows(self):
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Leave a partially written last row for the next read
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        for row in csv.reader(io.StringIO(data.decode('utf-8'))):
+            if len(row) > 0:
+                try:
+                    self.apply_row(self.rows, row)
+                    self.row_count += 1
+                except (IndexError, ValueError):
+                    logging.getLogger(__name__).warning("Skipping malformed row in %s: %s",
+                            self.filename, row)
 
 class CsvLogger(BaseLogger):
+    """
+    Logs exercises to a csv file per day. Pending winners are kept in an append-only journal of
+    assign and complete records, which is compacted once it holds compaction_threshold records
+    for finished exercises.
+    """
     format_string = "%Y%m%d"
 
-    def __init__(self):
+    ASSIGN = "assign"
+    COMPLETE = "complete"
+
+    # Every csv logger writes to the same journal in the working directory
+    winners_lock = threading.Lock()
+
+    def __init__(self, compaction_threshold=100):
         super(CsvLogger, self).__init__()
+        self.compaction_threshold = compaction_threshold
+        self.log_tail = None
+        self.winners_tail = CsvTail(self.winners_filename(), self.apply_winner_row)
+        self.rebuild_index()
 
     def csv_filename(self):
         return "log" + time.strftime(self.format_string) + ".csv"
@@ -85,87 +384,284 @@ class CsvLogger(BaseLogger):
         return "winners.csv"
 
     def log_exercise(self, user_id, exercise, reps):
+        self.log_exercises([(user_id, exercise, reps)])
+
+    def log_exercises(self, entries):
         with open(self.csv_filename(), 'a') as f:
             writer = csv.writer(f)
             now = str(datetime.datetime.now())
-            writer.writerow([now, user_id, exercise.name, reps, exercise.units])
+            writer.writerows([[now, user_id, exercise.name, reps, exercise.units]
+                for user_id, exercise, reps in entries])
+        for user_id, exercise, _ in entries:
+            self.index.record_exercise(user_id, exercise.name)
+
+    @staticmethod
+    def apply_log_row(exercises, row):
+        username = row[1]
+        exercise_data = {
+            'exercise': row[2],
+            'reps': int(row[3])
+        }
+        try:
+            exercises[username].append(exercise_data)
+        except:
+            exercises[username] = [exercise_data]
+
+    @classmethod
+    def apply_winner_row(cls, winners, row):
+        if row[0] == cls.COMPLETE:
+            # Completes the oldest pending exercise of the winner
+            pending = winners.get(row[1], [])
+            if len(pending) > 0:
+                pending.pop(0)
+            if len(pending) == 0:
+                winners.pop(row[1], None)
+            return
+        elif row[0] == cls.ASSIGN:
+            row = row[1:]
+        # Rows without a record type were written before the journal, and are assignments
+        winner_id = row[0]
+        exercise_data = {
+            'exercise': row[1],
+            'reps': int(row[2])
+        }
+        try:
+            winners[winner_id].append(exercise_data)
+        except:
+            winners[winner_id] = [exercise_data]
+
+    @staticmethod
+    def copy_rows(rows):
+        # Callers may modify the returned lists, so they must not share them with the cache
+        return dict((key, list(value)) for key, value in rows.items())
 
     def get_todays_exercises(self):
-        exercises = {}
-        with open(self.csv_filename(), 'r') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                username = row[1]
-                exercise_data = {
-                    'exercise': row[2],
-                    'reps': int(row[3])
-                }
-                try:
-                    exercises[username].append(exercise_data)
-                except:
-                    exercises[username] = [exercise_data]
-        return exercises
+        # The log file changes every day
+        if self.log_tail is None or self.log_tail.filename != self.csv_filename():
+            self.log_tail = CsvTail(self.csv_filename(), self.apply_log_row)
+        return self.copy_rows(self.log_tail.read())
 
     def get_current_winners(self):
-        winners = {}
-        with open(self.winners_filename(), 'r') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                winner_id = row[0]
-                exercise_data = {
-                    'exercise': row[1],
-                    'reps': int(row[2])
-                }
-                try:
-                    winners[winner_id].append(exercise_data)
-                except:
-                    winners[winner_id] = [exercise_data]
-        return winners
+        return self.copy_rows(self.winners_tail.read())
 
-    def add_exercise(self, winner_id, exercise, reps):
+    def append_winner_rows(self, rows):
         with open(self.winners_filename(), 'a') as f:
             writer = csv.writer(f)
-            writer.writerow([winner_id, exercise.name, reps])
+            writer.writerows(rows)
+
+    def add_exercise(self, winner_id, exercise, reps):
+        self.add_exercises([(winner_id, exercise, reps)])
+
+    def add_exercises(self, entries):
+        with self.winners_lock:
+            self.append_winner_rows([[self.ASSIGN, winner_id, exercise.name, reps]
+                for winner_id, exercise, reps in entries])
+        for winner_id, _, _ in entries:
+            self.index.record_assignment(winner_id)
 
     def finish_exercise(self, winner_id):
-        winners = self.get_current_winners()
-        # Remove the finished exercise, and rewrite the winners csv
-        exercise_data = winners[winner_id].pop(0)
-        with open(self.winners_filename(), 'w') as f:
+        with self.winners_lock:
+            pending = self.winners_tail.read().get(winner_id, [])
+            if len(pending) == 0:
+                return None
+            exercise_data = dict(pending[0])
+            self.append_winner_rows([[self.COMPLETE, winner_id]])
+            self.maybe_compact_winners()
+        self.index.record_completion(winner_id)
+        return exercise_data
+
+    def maybe_compact_winners(self):
+        winners = self.winners_tail.read()
+        pending_count = sum(len(pending) for pending in winners.values())
+        # Every finished exercise left an assign and a complete record behind
+        finished_count = (self.winners_tail.row_count - pending_count) // 2
+        if finished_count >= self.compaction_threshold:
+            self.compact_winners()
+
+    def compact_winners(self):
+        """
+        Rewrites the winners journal with only the pending exercises. The journal is written to a
+        temporary file which then replaces it, so a crash leaves either the old or the new journal.
+        """
+        winners = self.winners_tail.read()
+        temp_filename = self.winners_filename() + ".tmp"
+        with open(temp_filename, 'w') as f:
             writer = csv.writer(f)
             for winner_id in winners:
                 for exercise in winners[winner_id]:
-                    writer.writerow([winner_id, exercise['exercise'], exercise['reps']])
-        return exercise_data
+                    writer.writerow([self.ASSIGN, winner_id, exercise['exercise'], exercise['reps']])
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(temp_filename, self.winners_filename())
+        self.winners_tail.reset()
 
 
-class PostgresConnector(object):
-    def with_connection(self, func):
-        conn = None
+class PostgresConnectionPool(object):
+    """
+    A thread-safe pool of between min_size and max_size connections. Callers wait for a free
+    connection once max_size connections are in use. A connection which has been idle for more
+    than health_check_interval seconds is checked before it is handed out, and replaced if it is
+    broken. Nothing connects until the first connection is asked for, so that the database being
+    down doesn't stop the bot from starting.
+    """
+    def __init__(self, min_size, max_size, health_check_interval, **kwargs):
+        self.logger = logging.getLogger(__name__)
+        self.health_check_interval = health_check_interval
+        self.min_size = min_size
+        self.max_size = max_size
+        self.kwargs = kwargs
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.reconnects = 0
+
+    def acquire(self):
+        start = time.time()
+        self.slots.acquire()
+        try:
+            conn = self.connections().getconn()
+            if not self.is_healthy(conn):
+                self.logger.info("Replacing broken database connection")
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+                with self.lock:
+                    self.reconnects += 1
+        except:
+            self.slots.release()
+            raise
+        wait = time.time() - start
+        with self.lock:
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return conn
+
+    def connections(self):
+        """
+        Returns the underlying psycopg2 pool, which opens min_size connections when it is created.
+        """
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = psycopg2.pool.ThreadedConnectionPool(self.min_size, self.max_size,
+                        **self.kwargs)
+            return self.pool
+
+    def release(self, conn, broken=False):
+        with self.lock:
+            self.last_used[id(conn)] = time.time()
+        try:
+            self.pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    def is_healthy(self, conn):
+        if conn.closed:
+            return False
+        with self.lock:
+            last_used = self.last_used.get(id(conn))
+        if last_used is None or time.time() - last_used < self.health_check_interval:
+            return True
         try:
-            conn = psycopg2.connect(**self.kwargs)
             cursor = conn.cursor()
-            result = func(cursor)
-            conn.commit()
-            return result
-        except psycopg2.Error:
-            self.logger.exception("Failure during database connection")
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
             conn.rollback()
-        finally:
-            if conn:
-                conn.close()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {
+                'acquisitions': self.acquisitions,
+                'avg_wait': self.total_wait / self.acquisitions if self.acquisitions else 0.0,
+                'max_wait': self.max_wait,
+                'reconnects': self.reconnects
+            }
 
-class PostgresDatabaseLogger(BaseLogger, PostgresConnector):
-    def __init__(self, tablename, winners_table, **kwargs):
+    def close(self):
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.closeall()
+
+class PooledPostgresConnector(object):
+    """
+    Runs commands on connections borrowed from self.pool. A command which fails because its
+    connection broke is retried once on a new connection.
+    """
+    def with_connection(self, func, write=False):
+        for attempt in range(2):
+            try:
+                conn = self.pool.acquire()
+            except psycopg2.Error:
+                self.logger.exception("Failure connecting to the database")
+                if write and getattr(self, 'raise_write_errors', False):
+                    raise
+                return None
+            broken = False
+            try:
+                cursor = conn.cursor()
+                result = func(cursor)
+                conn.commit()
+                return result
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = bool(conn.closed)
+                if broken and attempt == 0:
+                    self.logger.warning("Database connection broke, reconnecting", exc_info=True)
+                    continue
+                self.logger.exception("Failure during database connection")
+                if not broken:
+                    conn.rollback()
+                if write and getattr(self, 'raise_write_errors', False):
+                    raise
+                return None
+            except psycopg2.Error:
+                self.logger.exception("Failure during database connection")
+                conn.rollback()
+                if write and getattr(self, 'raise_write_errors', False):
+                    raise
+                return None
+            finally:
+                self.pool.release(conn, broken)
+
+class PostgresDatabaseLogger(BaseLogger, PooledPostgresConnector):
+    def __init__(self, tablename, winners_table, pool_min_size=1, pool_max_size=5,
+            health_check_interval=30, **kwargs):
         super(PostgresDatabaseLogger, self).__init__()
         self.kwargs = kwargs
+        self.pool = PostgresConnectionPool(pool_min_size, pool_max_size, health_check_interval,
+                **kwargs)
         self.tablename = tablename
         self.winners_table = winners_table
         self.maybe_create_tables()
+        self.rebuild_index()
 
-    def maybe_create_tables(self):
-        def create_tables_command(cursor):
-            cursor.execute("""
+    def schema_version_table(self):
+        return "{}_schema_version".format(self.tablename)
+
+    def index_name(self, table, columns):
+        """
+        Returns the name of the index on the given columns of table. Indexes always live in their
+        table's schema and can't be schema-qualified, so any schema prefix is dropped.
+        """
+        return "{}_{}_idx".format(table.split('.')[-1], columns)
+
+    def migrations(self):
+        """
+        Returns the statements of each schema migration. Migration i (counting from 1) brings the
+        schema from version i - 1 to version i; deployments which predate versioning are at
+        version 0.
+        """
+        return [
+            # 1: the original tables
+            [
+                """
                 CREATE TABLE IF NOT EXISTS {} (
                     user_id VARCHAR(100) NOT NULL,
                     exercise VARCHAR(100) NOT NULL,
@@ -173,33 +669,80 @@ class PostgresDatabaseLogger(BaseLogger, PostgresConnector):
                     units VARCHAR(50) NOT NULL,
                     time TIMESTAMP DEFAULT current_timestamp
                 );
-            """.format(self.tablename))
-            cursor.execute("""
+                """.format(self.tablename),
+                """
                 CREATE TABLE IF NOT EXISTS {} (
                     winner_id VARCHAR(100) NOT NULL,
                     exercise VARCHAR(100) NOT NULL,
                     reps INT NOT NULL,
                     time TIMESTAMP DEFAULT current_timestamp
                 );
-            """.format(self.winners_table))
-        self.with_connection(create_tables_command)
+                """.format(self.winners_table)
+            ],
+            # 2: surrogate keys, and indexes for the per-day and per-user lookups
+            [
+                "ALTER TABLE {0} ADD COLUMN id SERIAL PRIMARY KEY".format(self.tablename),
+                "ALTER TABLE {0} ADD COLUMN id SERIAL PRIMARY KEY".format(self.winners_table),
+                "CREATE INDEX {} ON {} (time)".format(
+                    self.index_name(self.tablename, 'time'), self.tablename),
+                "CREATE INDEX {} ON {} (user_id, time)".format(
+                    self.index_name(self.tablename, 'user_id_time'), self.tablename),
+                "CREATE INDEX {} ON {} (winner_id, time)".format(
+                    self.index_name(self.winners_table, 'winner_id_time'), self.winners_table)
+            ]
+        ]
 
-    def log_exercise(self, user_id, exercise, reps):
-        def log_exercise_command(cursor):
+    def maybe_create_tables(self):
+        """
+        Applies the migrations which have not been applied yet, in a single transaction.
+        """
+        def migrate_command(cursor):
             cursor.execute("""
+                CREATE TABLE IF NOT EXISTS {} (version INT NOT NULL)
+            """.format(self.schema_version_table()))
+            # Keep concurrently starting loggers from applying the same migration twice
+            cursor.execute("LOCK TABLE {} IN EXCLUSIVE MODE".format(self.schema_version_table()))
+            cursor.execute("SELECT max(version) FROM {}".format(self.schema_version_table()))
+            row = cursor.fetchone()
+            version = row[0] if row is not None and row[0] is not None else 0
+            migrations = self.migrations()
+            for migration in migrations[version:]:
+                for statement in migration:
+                    cursor.execute(statement)
+            if version < len(migrations):
+                self.logger.info("Migrated %s from schema version %d to %d", self.tablename,
+                        version, len(migrations))
+                cursor.execute("DELETE FROM {}".format(self.schema_version_table()))
+                cursor.execute("INSERT INTO {} (version) VALUES (%s)".format(
+                    self.schema_version_table()), (len(migrations),))
+        self.with_connection(migrate_command)
+
+    def log_exercise(self, user_id, exercise, reps):
+        self.log_exercises([(user_id, exercise, reps)])
+
+    def log_exercises(self, entries):
+        if len(entries) == 0:
+            return
+        def log_exercises_command(cursor):
+            psycopg2.extras.execute_values(cursor, """
                 INSERT INTO {}
                     (user_id, exercise, reps, units)
                 VALUES
-                    (%s, %s, %s, %s);
-            """.format(self.tablename), (user_id, exercise.name, reps, exercise.units))
-        self.with_connection(log_exercise_command)
+                    %s
+            """.format(self.tablename), [(user_id, exercise.name, reps, exercise.units)
+                for user_id, exercise, reps in entries])
+            return True
+        if self.with_connection(log_exercises_command, write=True):
+            for user_id, exercise, _ in entries:
+                self.index.record_exercise(user_id, exercise.name)
 
     def get_todays_exercises(self):
         def get_todays_exercises_command(cursor):
             cursor.execute("""
                 SELECT user_id, exercise, reps
                 FROM {}
-                WHERE date_trunc('day', time) = date_trunc('day', now())
+                WHERE time >= CURRENT_DATE::timestamp AND time < (CURRENT_DATE + 1)::timestamp
+                ORDER BY time ASC, id ASC
             """.format(self.tablename))
             exercises = {}
             for row in cursor.fetchall():
@@ -216,10 +759,27 @@ class PostgresDatabaseLogger(BaseLogger, PostgresConnector):
 
         return self.with_connection(get_todays_exercises_command)
 
+    def get_todays_totals(self):
+        def get_todays_totals_command(cursor):
+            cursor.execute("""
+                SELECT user_id, exercise, count(*), sum(reps)
+                FROM {}
+                WHERE time >= CURRENT_DATE::timestamp AND time < (CURRENT_DATE + 1)::timestamp
+                GROUP BY user_id, exercise
+            """.format(self.tablename))
+            totals = {}
+            for row in cursor.fetchall():
+                totals.setdefault(row[0], {})[row[1]] = {
+                    'count': row[2],
+                    'reps': row[3]
+                }
+            return totals
+        return self.with_connection(get_todays_totals_command)
+
     def get_current_winners(self):
         def get_current_winners_command(cursor):
             cursor.execute("""
-                SELECT winner_id, exercise, reps FROM {} ORDER BY time ASC
+                SELECT winner_id, exercise, reps FROM {} ORDER BY time ASC, id ASC
             """.format(self.winners_table))
             exercises = {}
             for row in cursor.fetchall():
@@ -236,24 +796,261 @@ class PostgresDatabaseLogger(BaseLogger, PostgresConnector):
         return self.with_connection(get_current_winners_command)
 
     def add_exercise(self, winner_id, exercise, reps):
-        def add_exercise_command(cursor):
-            cursor.execute("""
-                INSERT INTO {} (winner_id, exercise, reps) VALUES (%s, %s, %s)
-            """.format(self.winners_table), (winner_id, exercise.name, reps))
-        return self.with_connection(add_exercise_command)
+        self.add_exercises([(winner_id, exercise, reps)])
+
+    def add_exercises(self, entries):
+        if len(entries) == 0:
+            return
+        def add_exercises_command(cursor):
+            psycopg2.extras.execute_values(cursor, """
+                INSERT INTO {} (winner_id, exercise, reps) VALUES %s
+            """.format(self.winners_table), [(winner_id, exercise.name, reps)
+                for winner_id, exercise, reps in entries])
+            return True
+        if self.with_connection(add_exercises_command, write=True):
+            for winner_id, _, _ in entries:
+                self.index.record_assignment(winner_id)
 
     def finish_exercise(self, winner_id):
         def finish_exercise_command(cursor):
-            # TODO(mgyucht): don't use RETURNING * when psycopg2 supports it
             cursor.execute("""
-                DELETE FROM {} WHERE winner_id = %s AND time IN
-                    (SELECT time FROM {} WHERE winner_id = %s ORDER BY time ASC LIMIT 1)
-                    RETURNING *
-            """.format(self.winners_table, self.winners_table), (winner_id, winner_id))
+                DELETE FROM {} WHERE id =
+                    (SELECT id FROM {} WHERE winner_id = %s ORDER BY time ASC, id ASC LIMIT 1)
+                    RETURNING winner_id, exercise, reps
+            """.format(self.winners_table, self.winners_table), (winner_id,))
             row = cursor.fetchone()
             if row is not None:
                 return {
                     "exercise": row[1],
                     "reps": row[2]
                 }
-        return self.with_connection(finish_exercise_command)
+        exercise_data = self.with_connection(finish_exercise_command, write=True)
+        if exercise_data is not None:
+            self.index.record_completion(winner_id)
+        return exercise_data
+
+    def close(self):
+        self.logger.info("Database pool stats: %s", self.pool.stats())
+        self.pool.close()
+
+class SqliteDatabaseLogger(BaseLogger):
+    """
+    Logs to a SQLite database file. The database is opened in WAL mode so that readers don't block
+    the writer, and each thread keeps its own connection, since SQLite connections can't be shared
+    between threads. The connections of threads which have finished are closed whenever another
+    connection is opened.
+    """
+    def __init__(self, path, tablename="flexecution", winners_table="winners", busy_timeout=5):
+        super(SqliteDatabaseLogger, self).__init__()
+        self.path = path
+        self.tablename = tablename
+        self.winners_table = winners_table
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        # The statements are formatted once so that each connection's statement cache can reuse
+        # the prepared statements
+        self.insert_exercise_statement = """
+            INSERT INTO {} (user_id, exercise, reps, units, time) VALUES (?, ?, ?, ?, ?)
+        """.format(self.tablename)
+        self.todays_exercises_statement = """
+            SELECT user_id, exercise, reps FROM {}
+            WHERE time >= ? AND time < ?
+            ORDER BY time ASC, id ASC
+        """.format(self.tablename)
+        self.todays_totals_statement = """
+            SELECT user_id, exercise, count(*), sum(reps) FROM {}
+            WHERE time >= ? AND time < ?
+            GROUP BY user_id, exercise
+        """.format(self.tablename)
+        self.insert_winner_statement = """
+            INSERT INTO {} (winner_id, exercise, reps, time) VALUES (?, ?, ?, ?)
+        """.format(self.winners_table)
+        self.current_winners_statement = """
+            SELECT winner_id, exercise, reps FROM {} ORDER BY id ASC
+        """.format(self.winners_table)
+        self.oldest_winner_statement = """
+            SELECT id, exercise, reps FROM {} WHERE winner_id = ? ORDER BY id ASC LIMIT 1
+        """.format(self.winners_table)
+        self.delete_winner_statement = "DELETE FROM {} WHERE id = ?".format(self.winners_table)
+        self.maybe_create_tables()
+        self.rebuild_index()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Transactions are started explicitly in with_connection
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                    check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.prune_connections()
+            with self.connections_lock:
+                self.connections.append((threading.current_thread(), conn))
+        return conn
+
+    def prune_connections(self):
+        """
+        Closes the connections of the threads which have finished, e.g. short-lived worker threads.
+        """
+        with self.connections_lock:
+            finished = [conn for thread, conn in self.connections if not thread.is_alive()]
+            self.connections = [(thread, conn) for thread, conn in self.connections
+                    if thread.is_alive()]
+        for conn in finished:
+            conn.close()
+        return len(finished)
+
+    def with_connection(self, func, write=False):
+        conn = self.connection()
+        cursor = conn.cursor()
+        try:
+            if write:
+                # Take the write lock up front so that a read followed by a write can't race
+                # another writer
+                cursor.execute("BEGIN IMMEDIATE")
+            result = func(cursor)
+            if write:
+                cursor.execute("COMMIT")
+            return result
+        except sqlite3.Error:
+            self.logger.exception("Failure during database access")
+            if write and self.raise_write_errors:
+                raise
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            cursor.close()
+
+    @staticmethod
+    def today_range():
+        """
+        Returns the start and end of the current local day as unix timestamps.
+        """
+        today = datetime.date.today()
+        start = time.mktime(today.timetuple())
+        end = time.mktime((today + datetime.timedelta(days=1)).timetuple())
+        return start, end
+
+    def maybe_create_tables(self):
+        def create_tables_command(cursor):
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS {} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    exercise TEXT NOT NULL,
+                    reps INTEGER NOT NULL,
+                    units TEXT NOT NULL,
+                    time REAL NOT NULL
+                )
+            """.format(self.tablename))
+            cursor.execute("CREATE INDEX IF NOT EXISTS {0}_time_idx ON {0} (time)".format(
+                self.tablename))
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS {0}_user_id_time_idx ON {0} (user_id, time)
+            """.format(self.tablename))
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS {} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    winner_id TEXT NOT NULL,
+                    exercise TEXT NOT NULL,
+                    reps INTEGER NOT NULL,
+                    time REAL NOT NULL
+                )
+            """.format(self.winners_table))
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS {0}_winner_id_idx ON {0} (winner_id, id)
+            """.format(self.winners_table))
+        self.with_connection(create_tables_command, write=True)
+
+    def log_exercise(self, user_id, exercise, reps):
+        self.log_exercises([(user_id, exercise, reps)])
+
+    def log_exercises(self, entries):
+        if len(entries) == 0:
+            return
+        now = time.time()
+        def log_exercises_command(cursor):
+            cursor.executemany(self.insert_exercise_statement, [
+                (user_id, exercise.name, reps, exercise.units, now)
+                for user_id, exercise, reps in entries])
+            return True
+        if self.with_connection(log_exercises_command, write=True):
+            for user_id, exercise, _ in entries:
+                self.index.record_exercise(user_id, exercise.name)
+
+    def get_todays_exercises(self):
+        def get_todays_exercises_command(cursor):
+            cursor.execute(self.todays_exercises_statement, self.today_range())
+            exercises = {}
+            for row in cursor.fetchall():
+                exercises.setdefault(row[0], []).append({
+                    'exercise': row[1],
+                    'reps': row[2]
+                })
+            return exercises
+        return self.with_connection(get_todays_exercises_command)
+
+    def get_todays_totals(self):
+        def get_todays_totals_command(cursor):
+            cursor.execute(self.todays_totals_statement, self.today_range())
+            totals = {}
+            for row in cursor.fetchall():
+                totals.setdefault(row[0], {})[row[1]] = {
+                    'count': row[2],
+                    'reps': row[3]
+                }
+            return totals
+        return self.with_connection(get_todays_totals_command)
+
+    def get_current_winners(self):
+        def get_current_winners_command(cursor):
+            cursor.execute(self.current_winners_statement)
+            exercises = {}
+            for row in cursor.fetchall():
+                exercises.setdefault(row[0], []).append({
+                    'exercise': row[1],
+                    'reps': row[2]
+                })
+            return exercises
+        return self.with_connection(get_current_winners_command)
+
+    def add_exercise(self, winner_id, exercise, reps):
+        self.add_exercises([(winner_id, exercise, reps)])
+
+    def add_exercises(self, entries):
+        if len(entries) == 0:
+            return
+        now = time.time()
+        def add_exercises_command(cursor):
+            cursor.executemany(self.insert_winner_statement, [
+                (winner_id, exercise.name, reps, now) for winner_id, exercise, reps in entries])
+            return True
+        if self.with_connection(add_exercises_command, write=True):
+            for winner_id, _, _ in entries:
+                self.index.record_assignment(winner_id)
+
+    def finish_exercise(self, winner_id):
+        def finish_exercise_command(cursor):
+            cursor.execute(self.oldest_winner_statement, (winner_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(self.delete_winner_statement, (row[0],))
+            return {
+                "exercise": row[1],
+                "reps": row[2]
+            }
+        exercise_data = self.with_connection(finish_exercise_command, write=True)
+        if exercise_data is not None:
+            self.index.record_completion(winner_id)
+        return exercise_data
+
+    def close(self):
+        with self.connections_lock:
+            connections, self.connections = self.connections, []
+        for _, conn in connections:
+            conn.close()
+        self.local = threading.local()
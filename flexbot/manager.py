@@ -1,8 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
+import threading
 
 from .constants import Constants
-from .user import User
+from .engines import get_selection_engine
+from .presence import PresenceCache
+from .profiles import UserProfileCache
+from .snapshot import DaySnapshot
+from .user import from_json
 from .util import NoEligibleUsersException
 
 class UserManager(object):
@@ -11,10 +17,36 @@ class UserManager(object):
         self.configuration = configuration
         self.workout_logger = workout_logger
         self.logger = logging.getLogger(__name__)
+        # self.users is never modified in place: updates build a new hash and swap it in, so that
+        # readers can iterate it while it is being updated. The lock keeps updates from racing.
         self.users = {}
+        self.users_lock = threading.RLock()
+        self.listeners = []
         self.current_winners = {}
+        self.presence_cache = PresenceCache(self.configuration.presence_ttl())
+        self.engine = get_selection_engine(self.configuration)
+        self.profile_cache = None
+        self.cached_profiles = {}
+        if self.configuration.user_cache_path() is not None:
+            self.profile_cache = UserProfileCache(self.configuration.user_cache_path(),
+                    self.configuration.user_cache_max_age())
+            self.cached_profiles = self.profile_cache.load()
         self.fetch_users()
 
+    def subscribe(self, listener):
+        """
+        Calls listener() whenever users may have become eligible: when members join the channel,
+        and when a winner acknowledges their exercise.
+        """
+        self.listeners.append(listener)
+
+    def notify_listeners(self):
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception:
+                self.logger.exception("User listener failed")
+
     def stats(self, user_id_list=[]):
         # Write to the command console today's breakdown
         s = "Today's stats:\n"
@@ -28,12 +60,19 @@ class UserManager(object):
         s += headerline
         s += "-" * len(headerline) + "\n"
 
+        # One aggregate query for the whole table
+        totals = self.workout_logger.get_todays_totals() or {}
         user_ids = user_id_list if len(user_id_list) > 0 else list(self.users.keys())
         for user_id in user_ids:
+            user_totals = totals.get(user_id, {})
             s += self.get_username(user_id).ljust(15)
             for exercise in exercises:
-                s += str(self.exercise_count_for_user(user_id, exercise)).ljust(len(exercise.name) + 2)
-            s += str(self.total_exercises_for_user(user_id))
+                exercise_count = user_totals.get(exercise.name, {}).get('count', 0)
+                s += str(exercise_count).ljust(len(exercise.name) + 2)
+            total_exercises = sum(t['count'] for t in user_totals.values())
+            if self.configuration.aggregate_exercises():
+                total_exercises += self.workout_logger.pending_for(user_id)
+            s += str(total_exercises)
             s += "\n"
 
         s += "```"
@@ -45,33 +84,200 @@ class UserManager(object):
 
     def fetch_users(self):
         """
-        Fetches all users in the channel
+        Fetches all users in the channel, and forgets users who have left it
         """
         # Check for new members
         user_ids = self.api.get_members()
+        with self.users_lock:
+            users = dict(self.users)
+            new_user_ids = [user_id for user_id in user_ids if user_id not in users]
+            uncached_user_ids = [user_id for user_id in new_user_ids
+                    if not self.has_fresh_profile(user_id)]
 
-        for user_id in user_ids:
-            if user_id not in self.users:
-                user_json = self.api.get_user_info(user_id)
-                self.logger.info("Adding user with json: %s", json.dumps(user_json))
-                username = user_json['name']
-                firstname = user_json['profile'].get('first_name', '')
-                lastname = user_json['profile'].get('last_name', '')
-                self.users[user_id] = User(user_id, username, firstname, lastname)
+            if self.configuration.user_sync_mode() == Constants.USER_SYNC_BULK and \
+                    len(uncached_user_ids) > 0:
+                self.sync_users(user_ids)
+                return
+
+            for user_id in new_user_ids:
+                users[user_id] = self.get_user(user_id)
+
+            member_ids = set(user_ids)
+            removed = [user_id for user_id in users if user_id not in member_ids]
+            for user_id in removed:
+                self.logger.info("Removing user %s who left the channel", user_id)
+                del users[user_id]
+            self.users = users
+            self.update_engine(new_user_ids, removed)
+        if len(new_user_ids) > 0:
+            self.notify_listeners()
+
+    def sync_users(self, user_ids):
+        """
+        Brings the users in line with the given channel members by paging through the workspace
+        directory once, rather than calling users.info once per member. Returns the ids of the
+        added, updated and removed users.
+        """
+        member_ids = set(user_ids)
+        directory = {}
+        for user_json in self.api.get_users(self.configuration.user_sync_page_size()):
+            if user_json['id'] in member_ids:
+                directory[user_json['id']] = from_json(user_json['id'], user_json)
+        # Members missing from the directory are looked up individually
+        for user_id in member_ids:
+            if user_id not in directory:
+                directory[user_id] = self.get_user(user_id)
+
+        with self.users_lock:
+            users = dict(self.users)
+            added, updated = [], []
+            for user_id, user in directory.items():
+                if user_id not in users:
+                    added.append(user_id)
+                elif not users[user_id].same_profile(user):
+                    updated.append(user_id)
+            removed = [user_id for user_id in users if user_id not in member_ids]
+            self.logger.info("User sync: %d added, %d updated, %d removed", len(added),
+                    len(updated), len(removed))
+
+            for user_id in added + updated:
+                users[user_id] = directory[user_id]
+            for user_id in removed:
+                del users[user_id]
+            self.users = users
+            self.update_engine(added, removed)
+        self.cache_profiles(list(directory.values()))
+        if self.profile_cache is not None and len(removed) > 0:
+            self.profile_cache.remove(removed)
+            for user_id in removed:
+                self.cached_profiles.pop(user_id, None)
+        if len(added) > 0:
+            self.notify_listeners()
+        return added, updated, removed
+
+    def has_fresh_profile(self, user_id):
+        try:
+            _, updated_at = self.cached_profiles[user_id]
+            return not self.profile_cache.is_stale(updated_at)
+        except KeyError:
+            return False
+
+    def get_user(self, user_id):
+        """
+        Returns the user with the given id, from the profile cache if it holds a fresh copy and
+        from the Slack API otherwise.
+        """
+        if self.has_fresh_profile(user_id):
+            return self.cached_profiles[user_id][0]
+        return self.fetch_user_info(user_id)
+
+    def fetch_user_info(self, user_id):
+        user_json = self.api.get_user_info(user_id)
+        self.logger.info("Adding user with json: %s", json.dumps(user_json))
+        user = from_json(user_id, user_json)
+        self.cache_profiles([user])
+        return user
+
+    def cache_profiles(self, users):
+        if self.profile_cache is not None and len(users) > 0:
+            updated_at = self.profile_cache.store(users)
+            for user in users:
+                self.cached_profiles[user.id] = (user, updated_at)
+
+    def refresh_stale_profiles(self):
+        """
+        Looks up again every channel member whose cached profile has gone stale.
+        """
+        if self.profile_cache is None:
+            return
+        stale_user_ids = [user_id for user_id in list(self.users.keys())
+                if not self.has_fresh_profile(user_id)]
+        if self.configuration.user_sync_mode() == Constants.USER_SYNC_BULK and \
+                len(stale_user_ids) > 0:
+            self.sync_users(self.api.get_members())
+            return
+        refreshed = {}
+        for user_id in stale_user_ids:
+            try:
+                refreshed[user_id] = self.fetch_user_info(user_id)
+            except Exception:
+                self.logger.exception("Failed to refresh the profile of %s", user_id)
+        with self.users_lock:
+            users = dict(self.users)
+            # Users who left the channel while their profile was looked up stay gone
+            for user_id, user in refreshed.items():
+                if user_id in users:
+                    users[user_id] = user
+            self.users = users
 
     def fetch_active_users(self):
         """
-        Returns a list of all active users in the channel
+        Returns a list of all active users in the channel. Presence which was looked up less than
+        presence_ttl seconds ago is reused rather than requested again.
         """
         self.fetch_users()
-        active_users = []
-        for user_id in self.users:
-            if self.api.is_active(user_id):
-                active_users.append(user_id)
-        return active_users
+        user_ids = list(self.users.keys())
+        self.presence_cache.retain(user_ids)
+
+        presence = {}
+        stale_user_ids = []
+        for user_id in user_ids:
+            active = self.presence_cache.get(user_id)
+            if active is None:
+                stale_user_ids.append(user_id)
+            else:
+                presence[user_id] = active
+
+        for user_id, active in self.fetch_presence(stale_user_ids).items():
+            self.presence_cache.set(user_id, active)
+            presence[user_id] = active
+        self.logger.debug("Presence cache stats: %s", self.presence_cache.stats())
+
+        return [user_id for user_id in user_ids if presence.get(user_id, False)]
+
+    def fetch_presence(self, user_ids):
+        """
+        Looks up the presence of each of the given users, issuing at most presence_max_workers
+        requests at a time. Returns a hash from user id to True iff the user is active. Users whose
+        lookup fails (e.g. because the request timed out) are left out of the hash.
+        """
+        if len(user_ids) == 0:
+            return {}
+        max_workers = min(self.configuration.presence_max_workers(), len(user_ids))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [(user_id, executor.submit(self.api.is_active, user_id))
+                    for user_id in user_ids]
+            presence = {}
+            for user_id, future in futures:
+                try:
+                    presence[user_id] = bool(future.result())
+                except Exception:
+                    self.logger.warning("Presence lookup failed for %s", user_id, exc_info=True)
+            return presence
+        finally:
+            executor.shutdown(wait=False)
+
+    def invalidate_presence(self, user_id=None):
+        """
+        Forgets the cached presence of the given user (or of everyone if no user is given), so that
+        it is looked up again the next time eligible users are computed. Intended to be called when
+        a presence change event is received.
+        """
+        self.presence_cache.invalidate(user_id)
 
     def clear_users(self):
-        self.users = {}
+        with self.users_lock:
+            self.update_engine([], list(self.users.keys()))
+            self.users = {}
+
+    def update_engine(self, added, removed):
+        """
+        Keeps the selection engine's users in step with the channel members.
+        """
+        if self.engine is not None:
+            self.engine.remove_users(removed)
+            self.engine.add_users(added)
 
     # --------------------------------------
     # Acknowledgment mode methods
@@ -81,10 +287,20 @@ class UserManager(object):
         return self.workout_logger.get_current_winners()
 
     def mark_winner(self, user_id, exercise, exercise_reps):
+        self.mark_winners([user_id], exercise, exercise_reps)
+
+    def mark_winners(self, winner_ids, exercise, exercise_reps):
+        """
+        Assigns the exercise to every winner, or logs it for them if acknowledgment is disabled,
+        in a single logger operation.
+        """
+        entries = [(winner_id, exercise, exercise_reps) for winner_id in winner_ids]
         if self.configuration.enable_acknowledgment():
-            self.workout_logger.add_exercise(user_id, exercise, exercise_reps)
+            self.workout_logger.add_exercises(entries)
         else:
-            self.add_exercise_for_user(user_id, exercise, exercise_reps)
+            self.logger.debug("Users {} completed {} {} of {}".format(", ".join(winner_ids),
+                exercise_reps, exercise.units, exercise.name))
+            self.workout_logger.log_exercises(entries)
 
     def acknowledge_winner(self, user_id):
         if self.configuration.enable_acknowledgment():
@@ -94,6 +310,7 @@ class UserManager(object):
             else:
                 exercise = self.get_exercise_by_name(exercise_data['exercise'])
                 self.add_exercise_for_user(user_id, exercise, exercise_data['reps'])
+                self.notify_listeners()
                 return Constants.ACKNOWLEDGE_SUCCEEDED
         else:
             return Constants.ACKNOWLEDGE_DISABLED
@@ -135,18 +352,38 @@ class UserManager(object):
     # Exercise management
     # --------------------------------------
 
-    def get_eligible_users(self):
+    def get_day_snapshot(self):
+        """
+        Reads today's exercises and the pending assignments from the workout logger once. Pass the
+        result to the methods below to avoid reading them again for every user.
+        """
+        return DaySnapshot.from_logger(self.workout_logger, self.configuration.aggregate_exercises())
+
+    def get_eligible_users(self, snapshot=None, active_users=None):
         """
         Get the current eligible users; throws NoEligibleUsersException if there are none. These are
         users who are online and have not yet completed their maximum daily limit of exercises.
+        Pass active_users, as returned by fetch_active_users, to reuse presence looked up earlier.
         """
-        active_users = self.fetch_active_users()
+        if snapshot is None:
+            snapshot = self.get_day_snapshot()
+        if active_users is None:
+            active_users = self.fetch_active_users()
+        else:
+            # Users who have left the channel since are no longer eligible
+            users = self.users
+            active_users = [user_id for user_id in active_users if user_id in users]
+        if self.engine is not None:
+            eligible_users = self.engine.eligible_users(active_users, snapshot)
+            if len(eligible_users) == 0:
+                raise NoEligibleUsersException()
+            return eligible_users
 
-        winner_ids = list(self.get_current_winners().keys())
+        winner_ids = set(snapshot.winner_ids())
         self.logger.debug("Current winners by id: %s", ", ".join(winner_ids))
         eligible_users = []
         for user_id in active_users:
-            total_exercises = self.total_exercises_for_user(user_id)
+            total_exercises = self.total_exercises_for_user(user_id, snapshot)
             if total_exercises < self.configuration.user_exercise_limit():
                 # If the user has not completed all exercises for the day, we add them if the
                 # aggregate_exercises flag is set, or if they haven't yet been assigned an exercise.
@@ -159,26 +396,26 @@ class UserManager(object):
 
         return eligible_users
 
-    def total_exercises_for_user(self, user_id):
-        exercise_count = len(self.workout_logger.get_todays_exercises().get(user_id, []))
+    def total_exercises_for_user(self, user_id, snapshot=None):
+        """
+        Counts from the snapshot if one is given, and from the logger's counters otherwise.
+        """
+        if snapshot is not None:
+            return snapshot.total_exercises(user_id)
+        total = self.workout_logger.total_for(user_id)
         if self.configuration.aggregate_exercises():
-            assigned_exercises = self.workout_logger.get_current_winners().get(user_id, [])
-            exercise_count += len(assigned_exercises)
-        return exercise_count
+            total += self.workout_logger.pending_for(user_id)
+        return total
 
-    def exercise_count_for_user(self, user_id, exercise):
-        exercises = self.workout_logger.get_todays_exercises()
-        try:
-            filtered_exercises = [e for e in exercises[user_id] if e['exercise'] == exercise.name]
-            return len(filtered_exercises)
-        except KeyError:
-            return 0
+    def exercise_count_for_user(self, user_id, exercise, snapshot=None):
+        if snapshot is not None:
+            return snapshot.exercise_count(user_id, exercise.name)
+        return self.workout_logger.count_for(user_id, exercise)
 
-    def user_has_done_exercise(self, user_id, exercise):
-        return self.exercise_count_for_user(user_id, exercise) > 0
+    def user_has_done_exercise(self, user_id, exercise, snapshot=None):
+        return self.exercise_count_for_user(user_id, exercise, snapshot) > 0
 
     def add_exercise_for_user(self, user_id, exercise, exercise_reps):
         self.logger.debug("User {} completed {} {} of {}".format(user_id, exercise_reps, exercise.units,
             exercise.name))
         self.workout_logger.log_exercise(user_id, exercise, exercise_reps)
-
@@ -0,0 +1,65 @@
+import threading
+import time
+
+class PresenceCache(object):
+    """
+    Remembers whether each user was active for up to ttl seconds after the lookup. A ttl of zero
+    disables caching entirely.
+    """
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Returns True or False if the presence of the user is cached and fresh, otherwise None.
+        """
+        with self.lock:
+            try:
+                active, fetched_at = self.entries[user_id]
+            except KeyError:
+                self.misses += 1
+                return None
+            if time.time() - fetched_at >= self.ttl:
+                del self.entries[user_id]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return active
+
+    def set(self, user_id, active):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[user_id] = (active, time.time())
+
+    def invalidate(self, user_id=None):
+        """
+        Drops the cached presence of the given user, or of every user if no user is given.
+        """
+        with self.lock:
+            if user_id is None:
+                self.entries = {}
+            else:
+                self.entries.pop(user_id, None)
+
+    def retain(self, user_ids):
+        """
+        Evicts every user who is not in user_ids, e.g. because they have left the channel.
+        """
+        user_ids = set(user_ids)
+        with self.lock:
+            for user_id in list(self.entries.keys()):
+                if user_id not in user_ids:
+                    del self.entries[user_id]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries)
+            }
@@ -0,0 +1,80 @@
+import logging
+import sqlite3
+import time
+
+from .user import User
+
+class UserProfileCache(object):
+    """
+    Keeps the profiles of channel members in a SQLite file, keyed by Slack user id, so that a
+    restart does not have to look every member up again. Profiles older than max_age seconds are
+    considered stale.
+    """
+    def __init__(self, path, max_age):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_age = max_age
+        self.maybe_create_table()
+
+    def with_connection(self, func):
+        conn = sqlite3.connect(self.path)
+        try:
+            result = func(conn.cursor())
+            conn.commit()
+            return result
+        except sqlite3.Error:
+            self.logger.exception("Failure accessing the user profile cache")
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def maybe_create_table(self):
+        def create_table_command(cursor):
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    user_id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    firstname TEXT NOT NULL,
+                    lastname TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+        self.with_connection(create_table_command)
+
+    def load(self):
+        """
+        Returns a hash from user id to a (User, updated_at) pair for every cached profile.
+        """
+        def load_command(cursor):
+            cursor.execute("""
+                SELECT user_id, username, firstname, lastname, updated_at FROM user_profiles
+            """)
+            profiles = {}
+            for row in cursor.fetchall():
+                profiles[row[0]] = (User(row[0], row[1], row[2], row[3]), row[4])
+            return profiles
+        return self.with_connection(load_command) or {}
+
+    def store(self, users):
+        """
+        Saves the given users, stamping them with the current time. Returns the stamp.
+        """
+        updated_at = time.time()
+        def store_command(cursor):
+            cursor.executemany("""
+                INSERT OR REPLACE INTO user_profiles
+                    (user_id, username, firstname, lastname, updated_at)
+                VALUES
+                    (?, ?, ?, ?, ?)
+            """, [(u.id, u.username, u.firstname, u.lastname, updated_at) for u in users])
+        self.with_connection(store_command)
+        return updated_at
+
+    def remove(self, user_ids):
+        def remove_command(cursor):
+            cursor.executemany("DELETE FROM user_profiles WHERE user_id = ?",
+                    [(user_id,) for user_id in user_ids])
+        self.with_connection(remove_command)
+
+    def is_stale(self, updated_at):
+        return time.time() - updated_at >= self.max_age
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+
+from .util import NoEligibleUsersException
+
+class ChannelMetrics(object):
+    """
+    Counters and timings of one channel's selection cycle.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.timings = {}
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            count, total, maximum = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def snapshot(self):
+        with self.lock:
+            timings = {}
+            for name, (count, total, maximum) in self.timings.items():
+                timings[name] = {
+                    'count': count,
+                    'avg': total / count,
+                    'max': maximum
+                }
+            return {
+                'counts': dict(self.counts),
+                'timings': timings
+            }
+
+class ChannelRunner(object):
+    """
+    Drives one channel's workout cycle on a shared TimerScheduler: announce an exercise, wait for
+    its start time, assign it, and start over. Nothing blocks between the steps, so one scheduler
+    can run many channels. Outside office hours the next step is timed for the start of office
+    hours, and wake() runs it straight away, e.g. once the configuration has been reloaded or
+    users may have become eligible.
+    """
+    NO_ELIGIBLE_USERS_DELAY = 5 * 60
+
+    def __init__(self, name, configuration, slack_api, user_manager, bot, scheduler):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.configuration = configuration
+        self.slack_api = slack_api
+        self.user_manager = user_manager
+        self.bot = bot
+        self.scheduler = scheduler
+        self.metrics = ChannelMetrics()
+        self.was_office_hours = False
+        self.timer = None
+        self.lock = threading.RLock()
+
+    def start(self):
+        self.configuration.subscribe(self.wake)
+        self.user_manager.subscribe(self.wake)
+        self.schedule(0, self.step)
+
+    def schedule(self, delay, callback, *args):
+        with self.lock:
+            self.timer = self.scheduler.schedule(delay, self.run_guarded, callback, *args)
+
+    def next_step_time(self):
+        """
+        Returns when the next step of the cycle is due, as a unix timestamp.
+        """
+        with self.lock:
+            return self.timer.when if self.timer is not None else None
+
+    def wake(self):
+        """
+        Runs the next step now if the channel is waiting, for office hours or for eligible users,
+        rather than for an announced exercise. Returns True iff the step was brought forward.
+        """
+        with self.lock:
+            # Cancelling fails if the step has already started, in which case it will schedule
+            # the following step itself
+            if self.timer is None or self.timer.args[0] != self.step or not self.timer.cancel():
+                return False
+            self.logger.debug("[%s] Woken up", self.name)
+            self.metrics.increment('wakeups')
+            self.schedule(0, self.step)
+            return True
+
+    def run_guarded(self, callback, *args):
+        """
+        Runs a step of the cycle. A step which fails is retried later, instead of ending the cycle.
+        """
+        start = time.time()
+        try:
+            callback(*args)
+        except NoEligibleUsersException:
+            self.logger.info("[%s] No eligible users currently, waiting 5 minutes", self.name)
+            self.metrics.increment('no_eligible_users')
+            self.schedule(self.NO_ELIGIBLE_USERS_DELAY, self.step)
+        except Exception:
+            self.logger.exception("[%s] Workout step failed, retrying in 5 minutes", self.name)
+            self.metrics.increment('errors')
+            self.schedule(self.NO_ELIGIBLE_USERS_DELAY, self.step)
+        finally:
+            self.metrics.observe(callback.__name__, time.time() - start)
+
+    def step(self):
+        is_office_hours = self.bot.is_office_hours()
+        was_office_hours = self.was_office_hours
+        self.was_office_hours = is_office_hours
+        if is_office_hours:
+            # Clear the previous day's history if this is the first workout of the day
+            if not was_office_hours:
+                self.logger.debug("[%s] Clearing users", self.name)
+                self.user_manager.clear_users()
+
+            exercise, reps, mins_to_exercise, active_users = \
+                    self.bot.select_exercise_and_start_time()
+            self.metrics.increment('announcements')
+            self.schedule(mins_to_exercise * 60, self.assign, exercise, reps, active_users)
+        else:
+            # Show some stats if the final workout has just passed
+            if was_office_hours:
+                self.slack_api.post_flex_message(self.user_manager.stats())
+            delay = self.bot.seconds_until_office_hours()
+            self.logger.debug("[%s] Waiting %d seconds for office hours", self.name, delay)
+            self.schedule(delay, self.step)
+
+    def assign(self, exercise, reps, active_users=None):
+        winners = self.bot.assign_exercise(exercise, reps, active_users)
+        self.metrics.increment('assignments')
+        self.metrics.increment('winners', len(winners))
+        self.schedule(0, self.step)
@@ -0,0 +1,67 @@
+class WeightedSampler(object):
+    """
+    Draws items without replacement, each with probability proportional to its integer weight.
+    The weights are kept in a Fenwick tree, so each draw takes O(log n) time instead of building a
+    list with one entry per unit of weight. Items with a weight of zero or less are never drawn.
+    """
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self.weights = [max(0, int(weight)) for weight in weights]
+        size = len(self.items)
+        # tree[i] holds the sum of the weights of items (i - lowbit(i), i], counting from 1
+        self.tree = [0] + self.weights
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(self.weights)
+        self.top_bit = 1
+        while self.top_bit * 2 <= size:
+            self.top_bit *= 2
+
+    def find(self, target):
+        """
+        Returns the index of the item whose weight covers target, i.e. the first item for which the
+        sum of the weights up to and including it exceeds target.
+        """
+        position = 0
+        bit = self.top_bit
+        while bit > 0:
+            next_position = position + bit
+            if next_position < len(self.tree) and self.tree[next_position] <= target:
+                position = next_position
+                target -= self.tree[next_position]
+            bit //= 2
+        return position
+
+    def remove(self, index):
+        weight = self.weights[index]
+        self.weights[index] = 0
+        self.total -= weight
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] -= weight
+            i += i & -i
+
+    def draw(self, rng):
+        """
+        Draws one item using the random number generator rng and removes it from the sampler.
+        Returns None once every item with a positive weight has been drawn.
+        """
+        if self.total <= 0:
+            return None
+        index = self.find(rng.randrange(self.total))
+        self.remove(index)
+        return self.items[index]
+
+    def sample(self, rng, count):
+        """
+        Draws up to count distinct items.
+        """
+        drawn = []
+        while len(drawn) < count:
+            item = self.draw(rng)
+            if item is None:
+                break
+            drawn.append(item)
+        return drawn
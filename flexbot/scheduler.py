@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+class Timer(object):
+    """
+    A callback due at a point in time. Cancelled timers stay in the scheduler's heap until they
+    reach the top, where they are dropped without running.
+    """
+    def __init__(self, when, sequence, callback, args):
+        self.when = when
+        self.sequence = sequence
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.started = False
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """
+        Cancels the timer. Returns False if it was too late, because the callback has started.
+        """
+        with self.lock:
+            if self.started:
+                return False
+            self.cancelled = True
+            return True
+
+    def claim(self):
+        """
+        Marks the callback as started, unless the timer has been cancelled.
+        """
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.started = True
+            return True
+
+    def __lt__(self, other):
+        return (self.when, self.sequence) < (other.when, other.sequence)
+
+class TimerScheduler(object):
+    """
+    Runs callbacks at their due time. One thread waits for the earliest timer in a heap and hands
+    due callbacks to a pool of max_workers threads, so that many timers can be pending without a
+    thread blocked in sleep for each.
+    """
+    def __init__(self, max_workers=4):
+        self.logger = logging.getLogger(__name__)
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stopping = False
+        self.thread = None
+
+    def schedule(self, delay, callback, *args):
+        """
+        Runs callback(*args) after delay seconds. Returns a Timer, which can be cancelled.
+        """
+        return self.schedule_at(time.time() + delay, callback, *args)
+
+    def schedule_at(self, when, callback, *args):
+        """
+        Runs callback(*args) once the clock reaches when, a unix timestamp.
+        """
+        with self.condition:
+            timer = Timer(when, next(self.sequence), callback, args)
+            heapq.heappush(self.heap, timer)
+            if self.heap[0] is timer:
+                # The scheduler thread is waiting for a later timer
+                self.condition.notify_all()
+            return timer
+
+    def pending(self):
+        with self.condition:
+            return len([timer for timer in self.heap if not timer.cancelled])
+
+    def next_fire_time(self):
+        """
+        Returns when the earliest pending timer is due, or None if there are no pending timers.
+        """
+        with self.condition:
+            self.drop_cancelled()
+            return self.heap[0].when if self.heap else None
+
+    def drop_cancelled(self):
+        while self.heap and self.heap[0].cancelled:
+            heapq.heappop(self.heap)
+
+    def run(self):
+        with self.condition:
+            while not self.stopping:
+                self.drop_cancelled()
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                delay = self.heap[0].when - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                timer = heapq.heappop(self.heap)
+                self.executor.submit(self.fire, timer)
+
+    def fire(self, timer):
+        if not timer.claim():
+            return
+        try:
+            timer.callback(*timer.args)
+        except Exception:
+            self.logger.exception("Scheduled callback %s failed", timer.callback)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, drain=True):
+        """
+        Stops running timers. Pending timers are dropped; if drain is True, waits for the callbacks
+        which are already running to finish.
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait=drain)
@@ -1,101 +1,189 @@
 import cherrypy
 import logging
-import threading
 
 from .api import FlexbotApiClient
-from .bot import Bot, NoEligibleUsersException
-from .logger_factory import LoggerFactory
+from .bot import Bot
+from .configurators import ChannelConfigurationProvider
+from .logger_factory import LoggerPool
 from .manager import UserManager
-from . import util
-from .web import FlexbotWebServer
+from .runner import ChannelRunner
+from .scheduler import TimerScheduler
+from .transport import SlackSession
+from .web import FlexbotWebServer, MultiChannelWebServer
+from .workers import CommandExecutor
+
+class Channel(object):
+    """
+    The components serving one channel.
+    """
+    def __init__(self, configuration, slack_api, workout_logger, user_manager, bot, web_server):
+        self.configuration = configuration
+        self.slack_api = slack_api
+        self.workout_logger = workout_logger
+        self.user_manager = user_manager
+        self.bot = bot
+        self.web_server = web_server
+        self.runner = None
+
+    def name(self):
+        return self.configuration.channel_name()
 
 class Server(object):
+    """
+    Runs the bot, and the webserver it takes commands from. If the configuration has a channels
+    option, the bot is run in each of the channels it lists, each with its own options on top of
+    the shared ones; the channels share one Slack session and channel directory, and channels
+    with the same logger settings share a logger, in which each channel's exercises are kept
+    apart.
+    """
     def __init__(self, configuration, workout_logger=None, **kwargs):
         self.logger = logging.getLogger(__name__)
         self.configuration = configuration
+        self.logger_pool = LoggerPool()
+        self.command_executor = None
+        if configuration.async_commands_on():
+            # The channels share one pool, so the number of commands in progress is bounded
+            self.command_executor = CommandExecutor(configuration.async_commands_max_workers(),
+                    configuration.async_commands_queue_size())
+        channel_configurations = [ChannelConfigurationProvider(configuration, i)
+                for i in range(len(configuration.channel_configurations()))]
+        # The first channel is configured by the shared options when there is no channels option
+        primary_configuration = channel_configurations[0] if channel_configurations \
+                else configuration
+        self.shares_loggers = len(channel_configurations) > 1
+
         if workout_logger == None:
-            logger_factory = LoggerFactory(self.configuration)
-            self.workout_logger = logger_factory.get_logger()
+            self.workout_logger = self.get_channel_logger(primary_configuration, prefixed=False)
         else:
             self.workout_logger = workout_logger
 
         if 'slack_api' in kwargs:
             self.slack_api = kwargs['slack_api']
         else:
-            self.slack_api = FlexbotApiClient(configuration, token=self.configuration.slack_token())
+            self.slack_api = self.make_slack_api(primary_configuration)
 
         if 'user_manager' in kwargs:
             self.user_manager = kwargs['user_manager']
         else:
-            self.user_manager = UserManager(self.slack_api, self.configuration, self.workout_logger)
+            self.user_manager = UserManager(self.slack_api, primary_configuration,
+                    self.workout_logger)
 
         if 'bot' in kwargs:
             self.bot = kwargs['bot']
         else:
-            self.bot = Bot(self.slack_api, self.configuration, self.user_manager)
+            self.bot = Bot(self.slack_api, primary_configuration, self.user_manager)
 
         if 'web_server' in kwargs:
             self.web_server = kwargs['web_server']
         else:
-            self.web_server = FlexbotWebServer(self.user_manager, self.user_manager, configuration)
+            self.web_server = FlexbotWebServer(self.user_manager, self.user_manager,
+                    primary_configuration, api=self.slack_api, executor=self.command_executor)
+
+        self.channels = [Channel(primary_configuration, self.slack_api, self.workout_logger,
+            self.user_manager, self.bot, self.web_server)]
+        for channel_configuration in channel_configurations[1:]:
+            self.channels.append(self.make_channel(channel_configuration))
+        if len(self.channels) > 1:
+            self.web_server = MultiChannelWebServer(
+                    [(channel.name(), channel.web_server) for channel in self.channels])
+        self.scheduler = None
+
+    def make_slack_api(self, configuration):
+        if len(getattr(self, 'channels', [])) > 0:
+            # Share the connections, rate limits and channel directory of the first channel
+            return FlexbotApiClient(configuration, token=configuration.slack_token(),
+                    timeout=configuration.slack_timeout(), session=self.slack_api.session,
+                    channel_directory=self.slack_api.channel_directory)
+        return FlexbotApiClient(configuration, token=configuration.slack_token(),
+                timeout=configuration.slack_timeout(),
+                session=SlackSession(configuration.slack_api_url(),
+                    rate_limits=configuration.slack_rate_limits(),
+                    max_retries=configuration.slack_max_retries(),
+                    pool_size=configuration.presence_max_workers(),
+                    connect_timeout=configuration.slack_connect_timeout()))
+
+    def get_channel_logger(self, configuration, prefixed=True):
+        # The first channel keeps the plain user ids, so that it still sees the exercises logged
+        # before there were several channels
+        if self.shares_loggers:
+            return self.logger_pool.get_logger(configuration, configuration.channel_name(),
+                    prefixed)
+        return self.logger_pool.get_logger(configuration)
+
+    def make_channel(self, configuration):
+        slack_api = self.make_slack_api(configuration)
+        workout_logger = self.get_channel_logger(configuration)
+        user_manager = UserManager(slack_api, configuration, workout_logger)
+        bot = Bot(slack_api, configuration, user_manager)
+        web_server = FlexbotWebServer(user_manager, user_manager, configuration, api=slack_api,
+                executor=self.command_executor)
+        return Channel(configuration, slack_api, workout_logger, user_manager, bot, web_server)
 
     def start(self):
-        self.logger.debug('Starting workout loop')
-        workout_loop_thread = threading.Thread(target=self.workout_loop)
-        workout_loop_thread.daemon = False
-        workout_loop_thread.start()
+        self.start_channels()
+        if isinstance(self.slack_api, FlexbotApiClient):
+            self.slack_api.channel_directory.start()
+        if self.configuration.user_cache_path() is not None:
+            self.logger.debug('Starting profile refresh')
+            self.schedule_profile_refresh()
         # Start the webserver
         self.logger.debug('Starting webserver')
         cherrypy.config.update({'server.socket_host': '0.0.0.0',
                                 'server.socket_port': self.configuration.webserver_port(),
                                 'log.screen': True,
                                })
+        cherrypy.engine.subscribe('stop', self.shutdown)
         cherrypy.quickstart(self.web_server)
 
-    def workout_loop(self):
+    def start_channels(self):
         """
-        Runs the workout bot in an infinite loop.
+        Runs every channel's workout cycle on one shared scheduler.
         """
-        was_office_hours = False
+        self.logger.debug('Starting %d channel(s)', len(self.channels))
+        self.scheduler = TimerScheduler(self.configuration.scheduler_max_workers()).start()
+        for channel in self.channels:
+            channel.runner = ChannelRunner(channel.name(), channel.configuration,
+                    channel.slack_api, channel.user_manager, channel.bot, self.scheduler)
+            channel.runner.start()
 
-        while True:
-            was_office_hours = self.workout_step(was_office_hours)
+    def schedule_profile_refresh(self):
+        self.scheduler.schedule(self.configuration.user_cache_refresh_interval(),
+                self.refresh_profiles)
 
-    def workout_step(self, was_office_hours):
+    def refresh_profiles(self):
         """
-        Runs a step of the workout bot, handling exceptions. Returns True iff is_office_hours
-        returns true before the current workout.
+        Refreshes stale cached user profiles, then schedules the next refresh.
         """
-        is_office_hours = self.bot.is_office_hours()
         try:
-            self._workout_step(was_office_hours, is_office_hours)
-        except NoEligibleUsersException:
-            self.logger.info("No eligible users currently, waiting 5 minutes")
-            util.sleep(minutes=5)
-        return is_office_hours
-
-    def _workout_step(self, was_office_hours, is_office_hours):
-        if is_office_hours:
-            # Clear the previous day's history if this is the first workout of the day
-            if not was_office_hours:
-                self.logger.debug("Clearing users")
-                self.user_manager.clear_users()
-
-            # Get an exercise to do
-            exercise, reps, mins_to_exercise = self.bot.select_exercise_and_start_time()
-            util.sleep(minutes=mins_to_exercise)
-
-            # Assign the exercise to someone
-            self.bot.assign_exercise(exercise, reps)
-        else:
-            # Show some stats if the final workout has just passed
-            if was_office_hours:
-                self.slack_api.post_flex_message(self.user_manager.stats())
+            for channel in self.channels:
+                channel.user_manager.refresh_stale_profiles()
+        finally:
+            self.schedule_profile_refresh()
+
+    def channel_metrics(self):
+        return dict((channel.name(), channel.runner.metrics.snapshot())
+                for channel in self.channels if channel.runner is not None)
 
-            # Sleep for a bit
-            if not self.configuration.debug():
-                util.sleep(minutes=5) # Sleep 5 minutes
-            else:
-                # If debugging, check again in 5 seconds
-                util.sleep(seconds=5)
+    def shutdown(self):
+        # Answer the commands already queued before their loggers are closed
+        if self.command_executor is not None:
+            self.command_executor.stop(drain=True)
+            self.logger.info("Commands: %s", self.command_executor.stats())
+            self.logger.info("Command latencies: %s", self.command_executor.latency_stats())
+        # Let the steps already running finish, so that their writes reach the logger
+        if self.scheduler is not None:
+            self.scheduler.stop(drain=True)
+            self.logger.info("Channel metrics: %s", self.channel_metrics())
+        # The channels share the first channel's directory
+        if isinstance(self.slack_api, FlexbotApiClient):
+            self.slack_api.channel_directory.stop()
+        self.log_api_stats()
+        # Flush any queued writes before the process exits
+        closed = self.logger_pool.close()
+        if self.workout_logger not in closed:
+            self.workout_logger.close()
 
+    def log_api_stats(self):
+        if isinstance(self.slack_api, FlexbotApiClient):
+            self.logger.info("Slack API throttling: %s", self.slack_api.throttle_stats())
+            self.logger.info("Slack API latencies: %s", self.slack_api.latency_stats())
@@ -0,0 +1,72 @@
+class DaySnapshot(object):
+    """
+    A read-only view of today's logged exercises and the pending assignments, read once from the
+    workout logger so that a selection cycle does not go back to the logger once per user.
+    """
+    def __init__(self, todays_exercises, current_winners, aggregate_exercises):
+        self._aggregate_exercises = aggregate_exercises
+        self._exercise_counts = {}
+        self._counts_by_exercise = {}
+        self._totals = {}
+        for user_id, exercises in (todays_exercises or {}).items():
+            counts = {}
+            for exercise_data in exercises:
+                counts[exercise_data['exercise']] = counts.get(exercise_data['exercise'], 0) + 1
+            self._exercise_counts[user_id] = counts
+            for exercise_name, count in counts.items():
+                self._counts_by_exercise.setdefault(exercise_name, {})[user_id] = count
+            self._totals[user_id] = len(exercises)
+        self._pending = {}
+        self._pending_counts = {}
+        for user_id, assignments in (current_winners or {}).items():
+            self._pending[user_id] = tuple(dict(a) for a in assignments)
+            self._pending_counts[user_id] = len(assignments)
+
+    @classmethod
+    def from_logger(cls, workout_logger, aggregate_exercises):
+        return cls(workout_logger.get_todays_exercises(), workout_logger.get_current_winners(),
+                aggregate_exercises)
+
+    def winner_ids(self):
+        """
+        Returns the ids of the users with at least one pending assignment.
+        """
+        return [user_id for user_id in self._pending if len(self._pending[user_id]) > 0]
+
+    def pending_exercises(self, user_id):
+        return self._pending.get(user_id, ())
+
+    def exercise_count(self, user_id, exercise_name):
+        return self._exercise_counts.get(user_id, {}).get(exercise_name, 0)
+
+    def total_exercises(self, user_id):
+        """
+        Returns the number of exercises the user has done today, including the exercises they
+        have been assigned but not yet done if exercises are aggregated.
+        """
+        total = self._totals.get(user_id, 0)
+        if self._aggregate_exercises:
+            total += len(self.pending_exercises(user_id))
+        return total
+
+    # The hashes below are shared, not copied; callers must not modify them
+
+    def totals(self):
+        """
+        Returns a hash from user id to the number of exercises the user has logged today.
+        """
+        return self._totals
+
+    def pending_counts(self):
+        """
+        Returns a hash from user id to the number of exercises the user has been assigned but not
+        yet done.
+        """
+        return self._pending_counts
+
+    def exercise_counts(self, exercise_name):
+        """
+        Returns a hash from user id to the number of times the user has done the given exercise
+        today.
+        """
+        return self._counts_by_exercise.get(exercise_name, {})
@@ -0,0 +1,306 @@
+import collections
+import logging
+import random
+import threading
+import time
+
+import requests
+import requests.adapters
+
+SLACK_API_URL = "https://slack.com/api/"
+
+class TokenBucket(object):
+    """
+    Allows rate requests per second on average, in bursts of up to capacity requests. A rate of
+    None allows any number of requests, except while the bucket is paused.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, returning the number of seconds the caller must wait before using it.
+        """
+        with self.lock:
+            now = time.time()
+            wait = max(0, self.paused_until - now)
+            if self.rate is None:
+                return wait
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Tokens go negative while requests are queued, so that they are served in order
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def pause(self, seconds):
+        """
+        Holds back every request for the given number of seconds, e.g. after a 429 response.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+class LatencyHistogram(object):
+    """
+    Counts request latencies into buckets bounded by bounds (in milliseconds), with a final bucket
+    for anything slower.
+    """
+    DEFAULT_BOUNDS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+    def __init__(self, bounds=None):
+        self.bounds = list(bounds or self.DEFAULT_BOUNDS)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        milliseconds = seconds * 1000
+        index = 0
+        while index < len(self.bounds) and milliseconds > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, p):
+        """
+        Returns the upper bound of the bucket holding the p-th percentile, or the slowest latency
+        seen if it falls in the final bucket.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        buckets = [[bound, count] for bound, count in zip(self.bounds, self.counts)]
+        buckets.append([None, self.counts[-1]])
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'max_ms': self.max,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'buckets': buckets
+        }
+
+class InflightRequest(object):
+    """
+    A request which callers asking for the same thing wait on instead of sending their own.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def finish(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """
+        Returns the response, raising requests.Timeout if it hasn't arrived within timeout seconds.
+        """
+        if not self.done.wait(timeout):
+            raise requests.Timeout("Gave up waiting {} seconds for a request in flight".format(
+                timeout))
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+class SlackSession(requests.Session):
+    """
+    The HTTP session the Slack API client sends its requests through. If api_url is given, requests
+    for the Slack Web API are sent to it instead, e.g. to point the bot at a local fake of Slack.
+
+    Requests for an API method listed in rate_limits are paced by a token bucket of
+    rate_limits[method] requests per minute, which allows bursts of up to that many requests;
+    other methods aren't paced. A 429 response pauses the method for the Retry-After period before
+    the request is retried, and failed GET requests are retried with exponential backoff and jitter, up to
+    max_retries times. Identical GET requests in flight at the same time share one response.
+
+    Connections are kept alive and pooled, up to pool_size per host, so that concurrent lookups
+    reuse them rather than opening a new TLS connection each. If connect_timeout is given, it
+    bounds how long connecting may take separately from the read timeout of each request.
+    """
+    def __init__(self, api_url=None, rate_limits=None, max_retries=3, backoff_base=0.5,
+            backoff_cap=30, pool_size=10, connect_timeout=None):
+        super(SlackSession, self).__init__()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate'
+        })
+        self.connect_timeout = connect_timeout
+        self.logger = logging.getLogger(__name__)
+        self.api_url = api_url
+        if self.api_url is not None and not self.api_url.endswith("/"):
+            self.api_url += "/"
+        # Slack enforces its limits over minutes rather than per request, so pacing is opt-in:
+        # by default requests go out at once and only a 429 response holds them back
+        self.rate_limits = dict(rate_limits or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.random = random.Random()
+        self.buckets = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.metrics = collections.defaultdict(collections.Counter)
+        self.latencies = collections.defaultdict(LatencyHistogram)
+
+    def rewrite_url(self, url):
+        if self.api_url is not None and url.startswith(SLACK_API_URL):
+            return self.api_url + url[len(SLACK_API_URL):]
+        return url
+
+    def bucket(self, api_method):
+        with self.lock:
+            if api_method not in self.buckets:
+                per_minute = self.rate_limits.get(api_method)
+                if per_minute:
+                    self.buckets[api_method] = TokenBucket(per_minute / 60.0, per_minute)
+                else:
+                    self.buckets[api_method] = TokenBucket(None, None)
+            return self.buckets[api_method]
+
+    def record(self, api_method, metric, amount=1):
+        with self.lock:
+            self.metrics[api_method][metric] += amount
+
+    def throttle_stats(self):
+        """
+        Returns a hash from API method to counts of the requests sent, the requests delayed by the
+        rate limit and the total delay in seconds, the 429 responses, the retries and the requests
+        coalesced into another in-flight request.
+        """
+        with self.lock:
+            return dict((api_method, dict(metrics)) for api_method, metrics in self.metrics.items())
+
+    def latency_stats(self):
+        """
+        Returns a hash from API method to a histogram of the latencies of its requests.
+        """
+        with self.lock:
+            return dict((api_method, histogram.snapshot())
+                    for api_method, histogram in self.latencies.items())
+
+    def request(self, method, url, *args, **kwargs):
+        if not url.startswith(SLACK_API_URL):
+            return super(SlackSession, self).request(method, url, *args, **kwargs)
+        api_method = url[len(SLACK_API_URL):]
+        if method.upper() != 'GET':
+            return self.send_paced(api_method, method, url, *args, **kwargs)
+
+        params = kwargs.get('params') or {}
+        key = (api_method, tuple(sorted((name, str(value)) for name, value in params.items()
+            if value is not None)))
+        with self.lock:
+            inflight = self.inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = self.inflight[key] = InflightRequest()
+        if not owner:
+            self.record(api_method, 'coalesced')
+            return inflight.wait(self.total_timeout(kwargs.get('timeout')))
+        try:
+            response = self.send_paced(api_method, method, url, *args, **kwargs)
+        except Exception as e:
+            self.finish(key, inflight, error=e)
+            raise
+        self.finish(key, inflight, response=response)
+        return response
+
+    def total_timeout(self, timeout):
+        """
+        Returns how long a request given the timeout may take to connect and read a response, or
+        None if it isn't bounded.
+        """
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = self.connect_timeout if self.connect_timeout is not None else timeout
+            read = timeout
+        if connect is None or read is None:
+            return None
+        return connect + read
+
+    def finish(self, key, inflight, response=None, error=None):
+        with self.lock:
+            del self.inflight[key]
+        inflight.finish(response, error)
+
+    def observe_latency(self, api_method, seconds):
+        with self.lock:
+            self.latencies[api_method].observe(seconds)
+
+    def backoff(self, attempt):
+        return self.random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def send_paced(self, api_method, method, url, *args, **kwargs):
+        bucket = self.bucket(api_method)
+        url = self.rewrite_url(url)
+        retry_on_failure = method.upper() == 'GET'
+        timeout = kwargs.get('timeout')
+        if self.connect_timeout is not None and timeout is not None and \
+                not isinstance(timeout, tuple):
+            kwargs['timeout'] = (self.connect_timeout, timeout)
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                self.record(api_method, 'throttled')
+                self.record(api_method, 'throttle_wait', wait)
+                time.sleep(wait)
+            self.record(api_method, 'requests')
+            start = time.time()
+            try:
+                response = super(SlackSession, self).request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.observe_latency(api_method, time.time() - start)
+                if not retry_on_failure or attempt >= self.max_retries:
+                    raise
+                self.logger.warning("%s failed, retrying", api_method, exc_info=True)
+                delay = self.backoff(attempt)
+            else:
+                self.observe_latency(api_method, time.time() - start)
+                if response.status_code == requests.codes.too_many:
+                    self.record(api_method, 'rate_limited')
+                    if attempt >= self.max_retries:
+                        return response
+                    try:
+                        retry_after = float(response.headers.get('Retry-After'))
+                    except (TypeError, ValueError):
+                        retry_after = self.backoff(attempt)
+                    self.logger.info("%s was rate limited, retrying in %.1f seconds", api_method,
+                            retry_after)
+                    # Every request for the method waits out the limit, spread a little so that
+                    # they don't all arrive at once
+                    bucket.pause(retry_after + self.random.uniform(0, self.backoff_base))
+                    delay = 0
+                elif response.status_code >= 500 and retry_on_failure and \
+                        attempt < self.max_retries:
+                    delay = self.backoff(attempt)
+                else:
+                    return response
+            self.record(api_method, 'retries')
+            attempt += 1
+            if delay > 0:
+                time.sleep(delay)
@@ -1,3 +1,11 @@
+def from_json(user_id, user_json):
+    """
+    Builds a User from the user object returned by the Slack API.
+    """
+    profile = user_json.get('profile', {})
+    return User(user_id, user_json['name'], profile.get('first_name', ''),
+            profile.get('last_name', ''))
+
 class User(object):
     def __init__(self, user_id, username, firstname, lastname):
         # The Slack ID of the user
@@ -11,6 +19,10 @@ class User(object):
     def __str__(self):
         return self.get_user_handle()
 
+    def same_profile(self, other):
+        return (self.username, self.firstname, self.lastname) == \
+                (other.username, other.firstname, other.lastname)
+
     def get_user_handle(self):
         return "@" + self.username
 
@@ -1,8 +1,21 @@
+import os
 import time
 
 def sleep(minutes=0, seconds=0):
     time.sleep(minutes * 60 + seconds)
 
+def replace_file(source, destination):
+    """
+    Moves source over destination, atomically where the platform allows it.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+        return
+    # Python 2 only has os.rename, which cannot replace an existing file on Windows
+    if os.name == 'nt' and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
 class StatementRenderer(object):
     def __init__(self, format_string):
         self.format_string = format_string
@@ -3,6 +3,8 @@ import logging
 import pystache
 import random
 
+from .commands import Command, CommandRouter, text_argument, user_and_words_arguments, \
+        user_argument
 from .constants import Constants
 from .util import StatementRenderer
 
@@ -19,13 +21,47 @@ class FlexbotWebServer(object):
         "I know you're excited, but you can't take credit for someone else's exercise!"
     ]
 
+    BUSY_STATEMENT = "I'm swamped right now, try again in a minute"
+
     CHARS_TO_IGNORE = "!"
 
-    def __init__(self, user_manager, ack_handler, configuration):
+    def __init__(self, user_manager, ack_handler, configuration, api=None, executor=None):
+        """
+        If an executor is given, commands are answered asynchronously: flex() returns straight
+        away, and the executor runs the command and posts its response to the channel through api.
+        """
         self.user_manager = user_manager
         self.ack_handler = ack_handler
         self.configuration = configuration
+        self.api = api
+        self.executor = executor
         self.logger = logging.getLogger(__name__)
+        acknowledgment_enabled = lambda configuration: configuration.enable_acknowledgment()
+        self.commands = [
+            Command("help", self.print_help),
+            Command("exercises", self.print_exercises),
+            Command("info", self.print_exercise_info, parser=text_argument),
+            Command("stats", self.print_stats, parser=user_and_words_arguments),
+            Command("done", self.acknowledge_winner, parser=user_argument,
+                enabled=acknowledgment_enabled),
+            Command("todo", self.print_assignments, enabled=acknowledgment_enabled),
+            Command("reload", self.reload_configuration)
+        ]
+        self.command_router = None
+
+    def register_command(self, command):
+        """
+        Adds a command, replacing any command with the same name.
+        """
+        self.commands = [c for c in self.commands if c.name != command.name] + [command]
+        self.command_router = None
+
+    def router(self):
+        router = self.command_router
+        if router is None or router.version != self.configuration.version:
+            router = self.command_router = CommandRouter(self.configuration, self.commands,
+                    self.CHARS_TO_IGNORE)
+        return router
 
     @cherrypy.expose
     def index(self):
@@ -35,35 +71,45 @@ class FlexbotWebServer(object):
     @cherrypy.tools.json_out()
     def flex(self, **args):
         user_id = args['user_id']
-        text = args['text'].lower()
-        for char in self.CHARS_TO_IGNORE:
-            text = text.replace(char, "")
-        if user_id != "USLACKBOT" and text.startswith(self.configuration.bot_name().lower()):
+        router = self.router()
+        text = router.normalize(args['text'])
+        if user_id != "USLACKBOT" and router.is_addressed(text):
             self.logger.debug('message: %s', args['text'])
-            response = self.handle_message(text, user_id)
+            command, words = router.route(text)
+            if self.executor is not None:
+                return self.submit_command(command, words, user_id)
+            response = self.run_command(command, words, user_id)
             if response is not None:
                 self.logger.debug('response: %s', response['text'])
             return response
 
-    def handle_message(self, text, user_id):
-        args = text.split()[1:]
-        command = args[0]
-        if command == "help":
-            return self.print_help()
-        elif command == "exercises":
-            return self.print_exercises()
-        elif command == "info":
-            return self.print_exercise_info(" ".join(args[1:]))
-        elif command == "stats":
-            return self.print_stats(user_id, args[1:])
-        elif self.configuration.enable_acknowledgment() and command == "done":
-            return self.acknowledge_winner(user_id)
-        elif self.configuration.enable_acknowledgment() and command == "todo":
-            return self.print_assignments()
-        elif command == "reload":
-            return self.reload_configuration()
-        else:
+    def submit_command(self, command, words, user_id):
+        """
+        Queues a command to be answered in the channel, replying straight away only if the queue is
+        full. Messages which aren't a command are answered straight away, without queueing.
+        """
+        if command is None:
             return self.cant_parse_message()
+        if not self.executor.submit(command.name, self.run_command, self.post_response, command,
+                words, user_id):
+            return {'text': self.BUSY_STATEMENT}
+
+    def post_response(self, response):
+        if response is not None:
+            self.logger.debug('response: %s', response['text'])
+            self.api.post_flex_message(response['text'])
+
+    def run_command(self, command, words, user_id):
+        if command is None:
+            return self.cant_parse_message()
+        return command.run(user_id, words)
+
+    def handle_message(self, text, user_id):
+        """
+        Answers a normalized message addressed to the bot.
+        """
+        command, words = self.router().route(text)
+        return self.run_command(command, words, user_id)
 
     def print_help(self):
         template_options = {
@@ -112,8 +158,9 @@ A little primer on how I work: after I call you out for an exercise, I will only
         if len(usernames) == 0:
             users_to_print.add(current_user_id)
         else:
-            for user_id in self.user_manager.users:
-                user = self.user_manager.users[user_id]
+            users = self.user_manager.users
+            for user_id in users:
+                user = users[user_id]
                 user_reverse_lookup[user.username.lower()] = user_id
             for username in usernames:
                 self.logger.debug("Looking up username %s", username)
@@ -185,3 +232,25 @@ A little primer on how I work: after I call you out for an exercise, I will only
     def cant_parse_message(self):
         # alternatively respond with an error message here
         pass
+
+class MultiChannelWebServer(object):
+    """
+    Routes the commands of several channels to the webserver of the channel they were sent from.
+    Commands from channels the bot isn't in go to the first channel's webserver.
+    """
+    def __init__(self, channel_servers):
+        self.channel_servers = list(channel_servers)
+        self.servers_by_channel = dict(self.channel_servers)
+        self.logger = logging.getLogger(__name__)
+
+    def server_for(self, channel_name):
+        return self.servers_by_channel.get(channel_name, self.channel_servers[0][1])
+
+    @cherrypy.expose
+    def index(self):
+        return self.channel_servers[0][1].index()
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def flex(self, **args):
+        return self.server_for(args.get('channel_name')).flex(**args)
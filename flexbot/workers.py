@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import logging
+import threading
+import time
+
+from .transport import LatencyHistogram
+
+class CommandExecutor(object):
+    """
+    Runs chat commands on a pool of max_workers threads, so that the webserver can answer Slack
+    before a command has finished. Up to queue_size commands wait for a free thread; beyond that,
+    submit() turns commands away so that a slow logger can't pile up an unbounded backlog.
+    """
+    def __init__(self, max_workers=4, queue_size=100):
+        self.logger = logging.getLogger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self.lock = threading.Lock()
+        self.metrics = collections.defaultdict(collections.Counter)
+        self.latencies = collections.defaultdict(LatencyHistogram)
+        self.run_latencies = collections.defaultdict(LatencyHistogram)
+
+    def record(self, command, metric):
+        with self.lock:
+            self.metrics[command][metric] += 1
+
+    def submit(self, command, func, callback, *args):
+        """
+        Queues func(*args) and then callback(result) under the name command. Returns False, without
+        queueing anything, if the queue is full.
+        """
+        if not self.slots.acquire(False):
+            self.record(command, 'rejected')
+            self.logger.warning("Command queue is full, rejecting %s", command)
+            return False
+        try:
+            self.executor.submit(self.run, command, time.time(), func, callback, args)
+        except RuntimeError:
+            # The executor has been stopped
+            self.slots.release()
+            self.record(command, 'rejected')
+            return False
+        self.record(command, 'accepted')
+        return True
+
+    def run(self, command, queued_at, func, callback, args):
+        start = time.time()
+        try:
+            callback(func(*args))
+            self.record(command, 'succeeded')
+        except Exception:
+            self.logger.exception("Command %s failed", command)
+            self.record(command, 'failed')
+        finally:
+            self.slots.release()
+            now = time.time()
+            with self.lock:
+                self.latencies[command].observe(now - queued_at)
+                self.run_latencies[command].observe(now - start)
+
+    def stats(self):
+        """
+        Returns a hash from command to counts of the commands accepted, rejected because the queue
+        was full, succeeded and failed.
+        """
+        with self.lock:
+            return dict((command, dict(metrics)) for command, metrics in self.metrics.items())
+
+    def latency_stats(self):
+        """
+        Returns a hash from command to histograms of the time from queueing each command to
+        answering it ('total'), and of the time spent running it ('run').
+        """
+        with self.lock:
+            return dict((command, {
+                'total': histogram.snapshot(),
+                'run': self.run_latencies[command].snapshot()
+            }) for command, histogram in self.latencies.items())
+
+    def stop(self, drain=True):
+        """
+        Stops taking commands. If drain is True, waits for the queued commands to be answered.
+        """
+        self.executor.shutdown(wait=drain)
@@ -0,0 +1,261 @@
+import collections
+import itertools
+import threading
+import time
+
+from .loggers import BaseLogger
+
+class WriteBehindLogger(BaseLogger):
+    """
+    Wraps another logger, queueing its writes and flushing them to it in batches on a background
+    thread. Reads merge the queued writes into the wrapped logger's results, so a write is visible
+    to readers as soon as the call returns. close() drains the queue.
+
+    Each run of consecutive writes of the same kind is written in one operation, and a write which
+    fails stays queued, along with those after it, to be retried; the writes before it are taken
+    off the queue, so that nothing is written twice.
+    """
+    LOG = "log"
+    ADD = "add"
+    FINISH = "finish"
+
+    # Flush attempts made once the logger is closing before the queued writes are dropped
+    CLOSE_RETRIES = 3
+
+    def __init__(self, wrapped, batch_size=100, flush_interval=1.0, close_timeout=30):
+        super(WriteBehindLogger, self).__init__()
+        self.wrapped = wrapped
+        # Have the wrapped logger raise on failed writes, rather than log and drop them
+        self.wrapped.raise_write_errors = True
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.close_timeout = close_timeout
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        # Held while a batch is written, so that only one batch is written at a time
+        self.flush_lock = threading.Lock()
+        # Counts the batches taken off the queue, so that reads can tell whether one was written
+        # while they read from the wrapped logger
+        self.generation = 0
+        self.finish_lock = threading.Lock()
+        self.closing = False
+        self.flushes = 0
+        self.flushed = 0
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.rebuild_index()
+        self.worker = threading.Thread(target=self.run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    # --------------------------------
+    # Background flushing
+    # --------------------------------
+
+    def enqueue(self, operations):
+        with self.condition:
+            self.pending.extend(operations)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def run(self):
+        failures = 0
+        while True:
+            with self.condition:
+                while len(self.pending) == 0 and not self.closing:
+                    self.condition.wait()
+                if len(self.pending) == 0:
+                    return
+                if len(self.pending) < self.batch_size and not self.closing:
+                    # Give the batch some time to fill up
+                    self.condition.wait(self.flush_interval)
+            if self.flush():
+                failures = 0
+                continue
+            failures += 1
+            if self.closing and failures >= self.CLOSE_RETRIES:
+                self.drop_pending()
+                return
+            time.sleep(self.flush_interval)
+
+    def drop_pending(self):
+        with self.condition:
+            dropped, self.pending = list(self.pending), collections.deque()
+        self.logger.error("Dropped %d queued writes which could not be flushed: %s", len(dropped),
+                [(kind, entry[0] if isinstance(entry, tuple) else entry)
+                    for kind, entry in dropped])
+
+    def flush(self):
+        """
+        Writes up to batch_size queued operations to the wrapped logger. Returns False if a
+        write failed, in which case it stays queued along with the operations after it.
+        """
+        with self.flush_lock:
+            with self.condition:
+                batch = list(itertools.islice(self.pending, self.batch_size))
+            if len(batch) == 0:
+                return True
+            start = time.time()
+            written = self.write_batch(batch)
+            latency = time.time() - start
+            with self.condition:
+                for _ in range(written):
+                    self.pending.popleft()
+                if written > 0:
+                    self.generation += 1
+                    self.flushes += 1
+                    self.flushed += written
+                    self.total_flush_latency += latency
+                    self.max_flush_latency = max(self.max_flush_latency, latency)
+                self.condition.notify_all()
+            return written == len(batch)
+
+    def write_batch(self, batch):
+        """
+        Writes the operations in order, stopping at the first which fails. Returns the number of
+        operations written.
+        """
+        written = 0
+        try:
+            # Consecutive writes of the same kind go to the wrapped logger as one batch
+            for kind, operations in itertools.groupby(batch, lambda operation: operation[0]):
+                entries = [operation[1] for operation in operations]
+                if kind == self.LOG:
+                    self.wrapped.log_exercises(entries)
+                    written += len(entries)
+                elif kind == self.ADD:
+                    self.wrapped.add_exercises(entries)
+                    written += len(entries)
+                else:
+                    for winner_id in entries:
+                        self.wrapped.finish_exercise(winner_id)
+                        written += 1
+        except Exception:
+            self.logger.exception("Failed to flush %d of %d queued writes", len(batch) - written,
+                    len(batch))
+        return written
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.pending)
+
+    def flush_stats(self):
+        with self.condition:
+            return {
+                'queue_depth': len(self.pending),
+                'flushes': self.flushes,
+                'flushed': self.flushed,
+                'avg_latency': self.total_flush_latency / self.flushes if self.flushes else 0.0,
+                'max_latency': self.max_flush_latency
+            }
+
+    def close(self):
+        """
+        Flushes the queued writes, giving up after close_timeout seconds or CLOSE_RETRIES failed
+        flushes, and closes the wrapped logger.
+        """
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.worker.join(self.close_timeout)
+        if self.worker.is_alive():
+            self.logger.error("Gave up flushing %d queued writes after %s seconds",
+                    self.queue_depth(), self.close_timeout)
+        self.logger.info("Write-behind stats: %s", self.flush_stats())
+        self.wrapped.close()
+
+    # --------------------------------
+    # Reads merged with queued writes
+    # --------------------------------
+
+    READ_ATTEMPTS = 3
+
+    def read_with_pending(self, read):
+        """
+        Returns the result of reading from the wrapped logger, along with the operations which
+        were queued at the time of the read. Reads don't wait for a flush in progress: if a batch
+        is taken off the queue while the wrapped logger is read, the read is retried, since the
+        result may or may not include the batch. The last of READ_ATTEMPTS reads holds flush_lock,
+        so that no batch can be taken off the queue during it.
+        """
+        for _ in range(self.READ_ATTEMPTS - 1):
+            with self.condition:
+                generation = self.generation
+                operations = list(self.pending)
+            result = read() or {}
+            with self.condition:
+                if self.generation == generation:
+                    return result, operations
+        with self.flush_lock:
+            with self.condition:
+                operations = list(self.pending)
+            return read() or {}, operations
+
+    @staticmethod
+    def copy_lists(result):
+        # The wrapped logger may hand out its own lists
+        return dict((key, list(value)) for key, value in result.items())
+
+    def get_todays_exercises(self):
+        exercises, operations = self.read_with_pending(self.wrapped.get_todays_exercises)
+        exercises = self.copy_lists(exercises)
+        for kind, entry in operations:
+            if kind == self.LOG:
+                user_id, exercise, reps = entry
+                exercises.setdefault(user_id, []).append({'exercise': exercise.name, 'reps': reps})
+        return exercises
+
+    def get_todays_totals(self):
+        totals, operations = self.read_with_pending(self.wrapped.get_todays_totals)
+        totals = dict((user_id, dict((name, dict(t)) for name, t in user_totals.items()))
+                for user_id, user_totals in totals.items())
+        for kind, entry in operations:
+            if kind == self.LOG:
+                user_id, exercise, reps = entry
+                exercise_totals = totals.setdefault(user_id, {}).setdefault(exercise.name,
+                        {'count': 0, 'reps': 0})
+                exercise_totals['count'] += 1
+                exercise_totals['reps'] += reps
+        return totals
+
+    def get_current_winners(self):
+        winners, operations = self.read_with_pending(self.wrapped.get_current_winners)
+        winners = self.copy_lists(winners)
+        for kind, entry in operations:
+            if kind == self.ADD:
+                winner_id, exercise, reps = entry
+                winners.setdefault(winner_id, []).append({'exercise': exercise.name, 'reps': reps})
+            elif kind == self.FINISH and len(winners.get(entry, [])) > 0:
+                winners[entry].pop(0)
+                if len(winners[entry]) == 0:
+                    del winners[entry]
+        return winners
+
+    # --------------------------------
+    # Queued writes
+    # --------------------------------
+
+    def log_exercise(self, user_id, exercise, reps):
+        self.log_exercises([(user_id, exercise, reps)])
+
+    def log_exercises(self, entries):
+        self.enqueue([(self.LOG, entry) for entry in entries])
+        for user_id, exercise, _ in entries:
+            self.index.record_exercise(user_id, exercise.name)
+
+    def add_exercise(self, winner_id, exercise, reps):
+        self.add_exercises([(winner_id, exercise, reps)])
+
+    def add_exercises(self, entries):
+        self.enqueue([(self.ADD, entry) for entry in entries])
+        for winner_id, _, _ in entries:
+            self.index.record_assignment(winner_id)
+
+    def finish_exercise(self, winner_id):
+        with self.finish_lock:
+            pending = self.get_current_winners().get(winner_id, [])
+            if len(pending) == 0:
+                return None
+            self.enqueue([(self.FINISH, winner_id)])
+        self.index.record_completion(winner_id)
+        return dict(pending[0])
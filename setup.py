@@ -5,12 +5,15 @@ setup(
     packages = find_packages(),
 
     install_requires = [
-        'slacker>=0.8.6',
-        'psycopg2>=2.6.1',
+        'slacker>=0.9.65',
+        'psycopg2>=2.7',
         'cherrypy>=4.0.0',
         'pyyaml>=3.11',
         'pystache>=0.5.4'
     ],
+    extras_require = {
+        'numpy': ['numpy>=1.17'],
+    },
 
     author = "Brandon Shin, Miles Yucht",
     author_email = "mgyucht@gmail.com",
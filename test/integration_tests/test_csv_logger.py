@@ -14,8 +14,8 @@ class TestCsvLogger(object):
         for f in logfiles:
             os.remove(f)
 
-    def get_logger(self):
-        return CsvLogger()
+    def get_logger(self, **kwargs):
+        return CsvLogger(**kwargs)
 
     def test_log_exercise(self):
         logger = self.get_logger()
@@ -66,6 +66,19 @@ class TestCsvLogger(object):
         assert winners['uid2'][1]['reps'] == 40
         assert 'uid3' not in winners
 
+    def test_counts_rebuilt_on_startup(self):
+        logger = self.get_logger()
+        logger.log_exercise('miles', exercises[0], 30)
+        logger.add_exercise('miles', exercises[1], 35)
+
+        logger = self.get_logger()
+        assert logger.count_for('miles', exercises[0]) == 1
+        assert logger.total_for('miles') == 1
+        assert logger.pending_for('miles') == 1
+
+        logger.finish_exercise('miles')
+        assert logger.pending_for('miles') == 0
+
     def test_finishe_exercise(self):
         logger = self.get_logger()
 
@@ -78,3 +91,64 @@ class TestCsvLogger(object):
         assert len(winners['uid2']) == 1
         assert winners['uid2'][0]['exercise'] == exercises[1].name
         assert winners['uid2'][0]['reps'] == 35
+
+    def test_finish_exercise_appends_to_journal(self):
+        logger = self.get_logger()
+
+        logger.add_exercise('uid1', exercises[0], 30)
+        logger.add_exercise('uid1', exercises[1], 35)
+        exercise = logger.finish_exercise('uid1')
+
+        assert exercise == {'exercise': 'pushups', 'reps': 30}
+        with open(logger.winners_filename(), 'r') as f:
+            contents = f.read().strip().split("\n")
+            assert len(contents) == 3
+        assert self.get_logger().get_current_winners() == {
+            'uid1': [{'exercise': 'situps', 'reps': 35}]
+        }
+        assert logger.finish_exercise('uid2') == None
+
+    def test_compaction(self):
+        logger = self.get_logger(compaction_threshold=2)
+
+        logger.add_exercise('uid1', exercises[0], 30)
+        logger.add_exercise('uid2', exercises[1], 35)
+        logger.add_exercise('uid1', exercises[1], 40)
+        logger.finish_exercise('uid1')
+        with open(logger.winners_filename(), 'r') as f:
+            assert len(f.read().strip().split("\n")) == 4
+        logger.finish_exercise('uid1')
+
+        with open(logger.winners_filename(), 'r') as f:
+            contents = f.read().strip().split("\n")
+            assert len(contents) == 1
+        assert logger.get_current_winners() == {'uid2': [{'exercise': 'situps', 'reps': 35}]}
+        logger.add_exercise('uid1', exercises[0], 30)
+        assert len(logger.get_current_winners()['uid1']) == 1
+
+    def test_legacy_winners_file(self):
+        logger = self.get_logger()
+        with open(logger.winners_filename(), 'w') as f:
+            f.write("uid1,pushups,30\r\nuid1,situps,35\r\n")
+
+        logger = self.get_logger()
+        assert logger.pending_for('uid1') == 2
+        assert logger.finish_exercise('uid1') == {'exercise': 'pushups', 'reps': 30}
+        assert logger.get_current_winners() == {'uid1': [{'exercise': 'situps', 'reps': 35}]}
+
+    def test_batch_writes(self):
+        logger = self.get_logger()
+
+        logger.log_exercises([('miles', exercises[0], 30), ('greg', exercises[1], 40)])
+        logger.add_exercises([('uid1', exercises[0], 30), ('uid2', exercises[1], 35)])
+
+        assert logger.get_todays_exercises() == {
+            'miles': [{'exercise': 'pushups', 'reps': 30}],
+            'greg': [{'exercise': 'situps', 'reps': 40}]
+        }
+        assert logger.get_current_winners() == {
+            'uid1': [{'exercise': 'pushups', 'reps': 30}],
+            'uid2': [{'exercise': 'situps', 'reps': 35}]
+        }
+        assert logger.total_for('greg') == 1
+        assert logger.pending_for('uid2') == 1
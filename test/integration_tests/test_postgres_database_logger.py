@@ -1,16 +1,26 @@
 from flexbot.exercise import Exercise
-from flexbot.loggers import PostgresDatabaseLogger, PostgresConnector
+import psycopg2
+
+from flexbot.loggers import PostgresDatabaseLogger
 
 exercises = [
     Exercise('pushups', 30, 40, 'reps', ''),
     Exercise('situps', 30, 40, 'reps', '')
 ]
 
-class TestPostgresDatabaseLogger(PostgresConnector):
+class TestPostgresDatabaseLogger(object):
     dbname = 'travis_ci_test' # must be kept in sync with .travis.yml
     tablename = 'flexecution'
     winners_table = 'winners'
-    kwargs = {'dbname': dbname}
+
+    def with_connection(self, func):
+        conn = psycopg2.connect(dbname=self.dbname)
+        try:
+            result = func(conn.cursor())
+            conn.commit()
+            return result
+        finally:
+            conn.close()
 
     def teardown(self):
         def clear_tables(cursor):
@@ -43,6 +53,19 @@ class TestPostgresDatabaseLogger(PostgresConnector):
         assert 'greg' in todays_exercises
         assert todays_exercises['greg'] == [{'exercise': 'situps', 'reps': 40}]
 
+    def test_get_todays_totals(self):
+        logger = self.get_logger()
+        logger.log_exercise('miles', exercises[0], 30)
+        logger.log_exercise('miles', exercises[0], 35)
+        logger.log_exercise('greg', exercises[1], 40)
+
+        totals = logger.get_todays_totals()
+
+        assert totals == {
+            'miles': {'pushups': {'count': 2, 'reps': 65}},
+            'greg': {'situps': {'count': 1, 'reps': 40}}
+        }
+
     def test_add_exercise_and_get_current_winners(self):
         logger = self.get_logger()
 
@@ -78,3 +101,18 @@ class TestPostgresDatabaseLogger(PostgresConnector):
         assert exercise != None
         assert exercise['exercise'] == 'pushups'
         assert exercise['reps'] == 30
+
+    def test_batch_writes(self):
+        logger = self.get_logger()
+
+        logger.log_exercises([('miles', exercises[0], 30), ('greg', exercises[1], 40)])
+        logger.add_exercises([('uid1', exercises[0], 30), ('uid2', exercises[1], 35)])
+
+        assert logger.get_todays_exercises() == {
+            'miles': [{'exercise': 'pushups', 'reps': 30}],
+            'greg': [{'exercise': 'situps', 'reps': 40}]
+        }
+        assert logger.get_current_winners() == {
+            'uid1': [{'exercise': 'pushups', 'reps': 30}],
+            'uid2': [{'exercise': 'situps', 'reps': 35}]
+        }
@@ -0,0 +1,112 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from flexbot.exercise import Exercise
+from flexbot.loggers import SqliteDatabaseLogger
+
+exercises = [
+    Exercise('pushups', 30, 40, 'reps', ''),
+    Exercise('situps', 30, 40, 'reps', '')
+]
+
+def with_logger(func):
+    def test(self, *args):
+        directory = tempfile.mkdtemp()
+        logger = SqliteDatabaseLogger(os.path.join(directory, 'flexecution.db'))
+        try:
+            return func(self, logger, *args)
+        finally:
+            logger.close()
+            shutil.rmtree(directory)
+    test.__name__ = func.__name__
+    return test
+
+class TestSqliteDatabaseLogger(object):
+    @with_logger
+    def test_wal_mode(self, logger):
+        def get_journal_mode(cursor):
+            cursor.execute("PRAGMA journal_mode")
+            return cursor.fetchone()[0]
+        assert logger.with_connection(get_journal_mode) == 'wal'
+
+    @with_logger
+    def test_log_exercise(self, logger):
+        logger.log_exercise('miles', exercises[0], 30)
+
+        conn = sqlite3.connect(logger.path)
+        try:
+            logged_exercises = conn.execute(
+                "SELECT user_id, exercise, reps, units FROM flexecution").fetchall()
+        finally:
+            conn.close()
+        assert logged_exercises == [('miles', 'pushups', 30, 'reps')]
+
+    @with_logger
+    def test_get_todays_exercises_and_totals(self, logger):
+        logger.log_exercise('miles', exercises[0], 30)
+        logger.log_exercise('miles', exercises[0], 35)
+        logger.log_exercise('greg', exercises[1], 40)
+
+        assert logger.get_todays_exercises() == {
+            'miles': [{'exercise': 'pushups', 'reps': 30}, {'exercise': 'pushups', 'reps': 35}],
+            'greg': [{'exercise': 'situps', 'reps': 40}]
+        }
+        assert logger.get_todays_totals() == {
+            'miles': {'pushups': {'count': 2, 'reps': 65}},
+            'greg': {'situps': {'count': 1, 'reps': 40}}
+        }
+        assert logger.count_for('miles', exercises[0]) == 2
+        assert logger.total_for('greg') == 1
+
+    @with_logger
+    def test_add_and_finish_exercise(self, logger):
+        logger.add_exercise('uid1', exercises[0], 30)
+        logger.add_exercises([('uid2', exercises[1], 35), ('uid2', exercises[0], 40)])
+
+        assert logger.get_current_winners() == {
+            'uid1': [{'exercise': 'pushups', 'reps': 30}],
+            'uid2': [{'exercise': 'situps', 'reps': 35}, {'exercise': 'pushups', 'reps': 40}]
+        }
+        assert logger.pending_for('uid2') == 2
+
+        assert logger.finish_exercise('uid2') == {'exercise': 'situps', 'reps': 35}
+        assert logger.finish_exercise('uid1') == {'exercise': 'pushups', 'reps': 30}
+        assert logger.finish_exercise('uid1') is None
+        assert logger.get_current_winners() == {
+            'uid2': [{'exercise': 'pushups', 'reps': 40}]
+        }
+        assert logger.pending_for('uid2') == 1
+
+    @with_logger
+    def test_counters_rebuilt_on_restart(self, logger):
+        logger.log_exercise('miles', exercises[0], 30)
+        logger.add_exercise('uid1', exercises[1], 35)
+
+        restarted = SqliteDatabaseLogger(logger.path)
+        try:
+            assert restarted.count_for('miles', exercises[0]) == 1
+            assert restarted.pending_for('uid1') == 1
+        finally:
+            restarted.close()
+
+    @with_logger
+    def test_connection_per_thread(self, logger):
+        def log_exercises():
+            for _ in range(10):
+                logger.log_exercise('miles', exercises[0], 30)
+        threads = [threading.Thread(target=log_exercises) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(logger.get_todays_exercises()['miles']) == 40
+        assert len(logger.connections) <= 5
+        # Opening another connection closes those of the finished threads
+        thread = threading.Thread(target=logger.get_todays_exercises)
+        thread.start()
+        thread.join()
+        assert [t for t, _ in logger.connections] == [threading.current_thread(), thread]
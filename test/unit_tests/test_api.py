@@ -0,0 +1,29 @@
+from mock import Mock
+
+from flexbot.api import FlexbotApiClient
+from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot.transport import SlackSession
+
+def get_config():
+    return InMemoryConfigurationProvider({'channel_name': 'general', 'bot_name': 'Flexbot'})
+
+class TestFlexbotApiClient(object):
+    def test_shares_session(self):
+        # Slacker accepts a session from 0.9.50 and rate_limit_retries from 0.9.65, the minimum in
+        # setup.py and requirements.txt
+        session = SlackSession()
+        directory = Mock()
+        directory.channel_id.return_value = 'C0000001'
+        api = FlexbotApiClient(get_config(), token='xoxb-test', timeout=5, session=session,
+                channel_directory=directory)
+        assert api.session is session
+        assert api.chat.session is session
+        assert api.users.session is session
+        assert api.channel_id() == 'C0000001'
+        # Only the session retries rate limited requests
+        assert api.chat.rate_limit_retries == 0
+
+    def test_default_session(self):
+        api = FlexbotApiClient(get_config(), token='xoxb-test', channel_directory=Mock())
+        assert isinstance(api.session, SlackSession)
+        assert api.chat.session is api.session
@@ -0,0 +1,93 @@
+import json
+import os
+import requests
+import shutil
+import tempfile
+
+from benchmarks import selection_cycle
+from benchmarks.fake_slack_server import FakeSlack, FakeSlackServer
+from benchmarks.fakes import CountingLogger
+from flexbot.api import FlexbotApiClient
+from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot.loggers import InMemoryLogger
+from flexbot.transport import SlackSession
+
+class TestSelectionCycleBenchmark(object):
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        assert selection_cycle.percentile(samples, 50) == 50
+        assert selection_cycle.percentile(samples, 99) == 99
+        assert selection_cycle.percentile([3], 90) == 3
+        assert selection_cycle.percentile([], 90) is None
+
+    def test_counting_logger(self):
+        logger = CountingLogger(InMemoryLogger())
+        logger.get_todays_exercises()
+        logger.get_todays_exercises()
+        assert logger.calls.snapshot() == {'get_todays_exercises': 2}
+
+    def test_run_saves_results(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output = os.path.join(directory, 'results.json')
+            selection_cycle.main(['--users', '20', '--loggers', 'InMemoryLogger',
+                '--iterations', '2', '--output', output])
+            with open(output) as f:
+                results = json.load(f)['results']
+        finally:
+            shutil.rmtree(directory)
+        assert len(results) == 1
+        assert results[0]['users'] == 20
+        assert results[0]['phases']['assign_exercise']['samples'] == 2
+        assert results[0]['api_calls']['users.info'] == 20
+
+def with_fake_slack(**kwargs):
+    def decorator(func):
+        def test(self, *args):
+            slack = FakeSlack([['U1', 'U2', 'U3'], ['U1', 'U2']], **kwargs)
+            slack.set_presence('U1', True)
+            slack.set_presence('U2', False)
+            server = FakeSlackServer(slack).start()
+            try:
+                return func(self, slack, server, *args)
+            finally:
+                server.stop()
+        test.__name__ = func.__name__
+        return test
+    return decorator
+
+def get_api(server):
+    config = InMemoryConfigurationProvider({'channel_name': 'general', 'bot_name': 'flexbot'})
+    return FlexbotApiClient(config, token='xoxp-test', session=SlackSession(server.api_url))
+
+class TestFakeSlackServer(object):
+    @with_fake_slack()
+    def test_api_client(self, slack, server):
+        api = get_api(server)
+        assert api.channel_id() == 'C0000001'
+        assert api.get_members() == ['U1', 'U2', 'U3']
+        # The member script moves on with each channels.info request
+        assert api.get_members() == ['U1', 'U2']
+        assert api.get_user_info('U1')['name'] == 'useru1'
+        assert api.is_active('U1') == True
+        assert api.is_active('U2') == False
+        assert [u['id'] for u in api.get_users(page_size=2)] == ['U1', 'U2', 'U3']
+        api.post_flex_message("10 PUSHUPS RIGHT NOW")
+        assert slack.messages == ["10 PUSHUPS RIGHT NOW"]
+        assert slack.stats()['requests'] == {
+            'channels.list': 1,
+            'channels.info': 2,
+            'users.info': 1,
+            'users.getPresence': 2,
+            'users.list': 2,
+            'chat.postMessage': 1
+        }
+
+    @with_fake_slack(rate_limits={'users.getPresence': 1}, rate_limit_window=60)
+    def test_rate_limit(self, slack, server):
+        url = server.api_url + 'users.getPresence'
+        assert requests.get(url, params={'user': 'U1'}).status_code == 200
+        response = requests.get(url, params={'user': 'U1'})
+        assert response.status_code == 429
+        assert 1 <= int(response.headers['Retry-After']) <= 60
+        assert slack.stats()['throttled'] == {'users.getPresence': 1}
@@ -1,4 +1,5 @@
 from mock import Mock
+import datetime
 
 from flexbot.api import FlexbotApiClient
 from flexbot.bot import Bot
@@ -46,6 +47,7 @@ def get_sample_bot():
     api = Mock(spec=FlexbotApiClient)
     config = get_sample_config()
     um = Mock(spec=UserManager)
+    um.engine = None
     bot = Bot(api, config, um)
     return {
         'user_manager': um,
@@ -87,9 +89,29 @@ class TestBot(object):
 
         bot.assign_exercise(exercises[0], 30)
 
-        assert um.mark_winner.call_count == 1
+        assert um.mark_winners.call_count == 1
+        winners = um.mark_winners.call_args[0][0]
+        assert len(winners) == 1
+        assert winners[0] in [u.id for u in users]
 
-    def test_get_lottery_list(self):
+    def test_assign_exercise_reuses_announced_users(self):
+        bot_and_mocks = get_sample_bot()
+        bot = bot_and_mocks['bot']
+        um = bot_and_mocks['user_manager']
+        user_ids = [u.id for u in active_users()]
+        um.fetch_active_users.return_value = user_ids
+        um.get_eligible_users.return_value = user_ids
+        um.user_has_done_exercise.return_value = False
+        um.total_exercises_for_user.return_value = 0
+
+        announced = bot.select_exercise_and_start_time()
+        bot.assign_exercise(announced[0], announced[1], announced[3])
+
+        assert announced[3] == user_ids
+        um.fetch_active_users.assert_called_once_with()
+        assert um.get_eligible_users.call_args[0][1] == user_ids
+
+    def test_get_lottery_weights(self):
         exercise_list = []
         def make_mock_user(user_id, exercise_count):
             u = Mock(spec=User)
@@ -98,7 +120,7 @@ class TestBot(object):
             return u
         ulist = [make_mock_user(uid, exercises) for (uid, exercises) in [('uid1', 2), ('uid2', 1)]]
         uidlist = [u.id for u in ulist]
-        def total_exercises(user_id):
+        def total_exercises(user_id, snapshot=None):
             try:
                 filtered = [u for u in exercise_list if u[0] == user_id]
                 return filtered[0][1]
@@ -108,6 +130,71 @@ class TestBot(object):
         bot = bot_and_mocks['bot']
         um = bot_and_mocks['user_manager']
         um.total_exercises_for_user = total_exercises
-        lottery_list = bot.get_lottery_list(uidlist)
-        assert len([u for u in lottery_list if u == 'uid1']) == 1
-        assert len([u for u in lottery_list if u == 'uid2']) == 2
+        weights = bot.get_lottery_weights(uidlist)
+        assert weights == {'uid1': 1, 'uid2': 2}
+
+    def test_select_users_distinct(self):
+        bot_and_mocks = get_sample_bot()
+        bot = bot_and_mocks['bot']
+        um = bot_and_mocks['user_manager']
+        um.user_has_done_exercise.return_value = False
+        um.total_exercises_for_user.return_value = 0
+        uidlist = ['uid1', 'uid2', 'uid3']
+
+        winners = bot.select_users(uidlist, exercises[0], 5)
+
+        assert sorted(winners) == uidlist
+
+    def test_select_users_prefers_prime_users(self):
+        bot_and_mocks = get_sample_bot()
+        bot = bot_and_mocks['bot']
+        um = bot_and_mocks['user_manager']
+        um.user_has_done_exercise.side_effect = lambda user_id, exercise, snapshot: \
+                user_id != 'uid2'
+        um.total_exercises_for_user.return_value = 0
+
+        for _ in range(10):
+            winners = bot.select_users(['uid1', 'uid2', 'uid3'], exercises[0], 2)
+            assert winners[0] == 'uid2'
+            assert winners[1] in ['uid1', 'uid3']
+
+    def test_seeded_selection(self):
+        config = get_sample_config()
+        config.update_configuration({'random_seed': 42})
+        def select():
+            um = Mock(spec=UserManager)
+            um.engine = None
+            um.user_has_done_exercise.return_value = False
+            um.total_exercises_for_user.return_value = 0
+            bot = Bot(Mock(spec=FlexbotApiClient), config, um)
+            return [bot.select_users(['uid{}'.format(i) for i in range(10)], exercises[0], 3)
+                    for _ in range(5)]
+        assert select() == select()
+
+    def test_seeded_selection_ignores_user_order(self):
+        config = get_sample_config()
+        config.update_configuration({'random_seed': 42})
+        def select(user_ids):
+            um = Mock(spec=UserManager)
+            um.engine = None
+            um.user_has_done_exercise.return_value = False
+            um.total_exercises_for_user.return_value = 0
+            bot = Bot(Mock(spec=FlexbotApiClient), config, um)
+            return [bot.select_users(user_ids, exercises[0], 3) for _ in range(5)]
+        user_ids = ['uid{}'.format(i) for i in range(10)]
+        assert select(user_ids) == select(list(reversed(user_ids)))
+
+    def test_seconds_until_office_hours(self):
+        bot = get_sample_bot()['bot']
+        bot.config.update_configuration({'office_hours': {'on': True, 'begin': 10, 'end': 18}})
+        # Wednesday
+        assert bot.seconds_until_office_hours(datetime.datetime(2026, 10, 14, 12)) == 0
+        assert bot.seconds_until_office_hours(datetime.datetime(2026, 10, 14, 9, 30)) == 30 * 60
+        assert bot.seconds_until_office_hours(datetime.datetime(2026, 10, 14, 19)) == 15 * 3600
+        # Friday evening waits for Monday morning
+        assert bot.seconds_until_office_hours(datetime.datetime(2026, 10, 16, 19)) == \
+                (2 * 24 + 15) * 3600
+
+    def test_seconds_until_office_hours_disabled(self):
+        bot = get_sample_bot()['bot']
+        assert bot.seconds_until_office_hours(datetime.datetime(2026, 10, 17, 3)) == 0
@@ -0,0 +1,74 @@
+import mock
+
+from flexbot.channels import ChannelDirectory
+
+def get_mock_api(pages):
+    api = mock.Mock()
+    def get(method, params):
+        assert method == 'channels.list'
+        page = pages[int(params['cursor'] or 0)]
+        response = mock.Mock()
+        response.body = {
+            'ok': True,
+            'channels': page,
+            'response_metadata': {
+                'next_cursor': str(pages.index(page) + 1) if page is not pages[-1] else ''
+            }
+        }
+        return response
+    api.channels.get.side_effect = get
+    return api
+
+pages = [
+    [{'id': 'C1', 'name': 'general'}, {'id': 'C2', 'name': 'random'}],
+    [{'id': 'C3', 'name': 'flexecution'}]
+]
+
+class TestChannelDirectory(object):
+    def test_lookup_follows_pages(self):
+        api = get_mock_api(pages)
+        directory = ChannelDirectory(api, page_size=2)
+        assert directory.channel_id('flexecution') == 'C3'
+        assert directory.channel_id('general') == 'C1'
+        assert directory.channel_name('C2') == 'random'
+        assert api.channels.get.call_count == 2
+        assert api.channels.get.call_args[1]['params']['limit'] == 2
+
+    @mock.patch('flexbot.channels.time')
+    def test_refresh_after_ttl(self, mock_time):
+        mock_time.time.return_value = 1000
+        api = get_mock_api([pages[0]])
+        directory = ChannelDirectory(api, ttl=60)
+        directory.channel_id('general')
+        mock_time.time.return_value = 1059
+        directory.channel_id('general')
+        assert api.channels.get.call_count == 1
+        mock_time.time.return_value = 1060
+        directory.channel_id('general')
+        assert api.channels.get.call_count == 2
+
+    @mock.patch('flexbot.channels.time')
+    def test_refresh_on_miss(self, mock_time):
+        mock_time.time.return_value = 1000
+        channels = [{'id': 'C1', 'name': 'general'}]
+        api = get_mock_api([channels])
+        directory = ChannelDirectory(api, ttl=3600, miss_refresh_interval=10)
+        assert directory.channel_id('new-channel') is None
+        # A miss right after a refresh doesn't read the directory again
+        assert api.channels.get.call_count == 1
+
+        channels.append({'id': 'C9', 'name': 'new-channel'})
+        mock_time.time.return_value = 1010
+        assert directory.channel_id('new-channel') == 'C9'
+        assert api.channels.get.call_count == 2
+
+    def test_background_refresh(self):
+        api = get_mock_api([pages[0]])
+        directory = ChannelDirectory(api, ttl=0.01)
+        directory.channel_id('general')
+        directory.start()
+        try:
+            directory.refresher.join(0.2)
+            assert api.channels.get.call_count > 1
+        finally:
+            directory.stop()
@@ -0,0 +1,51 @@
+from flexbot.commands import Command, CommandRouter, text_argument, user_and_words_arguments
+from flexbot.configurators import InMemoryConfigurationProvider
+
+def get_sample_config(enable_acknowledgment=True):
+    return InMemoryConfigurationProvider({
+        'bot_name': 'TestBot',
+        'enable_acknowledgment': enable_acknowledgment
+    })
+
+commands = [
+    Command('help', lambda: 'help'),
+    Command('info', lambda text: text, parser=text_argument),
+    Command('stats', lambda user_id, words: (user_id, words), parser=user_and_words_arguments),
+    Command('done', lambda: 'done',
+        enabled=lambda configuration: configuration.enable_acknowledgment())
+]
+
+class TestCommandRouter(object):
+    def test_normalize(self):
+        router = CommandRouter(get_sample_config(), commands, "!?")
+        assert router.normalize('TestBot Done!?') == 'testbot done'
+
+    def test_is_addressed(self):
+        router = CommandRouter(get_sample_config(), commands)
+        assert router.is_addressed('testbot help')
+        assert router.is_addressed('testbot')
+        assert not router.is_addressed('hey testbot help')
+
+    def test_route(self):
+        router = CommandRouter(get_sample_config(), commands)
+        command, words = router.route('testbot info some exercise')
+        assert command.name == 'info'
+        assert command.run('U1', words) == 'some exercise'
+        command, words = router.route('testbot stats @user1 @user2')
+        assert command.run('U1', words) == ('U1', ['@user1', '@user2'])
+
+    def test_route_unknown_or_missing_command(self):
+        router = CommandRouter(get_sample_config(), commands)
+        assert router.route('testbot notacommand') == (None, [])
+        assert router.route('testbot') == (None, [])
+
+    def test_disabled_command(self):
+        router = CommandRouter(get_sample_config(enable_acknowledgment=False), commands)
+        assert router.route('testbot done')[0] is None
+        assert router.route('testbot help')[0].name == 'help'
+
+    def test_version(self):
+        config = get_sample_config()
+        assert CommandRouter(config, commands).version == config.version
+        config.set_configuration()
+        assert CommandRouter(config, commands).version == config.version
@@ -1,6 +1,7 @@
 from nose.tools import assert_raises
 
-from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot.configurators import ChannelConfigurationProvider, \
+        InMemoryConfigurationProvider, merge_configuration
 
 class TestConfig(object):
     def test_options_with_default(self):
@@ -12,7 +13,25 @@ class TestConfig(object):
         assert config.max_time_between_callouts() == 23
         assert config.group_callout_chance() == 0.05
         assert config.user_exercise_limit() == 3
+        assert config.random_seed() is None
+        assert config.selection_engine() == 'python'
         assert config.exercises() == []
+        assert config.slack_timeout() == 10
+        assert config.slack_api_url() is None
+        assert config.slack_max_retries() == 3
+        assert config.slack_connect_timeout() == 5
+        assert config.channel_directory_ttl() == 3600
+        assert config.presence_max_workers() == 10
+        assert config.presence_ttl() == 0
+        assert config.user_sync_mode() == 'incremental'
+        assert config.write_behind_on() == False
+        assert config.write_behind_batch_size() == 100
+        assert config.write_behind_close_timeout() == 30
+        assert config.channel_configurations() == []
+        assert config.scheduler_max_workers() == 4
+        assert config.async_commands_on() == False
+        assert config.async_commands_max_workers() == 4
+        assert config.async_commands_queue_size() == 100
 
     def test_required_options(self):
         config = InMemoryConfigurationProvider({})
@@ -21,3 +40,83 @@ class TestConfig(object):
         assert_raises(KeyError, config.office_hours_begin)
         assert_raises(KeyError, config.office_hours_end)
 
+
+    def test_merge_configuration(self):
+        base = {'bot_name': 'Flexbot', 'office_hours': {'on': True, 'begin': 9, 'end': 17}}
+        merged = merge_configuration(base, {'bot_name': 'Liftbot', 'office_hours': {'begin': 10}})
+        assert merged == {'bot_name': 'Liftbot', 'office_hours': {'on': True, 'begin': 10, 'end': 17}}
+        assert base['bot_name'] == 'Flexbot'
+        assert base['office_hours']['begin'] == 9
+
+    def test_channel_configuration(self):
+        base = InMemoryConfigurationProvider({
+            'channel_name': 'general',
+            'bot_name': 'Flexbot',
+            'channels': [{}, {'channel_name': 'engineering'}]
+        }, ['exercise'])
+        config = ChannelConfigurationProvider(base, 1)
+        assert config.channel_name() == 'engineering'
+        assert config.bot_name() == 'Flexbot'
+        assert config.channel_configurations() == []
+        assert config.exercises() == ['exercise']
+        assert ChannelConfigurationProvider(base, 0).channel_name() == 'general'
+
+    def test_channel_configuration_reload(self):
+        base = InMemoryConfigurationProvider({
+            'channel_name': 'general',
+            'bot_name': 'Flexbot',
+            'channels': [{'channel_name': 'engineering'}]
+        })
+        config = ChannelConfigurationProvider(base, 0)
+        # The configuration file changes, and is only read again on reload
+        base.configuration.update({'bot_name': 'Liftbot'})
+        config.set_configuration()
+        assert config.bot_name() == 'Liftbot'
+        assert config.channel_name() == 'engineering'
+
+    def test_channel_configuration_reload_merges_every_channel(self):
+        base = InMemoryConfigurationProvider({
+            'channel_name': 'general',
+            'bot_name': 'Flexbot',
+            'channels': [{}, {'channel_name': 'engineering'}]
+        })
+        general = ChannelConfigurationProvider(base, 0)
+        engineering = ChannelConfigurationProvider(base, 1)
+        reloads = []
+        engineering.subscribe(lambda: reloads.append(True))
+        version = engineering.version
+        # The configuration file changes, and is only read again on reload
+        base.configuration.update({'bot_name': 'Liftbot'})
+
+        general.set_configuration()
+
+        assert general.bot_name() == 'Liftbot'
+        assert engineering.bot_name() == 'Liftbot'
+        assert engineering.version == version + 1
+        assert reloads == [True]
+
+    def test_channel_configuration_reload_without_channel(self):
+        base = InMemoryConfigurationProvider({
+            'channel_name': 'general',
+            'bot_name': 'Flexbot',
+            'channels': [{}, {'channel_name': 'engineering'}]
+        })
+        general = ChannelConfigurationProvider(base, 0)
+        engineering = ChannelConfigurationProvider(base, 1)
+        base.configuration.update({'bot_name': 'Liftbot', 'channels': [{}]})
+
+        general.set_configuration()
+
+        assert general.bot_name() == 'Liftbot'
+        assert engineering.channel_name() == 'engineering'
+        assert engineering.bot_name() == 'Liftbot'
+
+    def test_update_configuration_reloads(self):
+        config = InMemoryConfigurationProvider({'bot_name': 'Flexbot'})
+        reloads = []
+        config.subscribe(lambda: reloads.append(True))
+        version = config.version
+        config.update_configuration({'bot_name': 'Liftbot'})
+        assert config.bot_name() == 'Liftbot'
+        assert config.version == version + 1
+        assert reloads == [True]
@@ -0,0 +1,114 @@
+import random
+import unittest
+
+from flexbot import engines
+from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot.exercise import Exercise
+from flexbot.snapshot import DaySnapshot
+
+exercises = [
+    Exercise('pushups', 30, 40, 'reps', ''),
+    Exercise('situps', 30, 40, 'reps', '')
+]
+
+todays_exercises = {
+    'uid1': [{'exercise': 'pushups', 'reps': 30}, {'exercise': 'situps', 'reps': 30}],
+    'uid2': [{'exercise': 'situps', 'reps': 40}],
+    'uid3': [{'exercise': 'pushups', 'reps': 30}] * 3
+}
+
+current_winners = {
+    'uid2': [{'exercise': 'pushups', 'reps': 30}]
+}
+
+user_ids = ['uid1', 'uid2', 'uid3', 'uid4']
+
+def get_config(updates={}):
+    config = {
+        'user_exercise_limit': 3,
+        'aggregate_exercises': False,
+        'selection_engine': 'numpy'
+    }
+    config.update(updates)
+    return InMemoryConfigurationProvider(config)
+
+def get_engine(updates={}):
+    if engines.numpy is None:
+        raise unittest.SkipTest("numpy is not installed")
+    return engines.get_selection_engine(get_config(updates))
+
+class TestGetSelectionEngine(object):
+    def test_python(self):
+        assert engines.get_selection_engine(get_config({'selection_engine': 'python'})) is None
+
+    def test_numpy(self):
+        engine = get_engine()
+        assert isinstance(engine, engines.NumpySelectionEngine)
+
+class TestNumpySelectionEngine(object):
+    def test_eligible_users(self):
+        engine = get_engine()
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        assert engine.eligible_users(user_ids, snapshot) == ['uid1', 'uid4']
+
+    def test_eligible_users_aggregate(self):
+        engine = get_engine({'aggregate_exercises': True})
+        snapshot = DaySnapshot(todays_exercises, current_winners, True)
+        assert engine.eligible_users(user_ids, snapshot) == ['uid1', 'uid2', 'uid4']
+
+    def test_total_exercises(self):
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        assert get_engine().total_exercises(user_ids, snapshot) == 6
+        snapshot = DaySnapshot(todays_exercises, current_winners, True)
+        assert get_engine({'aggregate_exercises': True}).total_exercises(user_ids, snapshot) == 7
+
+    def test_select_users_prefers_prime_users(self):
+        engine = get_engine()
+        snapshot = DaySnapshot(todays_exercises, {}, False)
+        rng = random.Random(3)
+        for _ in range(10):
+            winners = engine.select_users(user_ids, exercises[0], 3, snapshot, rng)
+            # uid3 has no exercises left; uid1 has already done pushups
+            assert sorted(winners[:2]) == ['uid2', 'uid4']
+            assert winners[2:] == ['uid1']
+
+    def test_select_users_is_seeded(self):
+        engine = get_engine()
+        snapshot = DaySnapshot({}, {}, False)
+        many_users = ['uid{}'.format(i) for i in range(100)]
+        def select():
+            return engine.select_users(many_users, exercises[0], 5, snapshot, random.Random(42))
+        assert select() == select()
+        assert len(set(select())) == 5
+
+    def test_select_users_distribution(self):
+        engine = get_engine()
+        snapshot = DaySnapshot({'uid1': [{'exercise': 'situps', 'reps': 30}] * 2}, {}, False)
+        rng = random.Random(7)
+        counts = {'uid1': 0, 'uid2': 0}
+        for _ in range(4000):
+            counts[engine.select_users(['uid1', 'uid2'], exercises[0], 1, snapshot, rng)[0]] += 1
+        # uid1 has one exercise left and uid2 has three
+        assert 900 < counts['uid1'] < 1100
+
+    def test_arrays_follow_snapshots(self):
+        engine = get_engine()
+        engine.add_users(user_ids)
+        assert engine.eligible_users(user_ids, DaySnapshot(todays_exercises, current_winners,
+                False)) == ['uid1', 'uid4']
+        # uid2 has finished their pending exercise and uid3's exercises are from yesterday
+        snapshot = DaySnapshot({'uid1': todays_exercises['uid1']}, {}, False)
+        assert engine.eligible_users(user_ids, snapshot) == user_ids
+        assert engine.total_exercises(user_ids, snapshot) == 2
+
+    def test_remove_users(self):
+        engine = get_engine()
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        engine.add_users(user_ids)
+        engine.remove_users(['uid1', 'uid5'])
+        assert engine.arrays.user_ids == ['uid2', 'uid3', 'uid4']
+        assert engine.eligible_users(['uid3', 'uid4'], snapshot) == ['uid4']
+        assert engine.total_exercises(['uid2', 'uid3'], snapshot) == 4
+        # Users the engine doesn't know yet are added on the way
+        assert engine.eligible_users(['uid1'], snapshot) == ['uid1']
+        assert engine.total_exercises(['uid1'], snapshot) == 2
@@ -1,14 +1,43 @@
 import mock
+import os
+import shutil
+import tempfile
 
-from flexbot.configurators import ConfigurationProvider
+from flexbot.configurators import ConfigurationProvider, GenericConfigurationProvider, \
+        InMemoryConfigurationProvider
 from flexbot.constants import Constants
-from flexbot.logger_factory import LoggerFactory
+from flexbot.logger_factory import LoggerFactory, LoggerPool
 from flexbot import loggers
+from flexbot.exercise import Exercise
+from flexbot.write_behind import WriteBehindLogger
 
-def get_mock_config(logger_type=Constants.IN_MEMORY_LOGGER, settings={}):
+sample_exercise = Exercise('pushups', 30, 40, 'reps', '')
+
+def get_config_with_creds(logger_type, settings):
+    """
+    Returns a configuration whose logger settings have had the database credentials added, as
+    GenericConfigurationProvider does.
+    """
+    config = {
+        'workout_logger_type': logger_type,
+        'workout_logger_settings': dict(settings)
+    }
+    # Skip __init__, which would load a configuration file
+    provider = GenericConfigurationProvider.__new__(GenericConfigurationProvider)
+    with mock.patch('flexbot.configurators.open', mock.mock_open(read_data='secret'),
+            create=True):
+        config = provider.add_creds(config)
+    assert config['workout_logger_settings']['user'] == 'secret'
+    return InMemoryConfigurationProvider(config)
+
+def get_mock_config(logger_type=Constants.IN_MEMORY_LOGGER, settings={}, write_behind=False):
     mock_config = mock.Mock(spec=ConfigurationProvider)
     mock_config.workout_logger_type.return_value = logger_type
     mock_config.workout_logger_settings.return_value = settings
+    mock_config.write_behind_on.return_value = write_behind
+    mock_config.write_behind_batch_size.return_value = 10
+    mock_config.write_behind_flush_interval.return_value = 1
+    mock_config.write_behind_close_timeout.return_value = 5
     return mock_config
 
 class TestLoggerFactory(object):
@@ -26,6 +55,8 @@ class TestLoggerFactory(object):
 
     @mock.patch('flexbot.loggers.psycopg2')
     def test_postgres(self, fake_db_api):
+        cursor = fake_db_api.pool.ThreadedConnectionPool.return_value.getconn.return_value.cursor
+        cursor.return_value.fetchone.return_value = None
         settings = {
             'dbname': 'flexecution',
             'tablename': 'flexecution',
@@ -37,3 +68,101 @@ class TestLoggerFactory(object):
         logger = logger_factory.get_logger()
         assert type(logger) == loggers.PostgresDatabaseLogger
 
+
+    def test_write_behind(self):
+        mock_config = get_mock_config(write_behind=True)
+        logger_factory = LoggerFactory(mock_config)
+        logger = logger_factory.get_logger()
+        try:
+            assert type(logger) == WriteBehindLogger
+            assert type(logger.wrapped) == loggers.InMemoryLogger
+            assert logger.batch_size == 10
+        finally:
+            logger.close()
+
+    def test_sqlite(self):
+        directory = tempfile.mkdtemp()
+        try:
+            mock_config = get_mock_config(logger_type=Constants.SQLITE_DATABASE_LOGGER,
+                    settings={'path': os.path.join(directory, 'flexecution.db')})
+            logger_factory = LoggerFactory(mock_config)
+            logger = logger_factory.get_logger()
+            assert type(logger) == loggers.SqliteDatabaseLogger
+            logger.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_csv_with_creds(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            config = get_config_with_creds(Constants.CSV_LOGGER, {'compaction_threshold': 5})
+            logger = LoggerFactory(config).get_logger()
+            assert type(logger) == loggers.CsvLogger
+            assert logger.compaction_threshold == 5
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+    def test_sqlite_with_creds(self):
+        directory = tempfile.mkdtemp()
+        try:
+            config = get_config_with_creds(Constants.SQLITE_DATABASE_LOGGER, {
+                'path': os.path.join(directory, 'flexecution.db'),
+                'tablename': 'exercises'
+            })
+            logger = LoggerFactory(config).get_logger()
+            assert type(logger) == loggers.SqliteDatabaseLogger
+            assert logger.tablename == 'exercises'
+            logger.close()
+        finally:
+            shutil.rmtree(directory)
+
+class TestLoggerPool(object):
+    def test_shares_loggers_with_the_same_settings(self):
+        pool = LoggerPool()
+        first = pool.get_logger(get_mock_config(settings={'path': 'a'}))
+        assert pool.get_logger(get_mock_config(settings={'path': 'a'})) is first
+        assert pool.get_logger(get_mock_config(settings={'path': 'b'})) is not first
+        assert pool.get_logger(get_mock_config(settings={'path': 'a'}, write_behind=True)) \
+                is not first
+        closed = pool.close()
+        assert len(closed) == 3
+        assert first in closed
+
+    def test_channel_loggers(self):
+        pool = LoggerPool()
+        general = pool.get_logger(get_mock_config(), 'general')
+        engineering = pool.get_logger(get_mock_config(), 'engineering')
+        assert type(general) == loggers.ChannelLogger
+        assert general.wrapped is engineering.wrapped
+        assert pool.close() == [general.wrapped]
+
+    def test_unprefixed_channel_logger(self):
+        shared = loggers.InMemoryLogger()
+        shared.add_exercise('U1', sample_exercise, 30)
+        shared.add_exercise('engineering:U2', sample_exercise, 30)
+        general = loggers.ChannelLogger(shared, 'general', prefixed=False)
+        assert list(general.get_current_winners()) == ['U1']
+        assert general.finish_exercise('U1') == {'exercise': 'pushups', 'reps': 30}
+        assert general.finish_exercise('U2') is None
+
+    def test_csv_loggers_share_files(self):
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(directory)
+            pool = LoggerPool()
+            first = pool.get_logger(get_mock_config(logger_type=Constants.CSV_LOGGER,
+                settings={'compaction_threshold': 5}))
+            assert pool.get_logger(get_mock_config(logger_type=Constants.CSV_LOGGER,
+                settings={'compaction_threshold': 5, 'user': 'flexbot'})) is first
+            second = pool.get_logger(get_mock_config(logger_type=Constants.CSV_LOGGER,
+                settings={'compaction_threshold': 10}))
+            assert second is not first
+            assert second.compaction_threshold == 10
+            assert second.winners_lock is first.winners_lock
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
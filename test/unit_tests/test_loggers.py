@@ -0,0 +1,245 @@
+import datetime
+import mock
+import os
+import psycopg2
+import shutil
+import tempfile
+
+from flexbot.exercise import Exercise
+from flexbot.loggers import CsvTail, ExerciseIndex, InMemoryLogger, PooledPostgresConnector, \
+        PostgresConnectionPool, PostgresDatabaseLogger
+
+exercises = [
+    Exercise('pushups', 30, 40, 'reps', ''),
+    Exercise('situps', 30, 40, 'reps', '')
+]
+
+class TestExerciseIndex(object):
+    def test_rebuild(self):
+        index = ExerciseIndex()
+        index.rebuild({
+            'uid1': [{'exercise': 'pushups', 'reps': 30}, {'exercise': 'situps', 'reps': 30}]
+        }, {
+            'uid2': [{'exercise': 'pushups', 'reps': 30}]
+        })
+        assert index.count_for('uid1', 'pushups') == 1
+        assert index.total_for('uid1') == 2
+        assert index.total_for('uid2') == 0
+        assert index.pending_for('uid2') == 1
+
+    def test_assignments(self):
+        index = ExerciseIndex()
+        index.record_assignment('uid1')
+        index.record_assignment('uid1')
+        index.record_completion('uid1')
+        assert index.pending_for('uid1') == 1
+        index.record_completion('uid1')
+        index.record_completion('uid1')
+        assert index.pending_for('uid1') == 0
+
+    @mock.patch('flexbot.loggers.datetime')
+    def test_roll_over(self, mock_datetime):
+        mock_datetime.date.today.return_value = datetime.date(2016, 1, 1)
+        index = ExerciseIndex()
+        index.record_exercise('uid1', 'pushups')
+        index.record_assignment('uid1')
+        assert index.total_for('uid1') == 1
+
+        mock_datetime.date.today.return_value = datetime.date(2016, 1, 2)
+        assert index.total_for('uid1') == 0
+        assert index.count_for('uid1', 'pushups') == 0
+        assert index.pending_for('uid1') == 1
+
+class TestInMemoryLogger(object):
+    def test_counts(self):
+        logger = InMemoryLogger()
+        logger.log_exercise('uid1', exercises[0], 30)
+        logger.log_exercise('uid1', exercises[0], 35)
+        logger.log_exercise('uid1', exercises[1], 30)
+        assert logger.count_for('uid1', exercises[0]) == 2
+        assert logger.count_for('uid1', exercises[1]) == 1
+        assert logger.total_for('uid1') == 3
+        assert logger.get_todays_exercises()['uid1'][0] == {'exercise': 'pushups', 'reps': 30}
+
+    def test_get_todays_totals(self):
+        logger = InMemoryLogger()
+        logger.log_exercise('uid1', exercises[0], 30)
+        logger.log_exercise('uid1', exercises[0], 35)
+        logger.log_exercise('uid2', exercises[1], 40)
+        assert logger.get_todays_totals() == {
+            'uid1': {'pushups': {'count': 2, 'reps': 65}},
+            'uid2': {'situps': {'count': 1, 'reps': 40}}
+        }
+
+    def test_add_and_finish_exercise(self):
+        logger = InMemoryLogger()
+        logger.add_exercise('uid1', exercises[0], 30)
+        logger.add_exercise('uid1', exercises[1], 35)
+        assert logger.pending_for('uid1') == 2
+        assert logger.finish_exercise('uid1') == {'exercise': 'pushups', 'reps': 30}
+        assert logger.pending_for('uid1') == 1
+        assert logger.finish_exercise('uid1') == {'exercise': 'situps', 'reps': 35}
+        assert logger.finish_exercise('uid1') == None
+        assert logger.get_current_winners() == {}
+
+class TestCsvTail(object):
+    def apply_row(self, rows, row):
+        self.parsed.append(row)
+        rows.setdefault(row[0], []).append(row[1])
+
+    def run_with_file(self, test):
+        self.parsed = []
+        directory = tempfile.mkdtemp()
+        try:
+            test(os.path.join(directory, 'tail.csv'))
+        finally:
+            shutil.rmtree(directory)
+
+    def write(self, filename, mode, data):
+        with open(filename, mode) as f:
+            f.write(data)
+
+    def test_missing_file(self):
+        def test(filename):
+            assert CsvTail(filename, self.apply_row).read() == {}
+        self.run_with_file(test)
+
+    def test_appended_rows(self):
+        def test(filename):
+            tail = CsvTail(filename, self.apply_row)
+            self.write(filename, 'w', 'uid1,a\r\nuid2,b\r\n')
+            assert tail.read() == {'uid1': ['a'], 'uid2': ['b']}
+            self.write(filename, 'a', 'uid1,c\r\nuid3,')
+            assert tail.read() == {'uid1': ['a', 'c'], 'uid2': ['b']}
+            assert len(self.parsed) == 3
+            self.write(filename, 'a', 'd\r\n')
+            assert tail.read()['uid3'] == ['d']
+            assert len(self.parsed) == 4
+        self.run_with_file(test)
+
+    def test_truncated_file(self):
+        def test(filename):
+            tail = CsvTail(filename, self.apply_row)
+            self.write(filename, 'w', 'uid1,a\r\nuid2,b\r\n')
+            tail.read()
+            self.write(filename, 'w', 'uid3,c\r\n')
+            assert tail.read() == {'uid3': ['c']}
+        self.run_with_file(test)
+
+    def test_replaced_file(self):
+        def test(filename):
+            tail = CsvTail(filename, self.apply_row)
+            self.write(filename, 'w', 'uid1,a\r\n')
+            tail.read()
+            self.write(filename + '.new', 'w', 'uid2,b\r\nuid3,c\r\n')
+            os.rename(filename + '.new', filename)
+            assert tail.read() == {'uid2': ['b'], 'uid3': ['c']}
+        self.run_with_file(test)
+
+def make_connection(closed=0):
+    conn = mock.Mock()
+    conn.closed = closed
+    return conn
+
+class TestPostgresConnectionPool(object):
+    @mock.patch('psycopg2.pool.ThreadedConnectionPool')
+    def test_acquire_and_release(self, mock_pool_class):
+        conn = make_connection()
+        mock_pool_class.return_value.getconn.return_value = conn
+        pool = PostgresConnectionPool(1, 2, 30, dbname='test')
+        mock_pool_class.assert_not_called()
+
+        assert pool.acquire() == conn
+        mock_pool_class.assert_called_once_with(1, 2, dbname='test')
+        pool.release(conn)
+        mock_pool_class.return_value.putconn.assert_called_once_with(conn, close=False)
+        assert pool.stats()['acquisitions'] == 1
+
+    @mock.patch('psycopg2.pool.ThreadedConnectionPool')
+    def test_replaces_closed_connection(self, mock_pool_class):
+        closed_conn = make_connection(closed=1)
+        conn = make_connection()
+        mock_pool_class.return_value.getconn.side_effect = [closed_conn, conn]
+        pool = PostgresConnectionPool(1, 2, 30)
+
+        assert pool.acquire() == conn
+        mock_pool_class.return_value.putconn.assert_called_once_with(closed_conn, close=True)
+        assert pool.stats()['reconnects'] == 1
+
+    @mock.patch('psycopg2.pool.ThreadedConnectionPool')
+    def test_reconnect_on_broken_connection(self, mock_pool_class):
+        broken_conn = make_connection()
+        def fail(query):
+            broken_conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        broken_conn.cursor.return_value.execute.side_effect = fail
+        conn = make_connection()
+        conn.cursor.return_value.fetchall.return_value = [(1,)]
+        mock_pool_class.return_value.getconn.side_effect = [broken_conn, conn]
+
+        connector = PooledPostgresConnector()
+        connector.logger = mock.Mock()
+        connector.pool = PostgresConnectionPool(1, 2, 30)
+        def command(cursor):
+            cursor.execute("SELECT 1")
+            return cursor.fetchall()
+
+        assert connector.with_connection(command) == [(1,)]
+        conn.commit.assert_called_once_with()
+        putconn = mock_pool_class.return_value.putconn
+        putconn.assert_any_call(broken_conn, close=True)
+        putconn.assert_any_call(conn, close=False)
+
+class TestPostgresDatabaseLogger(object):
+    def executed_statements(self, schema_version, tablename='flexecution',
+            winners_table='winners'):
+        with mock.patch('psycopg2.pool.ThreadedConnectionPool') as mock_pool_class:
+            conn = make_connection()
+            mock_pool_class.return_value.getconn.return_value = conn
+            cursor = conn.cursor.return_value
+            cursor.fetchone.return_value = (schema_version,)
+            cursor.fetchall.return_value = []
+            PostgresDatabaseLogger(tablename, winners_table, dbname='test')
+            return [" ".join(c[0][0].split()) for c in cursor.execute.call_args_list]
+
+    def test_migrations_from_unversioned_schema(self):
+        statements = self.executed_statements(None)
+        assert any(s.startswith("CREATE TABLE IF NOT EXISTS flexecution (") for s in statements)
+        assert "ALTER TABLE winners ADD COLUMN id SERIAL PRIMARY KEY" in statements
+        assert "CREATE INDEX flexecution_user_id_time_idx ON flexecution (user_id, time)" in statements
+        assert "INSERT INTO flexecution_schema_version (version) VALUES (%s)" in statements
+
+    def test_migrations_from_version_one(self):
+        statements = self.executed_statements(1)
+        assert not any(s.startswith("CREATE TABLE IF NOT EXISTS flexecution (") for s in statements)
+        assert "ALTER TABLE flexecution ADD COLUMN id SERIAL PRIMARY KEY" in statements
+
+    def test_migrations_with_schema_qualified_tables(self):
+        statements = self.executed_statements(None, 'public.flexecution', 'public.winners')
+        assert "CREATE INDEX flexecution_time_idx ON public.flexecution (time)" in statements
+        assert "CREATE INDEX winners_winner_id_time_idx ON public.winners (winner_id, time)" \
+                in statements
+
+    def test_no_pending_migrations(self):
+        statements = self.executed_statements(2)
+        assert not any(s.startswith("ALTER TABLE") for s in statements)
+        assert not any(s.startswith("INSERT INTO flexecution_schema_version") for s in statements)
+
+    @mock.patch('psycopg2.pool.ThreadedConnectionPool')
+    def test_starts_with_database_down(self, mock_pool_class):
+        mock_pool_class.side_effect = psycopg2.OperationalError("could not connect to server")
+        logger = PostgresDatabaseLogger('flexecution', 'winners', dbname='test')
+        assert logger.get_todays_exercises() is None
+        # The next command connects once the database is back
+        mock_pool_class.side_effect = None
+        conn = make_connection()
+        conn.cursor.return_value.fetchall.return_value = [('miles', 'pushups', 30)]
+        mock_pool_class.return_value.getconn.return_value = conn
+        assert logger.get_todays_exercises() == {'miles': [{'exercise': 'pushups', 'reps': 30}]}
+        logger.close()
+        mock_pool_class.return_value.closeall.assert_called_once_with()
+
+    def test_todays_exercises_query_is_a_range(self):
+        statements = self.executed_statements(2)
+        query = [s for s in statements if s.startswith("SELECT user_id, exercise, reps")][0]
+        assert "time >= CURRENT_DATE::timestamp AND time < (CURRENT_DATE + 1)::timestamp" in query
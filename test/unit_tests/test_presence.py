@@ -0,0 +1,46 @@
+import mock
+
+from flexbot.presence import PresenceCache
+
+class TestPresenceCache(object):
+    @mock.patch('flexbot.presence.time')
+    def test_get_within_ttl(self, mock_time):
+        mock_time.time.return_value = 100
+        cache = PresenceCache(ttl=60)
+        cache.set('uid1', True)
+        mock_time.time.return_value = 159
+        assert cache.get('uid1') == True
+        assert cache.get('uid2') == None
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    @mock.patch('flexbot.presence.time')
+    def test_get_expired(self, mock_time):
+        mock_time.time.return_value = 100
+        cache = PresenceCache(ttl=60)
+        cache.set('uid1', False)
+        mock_time.time.return_value = 160
+        assert cache.get('uid1') == None
+        assert cache.stats()['size'] == 0
+
+    def test_disabled(self):
+        cache = PresenceCache(ttl=0)
+        cache.set('uid1', True)
+        assert cache.get('uid1') == None
+
+    def test_invalidate(self):
+        cache = PresenceCache(ttl=60)
+        cache.set('uid1', True)
+        cache.set('uid2', True)
+        cache.invalidate('uid1')
+        assert cache.get('uid1') == None
+        assert cache.get('uid2') == True
+        cache.invalidate()
+        assert cache.get('uid2') == None
+
+    def test_retain(self):
+        cache = PresenceCache(ttl=60)
+        cache.set('uid1', True)
+        cache.set('uid2', False)
+        cache.retain(['uid2'])
+        assert cache.get('uid1') == None
+        assert cache.get('uid2') == False
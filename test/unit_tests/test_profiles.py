@@ -0,0 +1,46 @@
+import mock
+import os
+import shutil
+import tempfile
+
+from flexbot.profiles import UserProfileCache
+from flexbot.user import User
+
+def with_cache(func):
+    def test(self, *args):
+        directory = tempfile.mkdtemp()
+        try:
+            return func(self, os.path.join(directory, 'users.db'), *args)
+        finally:
+            shutil.rmtree(directory)
+    test.__name__ = func.__name__
+    return test
+
+class TestUserProfileCache(object):
+    @with_cache
+    def test_store_and_load(self, path):
+        cache = UserProfileCache(path, 60)
+        cache.store([User('uid1', 'User1', 'User', '1'), User('uid2', 'User2', '', '')])
+
+        profiles = UserProfileCache(path, 60).load()
+        assert sorted(profiles.keys()) == ['uid1', 'uid2']
+        user, updated_at = profiles['uid1']
+        assert user.username == 'User1'
+        assert user.firstname == 'User'
+        assert user.lastname == '1'
+        assert not cache.is_stale(updated_at)
+
+    @with_cache
+    def test_remove(self, path):
+        cache = UserProfileCache(path, 60)
+        cache.store([User('uid1', 'User1', 'User', '1'), User('uid2', 'User2', '', '')])
+        cache.remove(['uid1'])
+        assert list(cache.load().keys()) == ['uid2']
+
+    @with_cache
+    def test_is_stale(self, path):
+        cache = UserProfileCache(path, 60)
+        with mock.patch('flexbot.profiles.time') as mock_time:
+            mock_time.time.return_value = 1000
+            assert not cache.is_stale(941)
+            assert cache.is_stale(940)
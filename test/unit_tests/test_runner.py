@@ -0,0 +1,146 @@
+from mock import Mock
+
+from flexbot.api import FlexbotApiClient
+from flexbot.bot import Bot
+from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot.exercise import Exercise
+from flexbot.manager import UserManager
+from flexbot.runner import ChannelMetrics, ChannelRunner
+from flexbot.scheduler import TimerScheduler
+from flexbot.user import User
+from flexbot.util import NoEligibleUsersException
+
+sample_exercise = Exercise('exercise1', 30, 40, 'reps', '')
+
+def get_runner_and_mocks(debug=False):
+    config = InMemoryConfigurationProvider({'debug': debug})
+    api = Mock(spec=FlexbotApiClient)
+    um = Mock(spec=UserManager)
+    bot = Mock(spec=Bot)
+    scheduler = Mock(spec=TimerScheduler)
+    runner = ChannelRunner('general', config, api, um, bot, scheduler)
+    return {
+        'api': api,
+        'bot': bot,
+        'runner': runner,
+        'scheduler': scheduler,
+        'user_manager': um
+    }
+
+class TestChannelRunner(object):
+    def test_first_office_hours(self):
+        mocks = get_runner_and_mocks()
+        runner = mocks['runner']
+        mocks['bot'].is_office_hours.return_value = True
+        mocks['bot'].select_exercise_and_start_time.return_value = (sample_exercise, 30, 5, ['id1'])
+
+        runner.step()
+
+        mocks['user_manager'].clear_users.assert_called_once_with()
+        mocks['scheduler'].schedule.assert_called_once_with(300, runner.run_guarded,
+                runner.assign, sample_exercise, 30, ['id1'])
+        assert runner.metrics.snapshot()['counts'] == {'announcements': 1}
+
+    def test_office_hours_end(self):
+        mocks = get_runner_and_mocks()
+        runner = mocks['runner']
+        runner.was_office_hours = True
+        mocks['bot'].is_office_hours.return_value = False
+        mocks['bot'].seconds_until_office_hours.return_value = 16 * 3600
+
+        runner.step()
+
+        mocks['user_manager'].stats.assert_called_once_with()
+        mocks['api'].post_flex_message.assert_called_once_with(
+                mocks['user_manager'].stats.return_value)
+        # Wait for office hours to begin rather than polling
+        mocks['scheduler'].schedule.assert_called_once_with(16 * 3600, runner.run_guarded,
+                runner.step)
+        mocks['bot'].select_exercise_and_start_time.assert_not_called()
+
+    def test_assign_schedules_next_step(self):
+        mocks = get_runner_and_mocks()
+        runner = mocks['runner']
+        mocks['bot'].assign_exercise.return_value = [User('id1', 'username1', 'real name', '1')]
+
+        runner.assign(sample_exercise, 30, ['id1'])
+
+        mocks['bot'].assign_exercise.assert_called_once_with(sample_exercise, 30, ['id1'])
+        mocks['scheduler'].schedule.assert_called_once_with(0, runner.run_guarded, runner.step)
+        assert runner.metrics.snapshot()['counts'] == {'assignments': 1, 'winners': 1}
+
+    def test_no_eligible_users_retries_later(self):
+        mocks = get_runner_and_mocks()
+        runner = mocks['runner']
+        mocks['bot'].assign_exercise.side_effect = NoEligibleUsersException()
+
+        runner.run_guarded(runner.assign, sample_exercise, 30)
+
+        mocks['scheduler'].schedule.assert_called_once_with(300, runner.run_guarded, runner.step)
+        snapshot = runner.metrics.snapshot()
+        assert snapshot['counts'] == {'no_eligible_users': 1}
+        assert snapshot['timings']['assign']['count'] == 1
+
+    def test_failed_step_retries_later(self):
+        mocks = get_runner_and_mocks()
+        runner = mocks['runner']
+        mocks['bot'].is_office_hours.side_effect = ValueError()
+
+        runner.run_guarded(runner.step)
+
+        mocks['scheduler'].schedule.assert_called_once_with(300, runner.run_guarded, runner.step)
+        assert runner.metrics.snapshot()['counts'] == {'errors': 1}
+
+    def test_wake_runs_waiting_step(self):
+        runner = ChannelRunner('general', InMemoryConfigurationProvider({}), Mock(), Mock(),
+                Mock(), TimerScheduler())
+        runner.schedule(3600, runner.step)
+        waiting = runner.timer
+
+        assert runner.wake()
+
+        assert waiting.cancelled
+        assert runner.next_step_time() < waiting.when
+        assert runner.timer.args == (runner.step,)
+        assert runner.scheduler.pending() == 1
+
+    def test_wake_leaves_announced_exercise(self):
+        runner = ChannelRunner('general', InMemoryConfigurationProvider({}), Mock(), Mock(),
+                Mock(), TimerScheduler())
+        runner.schedule(300, runner.assign, sample_exercise, 30)
+        announced = runner.timer
+
+        assert not runner.wake()
+
+        assert runner.timer is announced
+        assert not announced.cancelled
+
+    def test_reload_wakes_runner(self):
+        config = InMemoryConfigurationProvider({})
+        runner = ChannelRunner('general', config, Mock(), Mock(), Mock(), TimerScheduler())
+        runner.start()
+        runner.schedule(3600, runner.step)
+        waiting = runner.timer
+
+        config.set_configuration()
+
+        assert waiting.cancelled
+        assert runner.metrics.snapshot()['counts'] == {'wakeups': 1}
+
+    def test_start_subscribes_to_users(self):
+        runner_and_mocks = get_runner_and_mocks()
+        runner = runner_and_mocks['runner']
+
+        runner.start()
+
+        runner_and_mocks['user_manager'].subscribe.assert_called_once_with(runner.wake)
+
+class TestChannelMetrics(object):
+    def test_snapshot(self):
+        metrics = ChannelMetrics()
+        metrics.increment('winners', 3)
+        metrics.observe('step', 1.0)
+        metrics.observe('step', 3.0)
+        snapshot = metrics.snapshot()
+        assert snapshot['counts'] == {'winners': 3}
+        assert snapshot['timings']['step'] == {'count': 2, 'avg': 2.0, 'max': 3.0}
@@ -0,0 +1,31 @@
+import random
+
+from flexbot.sampling import WeightedSampler
+
+class TestWeightedSampler(object):
+    def test_sample_without_replacement(self):
+        sampler = WeightedSampler(['a', 'b', 'c'], [1, 2, 3])
+        drawn = sampler.sample(random.Random(1), 5)
+        assert sorted(drawn) == ['a', 'b', 'c']
+        assert sampler.total == 0
+        assert sampler.draw(random.Random(1)) is None
+
+    def test_zero_weights_never_drawn(self):
+        for seed in range(20):
+            sampler = WeightedSampler(['a', 'b', 'c', 'd'], [0, 2, -1, 1])
+            assert sorted(sampler.sample(random.Random(seed), 4)) == ['b', 'd']
+
+    def test_find_covers_each_unit_of_weight(self):
+        weights = [3, 0, 1, 4, 2, 5, 1]
+        sampler = WeightedSampler(range(len(weights)), weights)
+        expected = []
+        for index, weight in enumerate(weights):
+            expected.extend([index] * weight)
+        assert [sampler.find(target) for target in range(sum(weights))] == expected
+
+    def test_distribution_matches_weights(self):
+        rng = random.Random(7)
+        counts = {'a': 0, 'b': 0}
+        for _ in range(4000):
+            counts[WeightedSampler(['a', 'b'], [1, 3]).draw(rng)] += 1
+        assert 900 < counts['a'] < 1100
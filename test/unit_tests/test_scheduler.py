@@ -0,0 +1,75 @@
+import threading
+import time
+
+from flexbot.scheduler import TimerScheduler
+
+class TestTimerScheduler(object):
+    def test_runs_timers_in_order(self):
+        scheduler = TimerScheduler(max_workers=1).start()
+        fired = []
+        done = threading.Event()
+        try:
+            scheduler.schedule(0.05, fired.append, 'second')
+            scheduler.schedule(0.1, lambda: done.set())
+            scheduler.schedule(0, fired.append, 'first')
+            assert done.wait(5)
+            assert fired == ['first', 'second']
+            assert scheduler.pending() == 0
+        finally:
+            scheduler.stop()
+
+    def test_cancelled_timer_does_not_run(self):
+        scheduler = TimerScheduler(max_workers=1).start()
+        fired = []
+        done = threading.Event()
+        try:
+            timer = scheduler.schedule(0.02, fired.append, 'cancelled')
+            timer.cancel()
+            scheduler.schedule(0.05, lambda: done.set())
+            assert done.wait(5)
+            assert fired == []
+        finally:
+            scheduler.stop()
+
+    def test_next_fire_time(self):
+        scheduler = TimerScheduler()
+        assert scheduler.next_fire_time() is None
+        later = scheduler.schedule_at(2000, lambda: None)
+        scheduler.schedule_at(3000, lambda: None)
+        assert scheduler.next_fire_time() == 2000
+        later.cancel()
+        assert scheduler.next_fire_time() == 3000
+        assert scheduler.pending() == 1
+
+    def test_failing_callback_does_not_stop_scheduler(self):
+        scheduler = TimerScheduler(max_workers=1).start()
+        done = threading.Event()
+        def fail():
+            raise ValueError()
+        try:
+            scheduler.schedule(0, fail)
+            scheduler.schedule(0.01, lambda: done.set())
+            assert done.wait(5)
+        finally:
+            scheduler.stop()
+
+    def test_stop_drains_running_callbacks(self):
+        scheduler = TimerScheduler(max_workers=1).start()
+        started = threading.Event()
+        finished = []
+        def slow():
+            started.set()
+            time.sleep(0.05)
+            finished.append(True)
+        scheduler.schedule(0, slow)
+        scheduler.schedule(60, finished.append, False)
+        assert started.wait(5)
+        scheduler.stop(drain=True)
+        assert finished == [True]
+
+    def test_cancel_after_start(self):
+        scheduler = TimerScheduler()
+        timer = scheduler.schedule(0, lambda: None)
+        assert timer.claim()
+        assert not timer.cancel()
+        assert not timer.cancelled
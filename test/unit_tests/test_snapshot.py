@@ -0,0 +1,67 @@
+import mock
+
+from flexbot.loggers import BaseLogger
+from flexbot.snapshot import DaySnapshot
+
+todays_exercises = {
+    'uid1': [
+        {'exercise': 'pushups', 'reps': 30},
+        {'exercise': 'pushups', 'reps': 35},
+        {'exercise': 'situps', 'reps': 30}
+    ],
+    'uid2': [
+        {'exercise': 'situps', 'reps': 40}
+    ]
+}
+
+current_winners = {
+    'uid2': [{'exercise': 'pushups', 'reps': 30}],
+    'uid3': []
+}
+
+class TestDaySnapshot(object):
+    def test_exercise_count(self):
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        assert snapshot.exercise_count('uid1', 'pushups') == 2
+        assert snapshot.exercise_count('uid1', 'situps') == 1
+        assert snapshot.exercise_count('uid2', 'pushups') == 0
+        assert snapshot.exercise_count('uid4', 'pushups') == 0
+
+    def test_counts_by_user(self):
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        assert snapshot.totals() == {'uid1': 3, 'uid2': 1}
+        assert snapshot.pending_counts() == {'uid2': 1, 'uid3': 0}
+        assert snapshot.exercise_counts('pushups') == {'uid1': 2}
+        assert snapshot.exercise_counts('situps') == {'uid1': 1, 'uid2': 1}
+        assert snapshot.exercise_counts('planks') == {}
+
+    def test_total_exercises(self):
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        assert snapshot.total_exercises('uid1') == 3
+        assert snapshot.total_exercises('uid2') == 1
+        assert snapshot.total_exercises('uid4') == 0
+
+    def test_total_exercises_aggregate(self):
+        snapshot = DaySnapshot(todays_exercises, current_winners, True)
+        assert snapshot.total_exercises('uid1') == 3
+        assert snapshot.total_exercises('uid2') == 2
+
+    def test_winner_ids(self):
+        snapshot = DaySnapshot(todays_exercises, current_winners, False)
+        assert snapshot.winner_ids() == ['uid2']
+        assert snapshot.pending_exercises('uid2') == ({'exercise': 'pushups', 'reps': 30},)
+        assert snapshot.pending_exercises('uid1') == ()
+
+    def test_from_logger(self):
+        logger = mock.Mock(spec=BaseLogger)
+        logger.get_todays_exercises.return_value = todays_exercises
+        logger.get_current_winners.return_value = current_winners
+        snapshot = DaySnapshot.from_logger(logger, False)
+        logger.get_todays_exercises.assert_called_once_with()
+        logger.get_current_winners.assert_called_once_with()
+        assert snapshot.total_exercises('uid1') == 3
+
+    def test_from_failed_read(self):
+        snapshot = DaySnapshot(None, None, True)
+        assert snapshot.total_exercises('uid1') == 0
+        assert snapshot.winner_ids() == []
@@ -0,0 +1,207 @@
+import mock
+import requests
+import threading
+
+from flexbot.transport import LatencyHistogram, SlackSession, TokenBucket
+
+def make_response(status_code, headers={}):
+    response = mock.Mock(spec=requests.Response)
+    response.status_code = status_code
+    response.headers = headers
+    return response
+
+class TestTokenBucket(object):
+    @mock.patch('flexbot.transport.time')
+    def test_reserve(self, mock_time):
+        mock_time.time.return_value = 100.0
+        bucket = TokenBucket(1.0, 2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 1.0
+        assert bucket.reserve() == 2.0
+        mock_time.time.return_value = 104.0
+        assert bucket.reserve() == 0
+
+    @mock.patch('flexbot.transport.time')
+    def test_pause(self, mock_time):
+        mock_time.time.return_value = 100.0
+        bucket = TokenBucket(None, None)
+        assert bucket.reserve() == 0
+        bucket.pause(5)
+        mock_time.time.return_value = 102.0
+        assert bucket.reserve() == 3.0
+
+class TestSlackSession(object):
+    def test_rewrite_url(self):
+        session = SlackSession("http://localhost:8900/api")
+        assert session.rewrite_url("https://slack.com/api/users.info") == \
+                "http://localhost:8900/api/users.info"
+        assert session.rewrite_url("https://example.com/hook") == "https://example.com/hook"
+
+    def test_no_rewrite_by_default(self):
+        session = SlackSession()
+        assert session.rewrite_url("https://slack.com/api/users.info") == \
+                "https://slack.com/api/users.info"
+
+    @mock.patch('requests.Session.request')
+    def test_request_rewritten(self, mock_request):
+        mock_request.return_value = make_response(200)
+        session = SlackSession("http://localhost:8900/api/")
+        session.request('get', "https://slack.com/api/channels.list", params={'token': 'x'})
+        mock_request.assert_called_once_with('get', "http://localhost:8900/api/channels.list",
+                params={'token': 'x'})
+
+    @mock.patch('flexbot.transport.time.sleep')
+    @mock.patch('requests.Session.request')
+    def test_retry_after(self, mock_request, mock_sleep):
+        mock_request.side_effect = [make_response(429, {'Retry-After': '2'}), make_response(200)]
+        session = SlackSession(backoff_base=0)
+        response = session.request('get', "https://slack.com/api/users.info",
+                params={'user': 'uid1'})
+        assert response.status_code == 200
+        assert mock_request.call_count == 2
+        # The retry waits out the Retry-After period
+        assert 1.9 < mock_sleep.call_args[0][0] <= 2
+        stats = session.throttle_stats()['users.info']
+        assert stats['rate_limited'] == 1
+        assert stats['retries'] == 1
+        assert stats['requests'] == 2
+
+    @mock.patch('flexbot.transport.time.sleep')
+    @mock.patch('requests.Session.request')
+    def test_gives_up_after_max_retries(self, mock_request, mock_sleep):
+        mock_request.return_value = make_response(429, {'Retry-After': '0'})
+        session = SlackSession(max_retries=2)
+        response = session.request('get', "https://slack.com/api/users.info")
+        assert response.status_code == 429
+        assert mock_request.call_count == 3
+
+    @mock.patch('flexbot.transport.time.sleep')
+    @mock.patch('requests.Session.request')
+    def test_backoff_on_connection_error(self, mock_request, mock_sleep):
+        mock_request.side_effect = [requests.ConnectionError(), make_response(200)]
+        session = SlackSession()
+        response = session.request('get', "https://slack.com/api/users.getPresence")
+        assert response.status_code == 200
+        assert 0 <= mock_sleep.call_args[0][0] <= 0.5
+
+    @mock.patch('flexbot.transport.time.sleep')
+    @mock.patch('requests.Session.request')
+    def test_methods_not_paced_by_default(self, mock_request, mock_sleep):
+        mock_request.return_value = make_response(200)
+        session = SlackSession()
+        for _ in range(200):
+            session.request('get', "https://slack.com/api/users.getPresence",
+                    params={'user': 'U1'})
+        mock_sleep.assert_not_called()
+        assert 'throttled' not in session.throttle_stats()['users.getPresence']
+
+    @mock.patch('requests.Session.request')
+    def test_post_not_retried_on_connection_error(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError()
+        session = SlackSession()
+        try:
+            session.request('post', "https://slack.com/api/chat.postMessage", data={})
+            assert False
+        except requests.ConnectionError:
+            pass
+        assert mock_request.call_count == 1
+
+    @mock.patch('requests.Session.request')
+    def test_coalesce_inflight_requests(self, mock_request):
+        release = threading.Event()
+        started = threading.Event()
+        def slow_request(*args, **kwargs):
+            started.set()
+            release.wait()
+            return make_response(200)
+        mock_request.side_effect = slow_request
+        session = SlackSession()
+        responses = []
+        def get_presence():
+            responses.append(session.request('get', "https://slack.com/api/users.getPresence",
+                params={'user': 'uid1'}))
+        first = threading.Thread(target=get_presence)
+        first.start()
+        started.wait()
+        second = threading.Thread(target=get_presence)
+        second.start()
+        while session.throttle_stats()['users.getPresence'].get('coalesced', 0) == 0:
+            second.join(0.01)
+        release.set()
+        first.join()
+        second.join()
+        assert mock_request.call_count == 1
+        assert len(responses) == 2
+        assert responses[0] is responses[1]
+
+    @mock.patch('requests.Session.request')
+    def test_coalesced_request_times_out(self, mock_request):
+        release = threading.Event()
+        started = threading.Event()
+        def hung_request(*args, **kwargs):
+            started.set()
+            release.wait()
+            return make_response(200)
+        mock_request.side_effect = hung_request
+        session = SlackSession(connect_timeout=0.05)
+        first = threading.Thread(target=session.request,
+                args=('get', "https://slack.com/api/users.getPresence"),
+                kwargs={'params': {'user': 'uid1'}, 'timeout': 0.05})
+        first.start()
+        try:
+            started.wait()
+            try:
+                session.request('get', "https://slack.com/api/users.getPresence",
+                        params={'user': 'uid1'}, timeout=0.05)
+                assert False
+            except requests.Timeout:
+                pass
+        finally:
+            release.set()
+            first.join()
+        assert mock_request.call_count == 1
+
+    def test_total_timeout(self):
+        assert SlackSession().total_timeout(10) == 20
+        assert SlackSession(connect_timeout=2).total_timeout(10) == 12
+        assert SlackSession().total_timeout((3, 10)) == 13
+        assert SlackSession().total_timeout(None) is None
+
+class TestLatencyHistogram(object):
+    def test_observe(self):
+        histogram = LatencyHistogram([10, 100])
+        for seconds in [0.001, 0.002, 0.05, 0.5]:
+            histogram.observe(seconds)
+        snapshot = histogram.snapshot()
+        assert snapshot['count'] == 4
+        assert snapshot['buckets'] == [[10, 2], [100, 1], [None, 1]]
+        assert snapshot['p50_ms'] == 10
+        assert snapshot['p90_ms'] == 500
+        assert snapshot['max_ms'] == 500
+
+    def test_empty(self):
+        assert LatencyHistogram().snapshot()['p50_ms'] is None
+
+class TestSlackSessionConnections(object):
+    def test_pool_size(self):
+        session = SlackSession(pool_size=25)
+        adapter = session.get_adapter("https://slack.com/api/users.info")
+        assert adapter._pool_maxsize == 25
+        assert session.headers['Connection'] == 'keep-alive'
+        assert 'gzip' in session.headers['Accept-Encoding']
+
+    @mock.patch('requests.Session.request')
+    def test_connect_timeout(self, mock_request):
+        mock_request.return_value = make_response(200)
+        session = SlackSession(connect_timeout=3)
+        session.request('get', "https://slack.com/api/users.info", timeout=10)
+        assert mock_request.call_args[1]['timeout'] == (3, 10)
+
+    @mock.patch('requests.Session.request')
+    def test_latency_recorded(self, mock_request):
+        mock_request.return_value = make_response(200)
+        session = SlackSession()
+        session.request('get', "https://slack.com/api/users.info", params={'user': 'uid1'})
+        session.request('get', "https://slack.com/api/users.info", params={'user': 'uid2'})
+        assert session.latency_stats()['users.info']['count'] == 2
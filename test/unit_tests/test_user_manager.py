@@ -1,7 +1,12 @@
 import mock
+import os
+import shutil
+import tempfile
+import unittest
 
 from flexbot.api import FlexbotApiClient
 from flexbot.configurators import InMemoryConfigurationProvider
+from flexbot import engines
 from flexbot.constants import Constants
 from flexbot.exercise import Exercise
 from flexbot.loggers import BaseLogger
@@ -24,6 +29,8 @@ def make_user_manager(updates={}):
     config.update(updates)
     mock_api = get_mock_api()
     logger = mock.Mock(spec=BaseLogger)
+    logger.get_todays_exercises.return_value = {}
+    logger.get_current_winners.return_value = {}
     um = UserManager(mock_api, get_sample_config(config), logger)
     return {
         'user_manager': um,
@@ -82,6 +89,54 @@ class TestUserManager(object):
         assert um.users['uid3'].firstname == ''
         assert um.users['uid3'].lastname == ''
 
+    def test_fetch_users_removes_departed_users(self):
+        um_and_mocks = make_user_manager()
+        um = um_and_mocks['user_manager']
+        um.api.get_members = lambda: ['uid1', 'uid3']
+        um.fetch_users()
+        assert sorted(um.users.keys()) == ['uid1', 'uid3']
+
+    def test_fetch_users_bulk_sync(self):
+        directory = [
+            {'id': 'uid0', 'name': 'User0', 'profile': {}},
+            {'id': 'uid1', 'name': 'User1', 'profile': {'first_name': 'User', 'last_name': '1'}},
+            {'id': 'uid2', 'name': 'User2', 'profile': {'first_name': 'User', 'last_name': '2'}},
+            {'id': 'uid3', 'name': 'User3', 'profile': {}}
+        ]
+        mock_api = get_mock_api()
+        mock_api.get_user_info = mock.Mock()
+        mock_api.get_users = mock.Mock(return_value=directory)
+        config = get_sample_config({"user_sync": {"mode": Constants.USER_SYNC_BULK}})
+        um = UserManager(mock_api, config, mock.Mock(spec=BaseLogger))
+        assert sorted(um.users.keys()) == ['uid1', 'uid2', 'uid3']
+        assert um.get_firstname('uid2') == 'User'
+        mock_api.get_user_info.assert_not_called()
+
+        directory[1] = {'id': 'uid1', 'name': 'Renamed', 'profile': {}}
+        directory.append({'id': 'uid4', 'name': 'User4', 'profile': {}})
+        added, updated, removed = um.sync_users(['uid1', 'uid2', 'uid4'])
+        assert added == ['uid4']
+        assert updated == ['uid1']
+        assert removed == ['uid3']
+        assert um.get_username('uid1') == 'Renamed'
+        assert sorted(um.users.keys()) == ['uid1', 'uid2', 'uid4']
+
+    def test_updates_do_not_modify_users_in_place(self):
+        um_and_mocks = make_user_manager()
+        um = um_and_mocks['user_manager']
+        users = um.users
+        um.api.get_members = lambda: ['uid1', 'uid3']
+        um.fetch_users()
+        # Readers iterating the old hash don't see it change under them
+        assert sorted(users.keys()) == ['uid1', 'uid2', 'uid3']
+        assert sorted(um.users.keys()) == ['uid1', 'uid3']
+
+        users = um.users
+        um.api.get_users = lambda page_size: []
+        um.sync_users(['uid1'])
+        assert sorted(users.keys()) == ['uid1', 'uid3']
+        assert sorted(um.users.keys()) == ['uid1']
+
     def test_fetch_active_users(self):
         um_and_mocks = make_user_manager()
         um = um_and_mocks['user_manager']
@@ -90,6 +145,69 @@ class TestUserManager(object):
         assert 'uid1' in active_users
         assert 'uid2' in active_users
 
+    def test_fetch_active_users_failed_lookup(self):
+        um_and_mocks = make_user_manager({"presence": {"max_workers": 2}})
+        um = um_and_mocks['user_manager']
+        def is_active(user_id):
+            if user_id == 'uid2':
+                raise Exception("timed out")
+            return user_id == 'uid1'
+        um.api.is_active = is_active
+        active_users = um.fetch_active_users()
+        assert active_users == ['uid1']
+
+    def test_fetch_active_users_cached(self):
+        um_and_mocks = make_user_manager({"presence": {"ttl": 60}})
+        um = um_and_mocks['user_manager']
+        lookups = []
+        def is_active(user_id):
+            lookups.append(user_id)
+            return user_id == 'uid1'
+        um.api.is_active = is_active
+        assert um.fetch_active_users() == ['uid1']
+        assert um.fetch_active_users() == ['uid1']
+        assert len(lookups) == 3
+
+        um.invalidate_presence('uid2')
+        um.fetch_active_users()
+        assert lookups[3:] == ['uid2']
+
+    def test_fetch_users_from_profile_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            user_cache = {"user_cache": {"path": os.path.join(directory, 'users.db')}}
+            make_user_manager(user_cache)
+
+            um_and_mocks = make_user_manager(user_cache)
+            um = um_and_mocks['user_manager']
+            um.api.get_user_info = mock.Mock()
+            um.clear_users()
+            um.fetch_users()
+            assert um.get_username('uid1') == 'User1'
+            assert um.get_firstname('uid2') == 'User'
+            assert 'uid3' in um.users
+            um.api.get_user_info.assert_not_called()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stats(self):
+        um_and_mocks = make_user_manager({"aggregate_exercises": True})
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        logger.get_todays_totals.return_value = {
+            'uid1': {
+                'pushups': {'count': 2, 'reps': 65},
+                'situps': {'count': 1, 'reps': 30}
+            }
+        }
+        logger.pending_for.side_effect = lambda user_id: 1 if user_id == 'uid2' else 0
+        lines = um.stats(['uid1', 'uid2']).split("\n")
+        assert lines[2].split() == ['Username', 'pushups', 'situps', 'Total']
+        assert lines[4].split() == ['User1', '2', '1', '3']
+        assert lines[5].split() == ['User2', '0', '0', '1']
+        logger.get_todays_totals.assert_called_once_with()
+        logger.get_todays_exercises.assert_not_called()
+
     def test_clear_users(self):
         um_and_mocks = make_user_manager()
         um = um_and_mocks['user_manager']
@@ -140,6 +258,46 @@ class TestUserManager(object):
         assert len(eligible_users) == 1
         assert eligible_users[0] == 'uid2'
 
+    def test_get_eligible_users_numpy_engine(self):
+        if engines.numpy is None:
+            raise unittest.SkipTest("numpy is not installed")
+        um_and_mocks = make_user_manager({"selection_engine": "numpy"})
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        logger.get_current_winners.return_value = {
+            'uid1': [{
+                'exercise': 'pushups',
+                'reps': 30
+            }]
+        }
+        assert um.get_eligible_users() == ['uid2']
+
+    def test_numpy_engine_follows_members(self):
+        if engines.numpy is None:
+            raise unittest.SkipTest("numpy is not installed")
+        um = make_user_manager({"selection_engine": "numpy"})['user_manager']
+        assert sorted(um.engine.arrays.user_ids) == ['uid1', 'uid2', 'uid3']
+        um.api.get_members = lambda: ['uid1', 'uid3']
+        um.fetch_users()
+        assert sorted(um.engine.arrays.user_ids) == ['uid1', 'uid3']
+        um.clear_users()
+        assert um.engine.arrays.user_ids == []
+
+    def test_get_eligible_users_reads_logger_once(self):
+        um_and_mocks = make_user_manager({"aggregate_exercises": True})
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        um.get_eligible_users()
+        assert logger.get_todays_exercises.call_count == 1
+        assert logger.get_current_winners.call_count == 1
+
+    def test_get_eligible_users_reuses_active_users(self):
+        um_and_mocks = make_user_manager()
+        um = um_and_mocks['user_manager']
+        um.api.is_active = mock.Mock(side_effect=AssertionError())
+
+        assert um.get_eligible_users(active_users=['uid1', 'uid2', 'uid4']) == ['uid1', 'uid2']
+
     def test_get_eligible_users_aggregate_exercises(self):
         um_and_mocks = make_user_manager({"aggregate_exercises": True})
         um = um_and_mocks['user_manager']
@@ -213,23 +371,54 @@ class TestUserManager(object):
         assert result == Constants.ACKNOWLEDGE_SUCCEEDED
         assert logger.log_exercise.call_count == 1
 
-    def test_mark_winner_ack_enabled(self):
+    def test_new_eligible_users_notify_listeners(self):
+        um_and_mocks = make_user_manager()
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        logger.finish_exercise.return_value = {
+            'exercise': 'pushups',
+            'reps': 30
+        }
+        listener = mock.Mock()
+        um.subscribe(listener)
+
+        members = um.api.get_members
+        um.api.get_members = lambda: ['uid1', 'uid2']
+        um.fetch_users()
+        assert listener.call_count == 0
+
+        um.api.get_members = members
+        um.fetch_users()
+        assert listener.call_count == 1
+
+        um.acknowledge_winner('uid1')
+        assert listener.call_count == 2
+
+    def test_mark_winners_ack_enabled(self):
         um_and_mocks = make_user_manager()
         um = um_and_mocks['user_manager']
         logger = um_and_mocks['logger']
         exercise = get_sample_exercises()[0]
-        um.mark_winner('uid1', exercise, 30)
-        logger.add_exercise.assert_called_once_with('uid1', exercise, 30)
-        logger.log_exercise.assert_not_called()
+        um.mark_winners(['uid1', 'uid2'], exercise, 30)
+        logger.add_exercises.assert_called_once_with([('uid1', exercise, 30), ('uid2', exercise, 30)])
+        logger.log_exercises.assert_not_called()
 
-    def test_mark_winner_ack_disabled(self):
+    def test_mark_winners_ack_disabled(self):
         um_and_mocks = make_user_manager({"enable_acknowledgment": False})
         um = um_and_mocks['user_manager']
         logger = um_and_mocks['logger']
         exercise = get_sample_exercises()[0]
-        um.mark_winner('uid1', exercise, 30)
-        logger.add_exercise.assert_not_called()
-        logger.log_exercise.assert_called_once_with('uid1', exercise, 30)
+        um.mark_winners(['uid1'], exercise, 30)
+        logger.add_exercises.assert_not_called()
+        logger.log_exercises.assert_called_once_with([('uid1', exercise, 30)])
+
+    def test_mark_winner(self):
+        um_and_mocks = make_user_manager()
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        exercise = get_sample_exercises()[0]
+        um.mark_winner('uid12', exercise, 30)
+        logger.add_exercises.assert_called_once_with([('uid12', exercise, 30)])
 
     def test_add_exercise_for_user(self):
         um_and_mocks = make_user_manager({"enable_acknowledgment": False})
@@ -243,16 +432,19 @@ class TestUserManager(object):
         um_and_mocks = make_user_manager({"enable_acknowledgment": False})
         um = um_and_mocks['user_manager']
         logger = um_and_mocks['logger']
-        logger.get_todays_exercises.return_value = {
-            'uid1': [{
-                'exercise': 'pushups',
-                'reps': 30
-            }]
-        }
+        logger.total_for.side_effect = lambda user_id: 1 if user_id == 'uid1' else 0
         assert um.total_exercises_for_user('uid1') == 1
         assert um.total_exercises_for_user('uid3') == 0
 
-    def test_exercise_count_for_user(self):
+    def test_total_exercises_for_user_aggregate(self):
+        um_and_mocks = make_user_manager({"aggregate_exercises": True})
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        logger.total_for.return_value = 1
+        logger.pending_for.return_value = 2
+        assert um.total_exercises_for_user('uid1') == 3
+
+    def test_total_exercises_for_user_snapshot(self):
         um_and_mocks = make_user_manager({"enable_acknowledgment": False})
         um = um_and_mocks['user_manager']
         logger = um_and_mocks['logger']
@@ -262,6 +454,17 @@ class TestUserManager(object):
                 'reps': 30
             }]
         }
+        snapshot = um.get_day_snapshot()
+        assert um.total_exercises_for_user('uid1', snapshot) == 1
+        assert um.exercise_count_for_user('uid1', get_sample_exercises()[0], snapshot) == 1
+        logger.total_for.assert_not_called()
+
+    def test_exercise_count_for_user(self):
+        um_and_mocks = make_user_manager({"enable_acknowledgment": False})
+        um = um_and_mocks['user_manager']
+        logger = um_and_mocks['logger']
+        logger.count_for.side_effect = lambda user_id, exercise: \
+                1 if (user_id, exercise.name) == ('uid1', 'pushups') else 0
         sample_exercises = get_sample_exercises()
         assert um.exercise_count_for_user('uid1', sample_exercises[0]) == 1
         assert um.exercise_count_for_user('uid1', sample_exercises[1]) == 0
@@ -271,12 +474,8 @@ class TestUserManager(object):
         um_and_mocks = make_user_manager({"enable_acknowledgment": False})
         um = um_and_mocks['user_manager']
         logger = um_and_mocks['logger']
-        logger.get_todays_exercises.return_value = {
-            'uid1': [{
-                'exercise': 'pushups',
-                'reps': 30
-            }]
-        }
+        logger.count_for.side_effect = lambda user_id, exercise: \
+                1 if (user_id, exercise.name) == ('uid1', 'pushups') else 0
         sample_exercises = get_sample_exercises()
         assert um.user_has_done_exercise('uid1', sample_exercises[0])
         assert not um.user_has_done_exercise('uid1', sample_exercises[1])
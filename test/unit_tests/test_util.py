@@ -1,4 +1,7 @@
 import mock
+import os
+import shutil
+import tempfile
 
 from flexbot import util
 
@@ -12,3 +15,18 @@ class TestUtil(object):
     def test_sleep_minutes_seconds(self, mock_time):
         util.sleep(minutes=3, seconds=30)
         mock_time.sleep.assert_called_with(210)
+
+    def test_replace_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'winners.csv.tmp')
+            destination = os.path.join(directory, 'winners.csv')
+            for filename, contents in [(source, 'new'), (destination, 'old')]:
+                with open(filename, 'w') as f:
+                    f.write(contents)
+            util.replace_file(source, destination)
+            assert not os.path.exists(source)
+            with open(destination, 'r') as f:
+                assert f.read() == 'new'
+        finally:
+            shutil.rmtree(directory)
@@ -1,11 +1,12 @@
 import mock
 
+from flexbot.commands import Command, user_argument
 from flexbot.configurators import InMemoryConfigurationProvider
 from flexbot.constants import Constants
 from flexbot.exercise import Exercise
 from flexbot.manager import UserManager
 from flexbot.util import StatementRenderer
-from flexbot.web import FlexbotWebServer
+from flexbot.web import FlexbotWebServer, MultiChannelWebServer
 
 exercises = [
     Exercise('exercise1', 30, 40, 'reps', 'exercise1 info'),
@@ -126,3 +127,100 @@ class TestWeb(object):
         server = get_server()['server']
         result = server.flex(user_id='UREALUSER', text='testbot notarealmessage')
         assert result == None
+
+    def test_flex_handler_bot_name_only(self):
+        server = get_server()['server']
+        assert server.flex(user_id='UREALUSER', text='testbot') == None
+        assert server.flex(user_id='UREALUSER', text='testbot!') == None
+
+    def test_flex_handler_not_addressed(self):
+        server = get_server()['server']
+        assert server.flex(user_id='UREALUSER', text='hey testbot help') == None
+
+    def test_flex_handler_reload(self):
+        test_server = get_server(enable_acknowledgment=False)
+        server, ack_handler = test_server['server'], test_server['ack_handler']
+        ack_handler.acknowledge_winner.return_value = Constants.ACKNOWLEDGE_SUCCEEDED
+        server.flex(user_id='UREALUSER', text='testbot done')
+        ack_handler.acknowledge_winner.assert_not_called()
+
+        # The configuration file changes, and is only read again on reload
+        server.configuration.configuration.update({'enable_acknowledgment': True,
+            'bot_name': 'flexbot'})
+        server.flex(user_id='UREALUSER', text='testbot reload')
+
+        assert server.flex(user_id='UREALUSER', text='testbot help') == None
+        server.flex(user_id='UREALUSER', text='flexbot done')
+        ack_handler.acknowledge_winner.assert_called_once_with('UREALUSER')
+
+    def test_flex_handler_updated_configuration(self):
+        test_server = get_server(enable_acknowledgment=False)
+        server, ack_handler = test_server['server'], test_server['ack_handler']
+        ack_handler.acknowledge_winner.return_value = Constants.ACKNOWLEDGE_SUCCEEDED
+        server.flex(user_id='UREALUSER', text='testbot help')
+
+        server.configuration.update_configuration({'enable_acknowledgment': True,
+            'bot_name': 'flexbot'})
+
+        assert server.flex(user_id='UREALUSER', text='testbot help') == None
+        server.flex(user_id='UREALUSER', text='flexbot done')
+        ack_handler.acknowledge_winner.assert_called_once_with('UREALUSER')
+
+    def test_register_command(self):
+        server = get_server()['server']
+        server.flex(user_id='UREALUSER', text='testbot help')
+        server.register_command(Command('help', lambda: {'text': 'custom help'}))
+        server.register_command(Command('hello', lambda user_id: {'text': user_id},
+            parser=user_argument))
+        assert server.flex(user_id='UREALUSER', text='testbot help')['text'] == 'custom help'
+        assert server.flex(user_id='UREALUSER', text='testbot hello')['text'] == 'UREALUSER'
+
+class TestAsyncWeb(object):
+    def get_async_server(self, submitted=True):
+        um = mock.Mock(spec=UserManager)
+        api = mock.Mock()
+        executor = mock.Mock()
+        executor.submit.return_value = submitted
+        server = FlexbotWebServer(um, mock.Mock(), get_sample_config(True), api=api,
+                executor=executor)
+        return server, api, executor
+
+    def test_flex_handler_queues_command(self):
+        server, api, executor = self.get_async_server()
+        result = server.flex(user_id='UREALUSER', text='testbot help')
+        assert result is None
+        command = server.router().commands['help']
+        executor.submit.assert_called_once_with('help', server.run_command,
+                server.post_response, command, [], 'UREALUSER')
+        api.post_flex_message.assert_not_called()
+
+    def test_flex_handler_unknown_command(self):
+        server, api, executor = self.get_async_server(submitted=False)
+        result = server.flex(user_id='UREALUSER', text='testbot notarealmessage')
+        assert result == server.cant_parse_message()
+        executor.submit.assert_not_called()
+
+    def test_flex_handler_queue_full(self):
+        server, api, executor = self.get_async_server(submitted=False)
+        result = server.flex(user_id='UREALUSER', text='testbot help')
+        assert result['text'] == server.BUSY_STATEMENT
+
+    def test_post_response(self):
+        server, api, executor = self.get_async_server()
+        server.post_response({'text': 'response'})
+        server.post_response(None)
+        api.post_flex_message.assert_called_once_with('response')
+
+class TestMultiChannelWeb(object):
+    def test_routes_by_channel(self):
+        general = mock.Mock(spec=FlexbotWebServer)
+        engineering = mock.Mock(spec=FlexbotWebServer)
+        server = MultiChannelWebServer([('general', general), ('engineering', engineering)])
+
+        result = server.flex(user_id='UREALUSER', channel_name='engineering', text='testbot help')
+        assert result == engineering.flex.return_value
+        engineering.flex.assert_called_once_with(user_id='UREALUSER',
+                channel_name='engineering', text='testbot help')
+
+        server.flex(user_id='UREALUSER', text='testbot help')
+        general.flex.assert_called_once_with(user_id='UREALUSER', text='testbot help')
@@ -0,0 +1,47 @@
+import threading
+
+from flexbot.workers import CommandExecutor
+
+class TestCommandExecutor(object):
+    def test_runs_command_and_callback(self):
+        executor = CommandExecutor(max_workers=2, queue_size=2)
+        responses = []
+        assert executor.submit('stats', lambda a, b: a + b, responses.append, 1, 2)
+        executor.stop(drain=True)
+        assert responses == [3]
+        assert executor.stats() == {'stats': {'accepted': 1, 'succeeded': 1}}
+        latencies = executor.latency_stats()['stats']
+        assert latencies['total']['count'] == 1
+        assert latencies['run']['count'] == 1
+
+    def test_rejects_when_queue_is_full(self):
+        executor = CommandExecutor(max_workers=1, queue_size=1)
+        release = threading.Event()
+        responses = []
+        try:
+            assert executor.submit('done', release.wait, responses.append)
+            assert executor.submit('done', release.wait, responses.append)
+            assert not executor.submit('done', release.wait, responses.append)
+        finally:
+            release.set()
+            executor.stop(drain=True)
+        assert responses == [True, True]
+        assert executor.stats()['done'] == {'accepted': 2, 'rejected': 1, 'succeeded': 2}
+        # The slots are free again once the commands have been answered
+        assert executor.slots.acquire(False)
+
+    def test_failed_command(self):
+        executor = CommandExecutor()
+        responses = []
+        def fail():
+            raise ValueError()
+        assert executor.submit('todo', fail, responses.append)
+        executor.stop(drain=True)
+        assert responses == []
+        assert executor.stats() == {'todo': {'accepted': 1, 'failed': 1}}
+
+    def test_rejects_after_stop(self):
+        executor = CommandExecutor()
+        executor.stop()
+        assert not executor.submit('help', lambda: None, lambda response: None)
+        assert executor.stats() == {'help': {'rejected': 1}}
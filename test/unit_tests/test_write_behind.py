@@ -0,0 +1,239 @@
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from flexbot.exercise import Exercise
+from flexbot.loggers import InMemoryLogger, SqliteDatabaseLogger
+from flexbot.write_behind import WriteBehindLogger
+
+exercises = [
+    Exercise('pushups', 30, 40, 'reps', ''),
+    Exercise('situps', 30, 40, 'reps', '')
+]
+
+def make_logger(wrapped=None, batch_size=100):
+    # A long flush interval keeps writes queued until the test flushes or closes the logger
+    return WriteBehindLogger(wrapped or InMemoryLogger(), batch_size=batch_size,
+            flush_interval=60)
+
+class TestWriteBehindLogger(object):
+    def test_reads_see_queued_writes(self):
+        logger = make_logger()
+        try:
+            logger.log_exercise('uid1', exercises[0], 30)
+            logger.add_exercise('uid2', exercises[1], 35)
+            assert logger.queue_depth() == 2
+            assert logger.wrapped.get_todays_exercises() == {}
+            assert logger.get_todays_exercises() == {
+                'uid1': [{'exercise': 'pushups', 'reps': 30}]
+            }
+            assert logger.get_todays_totals() == {
+                'uid1': {'pushups': {'count': 1, 'reps': 30}}
+            }
+            assert logger.get_current_winners() == {
+                'uid2': [{'exercise': 'situps', 'reps': 35}]
+            }
+            assert logger.count_for('uid1', exercises[0]) == 1
+            assert logger.pending_for('uid2') == 1
+        finally:
+            logger.close()
+
+    def test_finish_exercise(self):
+        logger = make_logger()
+        try:
+            logger.add_exercise('uid1', exercises[0], 30)
+            logger.add_exercise('uid1', exercises[1], 35)
+            assert logger.finish_exercise('uid1') == {'exercise': 'pushups', 'reps': 30}
+            assert logger.get_current_winners() == {
+                'uid1': [{'exercise': 'situps', 'reps': 35}]
+            }
+            assert logger.finish_exercise('uid1') == {'exercise': 'situps', 'reps': 35}
+            assert logger.finish_exercise('uid1') is None
+            assert logger.pending_for('uid1') == 0
+        finally:
+            logger.close()
+        assert logger.wrapped.get_current_winners() == {}
+
+    def test_flush_batches_writes(self):
+        wrapped = mock.Mock(spec=InMemoryLogger)
+        wrapped.get_todays_exercises.return_value = {}
+        wrapped.get_current_winners.return_value = {}
+        logger = make_logger(wrapped, batch_size=3)
+        logger.log_exercises([('uid1', exercises[0], 30), ('uid2', exercises[0], 30)])
+        logger.add_exercise('uid1', exercises[1], 35)
+        logger.close()
+        wrapped.log_exercises.assert_called_once_with(
+                [('uid1', exercises[0], 30), ('uid2', exercises[0], 30)])
+        wrapped.add_exercises.assert_called_once_with([('uid1', exercises[1], 35)])
+        wrapped.close.assert_called_once_with()
+        stats = logger.flush_stats()
+        assert stats['queue_depth'] == 0
+        assert stats['flushed'] == 3
+
+    def test_failed_flush_keeps_writes(self):
+        wrapped = mock.Mock(spec=InMemoryLogger)
+        wrapped.get_todays_exercises.return_value = {}
+        wrapped.get_current_winners.return_value = {}
+        wrapped.log_exercises.side_effect = [Exception('Database is down'), None]
+        logger = make_logger(wrapped)
+        try:
+            logger.log_exercise('uid1', exercises[0], 30)
+            assert logger.flush() == False
+            assert logger.queue_depth() == 1
+            assert logger.flush() == True
+            assert logger.queue_depth() == 0
+        finally:
+            logger.close()
+
+    def test_failed_flush_requeues_only_failed_writes(self):
+        wrapped = mock.Mock(spec=InMemoryLogger)
+        wrapped.get_todays_exercises.return_value = {}
+        wrapped.get_current_winners.return_value = {}
+        wrapped.add_exercises.side_effect = [Exception('Database is down'), None]
+        logger = make_logger(wrapped)
+        try:
+            logger.log_exercise('uid1', exercises[0], 30)
+            logger.add_exercise('uid1', exercises[1], 35)
+            logger.finish_exercise('uid1')
+            assert logger.flush() == False
+            # The logged exercise was written, so only the later writes are left
+            assert logger.queue_depth() == 2
+            assert logger.flush() == True
+        finally:
+            logger.close()
+        wrapped.log_exercises.assert_called_once_with([('uid1', exercises[0], 30)])
+        assert wrapped.add_exercises.call_count == 2
+        wrapped.finish_exercise.assert_called_once_with('uid1')
+
+    def test_database_errors_keep_writes_queued(self):
+        directory = tempfile.mkdtemp()
+        try:
+            wrapped = SqliteDatabaseLogger(os.path.join(directory, 'flexecution.db'))
+            logger = make_logger(wrapped)
+            try:
+                logger.log_exercise('uid1', exercises[0], 30)
+                with mock.patch.object(wrapped, 'insert_exercise_statement', 'INSERT INTO nope'):
+                    assert logger.flush() == False
+                assert logger.queue_depth() == 1
+                assert logger.flush() == True
+            finally:
+                logger.close()
+            assert wrapped.get_todays_exercises() == {
+                'uid1': [{'exercise': 'pushups', 'reps': 30}]
+            }
+        finally:
+            shutil.rmtree(directory)
+
+    def test_close_drains_queue(self):
+        logger = make_logger()
+        for _ in range(5):
+            logger.log_exercise('uid1', exercises[0], 30)
+        logger.close()
+        assert logger.queue_depth() == 0
+        assert len(logger.wrapped.get_todays_exercises()['uid1']) == 5
+
+    def test_close_gives_up_on_failing_writes(self):
+        wrapped = mock.Mock(spec=InMemoryLogger)
+        wrapped.get_todays_exercises.return_value = {}
+        wrapped.get_current_winners.return_value = {}
+        wrapped.log_exercises.side_effect = Exception('Database is down')
+        logger = WriteBehindLogger(wrapped, flush_interval=0.01, close_timeout=5)
+        logger.log_exercise('uid1', exercises[0], 30)
+        start = time.time()
+        logger.close()
+        assert time.time() - start < 5
+        assert wrapped.log_exercises.call_count == WriteBehindLogger.CLOSE_RETRIES
+        assert logger.queue_depth() == 0
+        wrapped.close.assert_called_once_with()
+
+    def test_close_timeout(self):
+        wrapped = mock.Mock(spec=InMemoryLogger)
+        wrapped.get_todays_exercises.return_value = {}
+        wrapped.get_current_winners.return_value = {}
+        release = threading.Event()
+        wrapped.log_exercises.side_effect = lambda entries: release.wait()
+        logger = WriteBehindLogger(wrapped, flush_interval=0.01, close_timeout=0.1)
+        try:
+            logger.log_exercise('uid1', exercises[0], 30)
+            logger.close()
+            assert logger.worker.is_alive()
+            wrapped.close.assert_called_once_with()
+        finally:
+            release.set()
+
+    def test_reads_do_not_wait_for_flush(self):
+        wrapped = InMemoryLogger()
+        logger = make_logger(wrapped)
+        writing = threading.Event()
+        release = threading.Event()
+        log_exercises = wrapped.log_exercises
+        def slow_log_exercises(entries):
+            writing.set()
+            release.wait()
+            log_exercises(entries)
+        wrapped.log_exercises = slow_log_exercises
+        try:
+            logger.log_exercise('uid1', exercises[0], 30)
+            flusher = threading.Thread(target=logger.flush)
+            flusher.start()
+            assert writing.wait(5)
+            # The write is still queued while the flush is stuck
+            assert logger.get_todays_totals() == {'uid1': {'pushups': {'count': 1, 'reps': 30}}}
+            release.set()
+            flusher.join()
+            assert logger.get_todays_totals() == {'uid1': {'pushups': {'count': 1, 'reps': 30}}}
+        finally:
+            release.set()
+            logger.close()
+
+    def test_read_retried_when_batch_flushed(self):
+        logger = make_logger()
+        reads = []
+        def read():
+            reads.append(True)
+            if len(reads) == 1:
+                # A batch is written while the wrapped logger is read
+                logger.flush()
+            return logger.wrapped.get_todays_exercises()
+        try:
+            logger.log_exercise('uid1', exercises[0], 30)
+            result, operations = logger.read_with_pending(read)
+            assert len(reads) == 2
+            assert result == {'uid1': [{'exercise': 'pushups', 'reps': 30}]}
+            assert operations == []
+        finally:
+            logger.close()
+
+    def test_read_consistent_when_every_attempt_races_a_flush(self):
+        logger = make_logger()
+        get_todays_exercises = logger.wrapped.get_todays_exercises
+        flushers = []
+        def flush_one():
+            # Flushes a batch of one write, without waking the background worker
+            with logger.flush_lock:
+                with logger.condition:
+                    entry = logger.pending[0][1]
+                logger.wrapped.log_exercises([entry])
+                with logger.condition:
+                    logger.pending.popleft()
+                    logger.generation += 1
+        def racing_read():
+            # A batch is taken off the queue between the snapshot of the queue and every read
+            flusher = threading.Thread(target=flush_one)
+            flusher.start()
+            flusher.join(0.2)
+            flushers.append(flusher)
+            return get_todays_exercises()
+        try:
+            for _ in range(3):
+                logger.log_exercise('uid1', exercises[0], 30)
+            logger.wrapped.get_todays_exercises = racing_read
+            assert len(logger.get_todays_exercises()['uid1']) == 3
+            assert len(flushers) == WriteBehindLogger.READ_ATTEMPTS
+        finally:
+            for flusher in flushers:
+                flusher.join(5)
+            logger.close()